@@ -0,0 +1,268 @@
+import random
+from collections import deque
+
+import rdt_trace as trace
+from rdt_metrics import PhaseTimer, addChannelMetrics
+from segment import Segment, segmentPool
+
+
+# #################################################################################################################### #
+# Channel models                                                                                                       #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Channels closer to real links than UnreliableChannel, with the same send()/receive()/processData() interface and     #
+# count* statistics so they can be passed to RDTLayer.setSendChannel()/setReceiveChannel() and rdt_main unchanged.     #
+# LinkChannel has a bounded bandwidth, a propagation delay and a finite FIFO queue with tail drop. Its losses and      #
+# checksum errors come from a loss model: BernoulliLoss (independent, like UnreliableChannel), GilbertElliottLoss      #
+# (correlated bursts) or TraceLoss (replays a recorded loss pattern).                                                  #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Bandwidth is in bytes per iteration and counts the wire size of a segment, header included. A loss model decides     #
+# once per segment that leaves the queue, e.g.                                                                         #
+#     LinkChannel(bandwidth=64, propagationDelay=3, queueCapacity=512, lossModel=GilbertElliottLoss(0.02, 0.3))        #
+# In rdt_main, replace the two UnreliableChannel with e.g.                                                             #
+#     from channel_models import LinkChannel, GilbertElliottLoss                                                       #
+#     clientToServerChannel = LinkChannel(64, 3, 512, GilbertElliottLoss(0.02, 0.3), GilbertElliottLoss(0.02, 0.3))    #
+#     serverToClientChannel = LinkChannel(64, 3, 512, GilbertElliottLoss(0.02, 0.3))                                   #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class BernoulliLoss(object):
+    """Every segment is lost with the same probability, independently of the others"""
+
+    def __init__(self, ratio, rng=random):
+        """
+        :param ratio: probability that a segment is lost
+        :param rng: source of random numbers, random.Random(seed) for a run of its own
+        """
+        self.ratio = ratio
+        self.rng = rng
+
+    def isLost(self):
+        return self.rng.random() < self.ratio
+
+
+class GilbertElliottLoss(object):
+    """
+    Two-state Markov chain: losses are rare in the good state and frequent in the bad one, so they come in bursts.
+    The state changes before each segment.
+    """
+
+    GOOD = 0
+    BAD = 1
+
+    def __init__(self, pGoodToBad, pBadToGood, lossGood=0.0, lossBad=1.0, rng=random):
+        """
+        :param pGoodToBad: probability of moving from the good to the bad state, per segment
+        :param pBadToGood: probability of moving from the bad to the good state, per segment, 1 / mean burst length
+        :param lossGood: loss probability in the good state
+        :param lossBad: loss probability in the bad state
+        :param rng: source of random numbers, random.Random(seed) for a run of its own
+        """
+        self.pGoodToBad = pGoodToBad
+        self.pBadToGood = pBadToGood
+        self.lossGood = lossGood
+        self.lossBad = lossBad
+        self.rng = rng
+        self.state = self.GOOD
+
+    def isLost(self):
+        if self.state == self.GOOD:
+            if self.rng.random() < self.pGoodToBad:
+                self.state = self.BAD
+        elif self.rng.random() < self.pBadToGood:
+            self.state = self.GOOD
+
+        return self.rng.random() < (self.lossBad if self.state == self.BAD else self.lossGood)
+
+    def getMeanLossRatio(self):
+        """Return the long-run loss probability, to compare with a BernoulliLoss of the same average"""
+        if self.pGoodToBad + self.pBadToGood == 0:
+            return self.lossGood
+        timeBad = self.pGoodToBad / (self.pGoodToBad + self.pBadToGood)
+        return timeBad * self.lossBad + (1 - timeBad) * self.lossGood
+
+
+class TraceLoss(object):
+    """Replays a recorded loss pattern, one entry per segment: 1 (or True) is lost, 0 is delivered"""
+
+    def __init__(self, pattern, loop=True):
+        """
+        :param pattern: sequence of loss flags
+        :param loop: start over at the end of the pattern, otherwise nothing is lost after it
+        """
+        self.pattern = [bool(lost) for lost in pattern]
+        self.loop = loop
+        self.position = 0
+
+    @staticmethod
+    def fromFile(path, loop=True):
+        """Read a pattern of 0 and 1 from a text file, whitespace and anything else is ignored"""
+        with open(path) as file:
+            return TraceLoss([char == '1' for char in file.read() if char in '01'], loop)
+
+    def isLost(self):
+        if self.position >= len(self.pattern):
+            if not self.loop or not self.pattern:
+                return False
+            self.position = 0
+        lost = self.pattern[self.position]
+        self.position += 1
+        return lost
+
+
+class LinkChannel(object):
+    """A link with bounded bandwidth, a propagation delay and a finite queue in front of it"""
+
+    def __init__(self, bandwidth=None, propagationDelay=0, queueCapacity=None, lossModel=None, errorModel=None):
+        """
+        :param bandwidth: bytes the link transmits per iteration, None for unlimited
+        :param propagationDelay: iterations between the end of the transmission and the delivery of a segment
+        :param queueCapacity: bytes the queue holds, segments that do not fit are dropped (tail drop), None for
+                              unlimited
+        :param lossModel: decides whether a transmitted segment is lost, None for no losses
+        :param errorModel: decides whether a transmitted data segment gets a checksum error, None for no errors
+        """
+        self.bandwidth = bandwidth
+        self.propagationDelay = propagationDelay
+        self.queueCapacity = queueCapacity
+        self.lossModel = lossModel
+        self.errorModel = errorModel
+
+        self.sendQueue = []                 # Sent by the layer in this iteration
+        self.receiveQueue = []
+        self.queue = deque()                # Waiting for the link, in order
+        self.queuedBytes = 0
+        self.credit = 0                     # Bytes the link can still transmit in this iteration
+        self.delayedPackets = deque()       # (delivery iteration, segment), propagating on the link
+
+        # stats, the same as UnreliableChannel
+        self.countTotalDataPackets = 0
+        self.countSentPackets = 0
+        self.countChecksumErrorPackets = 0
+        self.countDroppedPackets = 0        # Tail drops and losses
+        self.countQueueDrops = 0            # Tail drops only
+        self.countDelayedPackets = 0        # Segments that had to wait in the queue for at least one iteration
+        self.countOutOfOrderPackets = 0     # A FIFO link never reorders
+        self.countAckPackets = 0
+        self.currentIteration = 0
+
+        self.tracer = trace.NULL_TRACER
+        self.phaseTimer = None
+
+    def setTracer(self, tracer):
+        self.tracer = tracer
+
+    def setMetrics(self, registry, labels=None):
+        addChannelMetrics(registry, self, labels)
+        registry.gauge('rdt_channel_queue_bytes', "Bytes waiting in the link queue", labels,
+                       lambda: self.queuedBytes)
+        registry.counter('rdt_channel_queue_drops_total', "Segments dropped because the queue was full", labels,
+                         lambda: self.countQueueDrops)
+        self.phaseTimer = PhaseTimer(registry, labels)
+
+    def send(self, seg):
+        self.sendQueue.append(seg)
+
+    def receive(self):
+        received = self.receiveQueue
+        self.receiveQueue = []
+        return received
+
+    def processData(self):
+        self.currentIteration += 1
+
+        timer = self.phaseTimer
+        if timer is not None:
+            timer.start()
+
+        self.enqueue()
+        if timer is not None:
+            timer.lap('enqueue')
+
+        self.transmit()
+        if timer is not None:
+            timer.lap('transmit')
+
+        self.deliver()
+        if timer is not None:
+            timer.lap('deliver')
+
+    def enqueue(self):
+        """Move the segments sent in this iteration into the queue, dropping those that do not fit"""
+        for seg in self.sendQueue:
+            if seg.acknum == -1:
+                self.countTotalDataPackets += 1
+            else:
+                self.countAckPackets += 1
+
+            size = self.getWireSize(seg)
+            if self.queueCapacity is not None and self.queuedBytes + size > self.queueCapacity:
+                self.countDroppedPackets += 1
+                self.countQueueDrops += 1
+                if self.tracer.debugEnabled:
+                    self.tracer.emit(trace.DEBUG, trace.DROP, self.currentIteration, seg.seqnum, seg.acknum,
+                                     len(seg.payload))
+                segmentPool.release(seg)
+                continue
+
+            self.queue.append((self.currentIteration, size, seg))
+            self.queuedBytes += size
+
+        self.sendQueue.clear()
+
+    def transmit(self):
+        """Send as many queued segments as the bandwidth of this iteration allows"""
+        if self.bandwidth is not None:
+            self.credit += self.bandwidth
+
+        deliveryIteration = self.currentIteration + self.propagationDelay
+        while self.queue:
+            queuedIteration, size, seg = self.queue[0]
+            if self.bandwidth is not None:
+                # A segment larger than the bandwidth collects credit over several iterations
+                if size > self.credit:
+                    break
+                self.credit -= size
+            self.queue.popleft()
+            self.queuedBytes -= size
+
+            if queuedIteration != self.currentIteration:
+                self.countDelayedPackets += 1
+
+            if self.lossModel is not None and self.lossModel.isLost():
+                self.countDroppedPackets += 1
+                if self.tracer.debugEnabled:
+                    self.tracer.emit(trace.DEBUG, trace.DROP, self.currentIteration, seg.seqnum, seg.acknum,
+                                     len(seg.payload))
+                segmentPool.release(seg)
+                continue
+
+            if seg.acknum == -1 and self.errorModel is not None and self.errorModel.isLost():
+                seg.createChecksumError()
+                self.countChecksumErrorPackets += 1
+                if self.tracer.debugEnabled:
+                    self.tracer.emit(trace.DEBUG, trace.CORRUPT, self.currentIteration, seg.seqnum, -1,
+                                     len(seg.payload))
+
+            self.delayedPackets.append((deliveryIteration, seg))
+
+        # An idle link does not save up bandwidth for later
+        if not self.queue:
+            self.credit = 0
+
+    def deliver(self):
+        """Hand the segments whose propagation delay is over to the receiver"""
+        while self.delayedPackets and self.delayedPackets[0][0] <= self.currentIteration:
+            self.receiveQueue.append(self.delayedPackets.popleft()[1])
+            self.countSentPackets += 1
+
+    @staticmethod
+    def getWireSize(seg):
+        """Return the size of a segment on the wire: header and payload"""
+        payload = seg.payload
+        if isinstance(payload, str):
+            payload = payload.encode(Segment.TEXT_ENCODING)
+        return Segment.HEADER.size + len(payload)
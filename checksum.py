@@ -0,0 +1,174 @@
+import random
+import sys
+import time
+import zlib
+from array import array
+
+
+# #################################################################################################################### #
+# Checksum algorithms                                                                                                  #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Selectable checksum algorithms for Segment, all with the same interface: compute(data) takes a bytes-like object     #
+# and returns an unsigned 32-bit integer. Every algorithm works on whole buffers in C (zlib, array, sum over bytes)    #
+# instead of calling Python code for each character.                                                                   #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Use RDTLayer.setChecksumAlgorithm(name) to select one per connection, both ends must use the same algorithm.         #
+# Run this file to compare throughput and corruption detection of the algorithms.                                      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class ChecksumAlgorithm(object):
+    name = None
+
+    def compute(self, data):
+        """
+        :param data: bytes-like object to checksum
+        :return: the checksum as an unsigned 32-bit integer
+        """
+        raise NotImplementedError
+
+
+class SumChecksum(ChecksumAlgorithm):
+    """Plain sum of the bytes, what Segment used to do. Misses reordered bytes and compensating errors."""
+    name = 'sum'
+
+    def compute(self, data):
+        return sum(data) & 0xFFFFFFFF
+
+
+class InternetChecksum(ChecksumAlgorithm):
+    """16-bit ones' complement sum of big-endian words (RFC 1071), as used by IP, TCP and UDP"""
+    name = 'internet'
+
+    def compute(self, data):
+        data = bytes(data)
+        if len(data) % 2:
+            data += b'\0'
+
+        words = array('H', data)
+        if sys.byteorder == 'little':
+            words.byteswap()
+
+        total = sum(words)
+        while total >> 16:
+            total = (total & 0xFFFF) + (total >> 16)
+        return ~total & 0xFFFF
+
+
+class CRC32Checksum(ChecksumAlgorithm):
+    """CRC-32 from zlib, detects all burst errors up to 32 bits"""
+    name = 'crc32'
+
+    def compute(self, data):
+        return zlib.crc32(data)
+
+
+class Adler32Checksum(ChecksumAlgorithm):
+    """Adler-32 from zlib, faster than CRC-32 but weaker on short inputs"""
+    name = 'adler32'
+
+    def compute(self, data):
+        return zlib.adler32(data)
+
+
+ALGORITHMS = {algorithm.name: algorithm for algorithm in
+              (SumChecksum(), InternetChecksum(), CRC32Checksum(), Adler32Checksum())}
+DEFAULT_ALGORITHM = 'crc32'
+
+
+def getAlgorithm(name):
+    """Return the checksum algorithm registered under name"""
+    try:
+        return ALGORITHMS[name]
+    except KeyError:
+        raise ValueError("Unknown checksum algorithm: {0}, expected one of {1}".format(name, sorted(ALGORITHMS)))
+
+
+# #################################################################################################################### #
+# Microbenchmark                                                                                                       #
+# #################################################################################################################### #
+
+
+def swapBytes(payload):
+    """Corruption model: two neighbouring bytes trade places"""
+    if len(payload) < 2:
+        return payload
+    index = random.randrange(len(payload) - 1)
+    return payload[:index] + payload[index + 1:index + 2] + payload[index:index + 1] + payload[index + 2:]
+
+
+def compensatingError(payload):
+    """Corruption model: one byte goes up by one and another goes down by one, the sum does not change"""
+    if len(payload) < 2:
+        return payload
+    corrupted = bytearray(payload)
+    first, second = random.sample(range(len(payload)), 2)
+    if corrupted[first] == 0xFF or corrupted[second] == 0x00:
+        return payload
+    corrupted[first] += 1
+    corrupted[second] -= 1
+    return bytes(corrupted)
+
+
+def measureThroughput(algorithm, size=1 << 20, repeat=20):
+    """Return the throughput of an algorithm in MB/s over a random buffer"""
+    data = random.randbytes(size)
+    start = time.perf_counter()
+    for _ in range(repeat):
+        algorithm.compute(data)
+    elapsed = time.perf_counter() - start
+    return size * repeat / elapsed / 1e6
+
+
+def measureDetection(algorithmName, corrupt, trials=20000, payloadLength=4):
+    """
+    Return the fraction of corrupted segments an algorithm detects
+    :param algorithmName: name of the algorithm to test
+    :param corrupt: 'createChecksumError' to use Segment.createChecksumError(), or a function payload -> payload
+    :param trials: number of segments to corrupt
+    :param payloadLength: payload size of the test segments
+    """
+    from segment import Segment
+
+    algorithm = getAlgorithm(algorithmName)
+    detected = 0
+    corrupted = 0
+    for seqnum in range(trials):
+        segment = Segment()
+        segment.setData(seqnum, bytes(random.choice(b'abcdefghijklmnopqrstuvwxyz .,') for _ in range(payloadLength)),
+                        algorithm=algorithm)
+        original = segment.payload
+
+        if corrupt == 'createChecksumError':
+            segment.createChecksumError()
+        else:
+            segment.payload = corrupt(segment.payload)
+
+        # Some corruptions leave the payload unchanged (e.g. 'X' replaced by 'X'), those are not errors
+        if segment.payload == original:
+            continue
+        corrupted += 1
+        if not segment.checkChecksum(algorithm):
+            detected += 1
+
+    return detected / corrupted if corrupted else 1.0
+
+
+def runBenchmark():
+    random.seed(372)
+    corruptions = (('createChecksumError', 'createChecksumError'), ('swap', swapBytes),
+                   ('compensating', compensatingError))
+
+    print("{0:<10} {1:>12} {2:>20} {3:>10} {4:>14}".format('algorithm', 'MB/s', 'createChecksumError', 'swap',
+                                                           'compensating'))
+    for name, algorithm in ALGORITHMS.items():
+        rates = [measureDetection(name, corrupt) for _, corrupt in corruptions]
+        print("{0:<10} {1:>12.1f} {2:>20.4f} {3:>10.4f} {4:>14.4f}".format(name, measureThroughput(algorithm), *rates))
+
+
+if __name__ == '__main__':
+    runBenchmark()
@@ -0,0 +1,123 @@
+# #################################################################################################################### #
+# Ack policies                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Ack policies decide when the server acknowledges the data segments it receives. Without a policy the server sends    #
+# one ack per segment, with one it reports every segment to the policy and sends a single cumulative ack (the seqnum   #
+# of the last segment received in order) whenever the policy says an ack is due, so a batch of segments costs one ack. #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Segments that arrive out of order, twice or corrupt make the ack due right away, so duplicate acks still reach the   #
+# client and fast retransmit is not delayed. With sack=True the ack also lists the byte ranges the server holds past   #
+# the gap (selective repeat only), see Segment.setAck(). Use RDTLayer.setAckPolicy() on the server to plug one in.     #
+# Selective repeat without a policy still sends one ack per segment, but each is cumulative with SACK ranges.          #
+# In rdt_main, one cumulative ack per iteration with SACK ranges, in selective repeat mode:                            #
+#     from rdt_ack import CoalescingAckPolicy                                                                          #
+#     server.setAckPolicy(CoalescingAckPolicy(sack=True))                                                              #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class AckPolicy(object):
+    """Interface of an ack policy, the methods are called by RDTLayer on the server side"""
+
+    MAX_SACK_RANGES = 4             # Ranges per ack at most, the lowest ones are sent
+
+    def __init__(self, sack=False):
+        """
+        :param sack: add the out-of-order ranges of the receive window to every ack
+        """
+        self.sack = sack
+
+    def onSegment(self, inOrder, iteration):
+        """
+        Called for every data segment that would have been acked on its own
+        :param inOrder: True if the segment extended the in-order data and left no gap behind it
+        :param iteration: current iteration of the server
+        """
+        pass
+
+    def isAckDue(self, iteration):
+        """Called once per iteration after the received segments, return True to send a cumulative ack now"""
+        raise NotImplementedError
+
+    def getDeadline(self):
+        """Return the iteration at which a held back ack is due, or None, for event-driven drivers"""
+        return None
+
+
+class CoalescingAckPolicy(AckPolicy):
+    """One cumulative ack for every iteration in which segments arrived"""
+
+    def __init__(self, sack=False):
+        super(CoalescingAckPolicy, self).__init__(sack)
+        self.pending = False
+
+    def onSegment(self, inOrder, iteration):
+        self.pending = True
+
+    def isAckDue(self, iteration):
+        due = self.pending
+        self.pending = False
+        return due
+
+
+class DelayedAckPolicy(AckPolicy):
+    """Holds the ack of in-order segments back until maxSegments of them arrived or maxDelay iterations passed"""
+
+    def __init__(self, maxDelay=2, maxSegments=2, sack=False):
+        """
+        :param maxDelay: iterations an in-order segment waits for its ack at most
+        :param maxSegments: in-order segments that are acked together at most
+        """
+        super(DelayedAckPolicy, self).__init__(sack)
+        self.maxDelay = maxDelay
+        self.maxSegments = maxSegments
+        self.countHeldBack = 0
+        self.firstIteration = None      # Iteration of the oldest segment whose ack is held back
+        self.immediate = False
+
+    def onSegment(self, inOrder, iteration):
+        if not inOrder:
+            self.immediate = True
+            return
+        self.countHeldBack += 1
+        if self.firstIteration is None:
+            self.firstIteration = iteration
+
+    def isAckDue(self, iteration):
+        if not self.immediate and self.countHeldBack < self.maxSegments and \
+                (self.firstIteration is None or iteration - self.firstIteration < self.maxDelay):
+            return False
+
+        # The ack covers everything received so far, held back or not
+        due = self.immediate or self.countHeldBack > 0
+        self.immediate = False
+        self.countHeldBack = 0
+        self.firstIteration = None
+        return due
+
+    def getDeadline(self):
+        if self.firstIteration is None:
+            return None
+        return self.firstIteration + self.maxDelay
+
+
+# Policies by name, each call creates a new one: a policy keeps the state of one server
+POLICIES = {
+    'coalesce': CoalescingAckPolicy,
+    'coalesce-sack': lambda: CoalescingAckPolicy(sack=True),
+    'delayed': DelayedAckPolicy,
+    'delayed-sack': lambda: DelayedAckPolicy(sack=True),
+}
+
+
+def createPolicy(name):
+    """Return a new ack policy registered under name, or None (one ack per segment) for None"""
+    if name is None:
+        return None
+    try:
+        return POLICIES[name]()
+    except KeyError:
+        raise ValueError("Unknown ack policy: {0}, expected one of {1}".format(name, sorted(POLICIES)))
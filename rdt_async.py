@@ -0,0 +1,258 @@
+import asyncio
+import random
+import time
+
+import rdt_trace as trace
+from rdt_layer import RDTLayer
+from unreliable import UnreliableChannel
+
+
+# #################################################################################################################### #
+# Asyncio engine                                                                                                       #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs RDTLayer connections as coroutines on one event loop instead of the lockstep loop of rdt_main. Each layer       #
+# sleeps until a segment arrives for it or its earliest retransmission timer expires, both are call_later() callbacks  #
+# on the loop, so an idle connection costs nothing and thousands of transfers can share a process.                     #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The layers still count time in iterations: the engine's clock turns loop time into iterations of tick seconds and    #
+# passes them to RDTLayer.processData(iteration). rdt_main and the iteration-driven tools are unchanged.               #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class AsyncChannel(UnreliableChannel):
+    """
+    UnreliableChannel on an event loop: the impairments are those of UnreliableChannel, but each segment is delivered
+    after a latency and delivery wakes the receiving endpoint, there is no processData() loop to run.
+    """
+
+    def __init__(self, loop, latency, tick, canDeliverOutOfOrder=True, canDropPackets=True, canDelayPackets=True,
+                 canHaveChecksumErrors=True, rng=random):
+        """
+        :param loop: event loop the deliveries are scheduled on
+        :param latency: seconds from send() to delivery
+        :param tick: seconds per iteration, a delayed segment arrives sampleDelay() iterations late
+        :param rng: source of random numbers, random.Random(seed) for a run of its own
+        """
+        super().__init__(canDeliverOutOfOrder, canDropPackets, canDelayPackets, canHaveChecksumErrors)
+        self.loop = loop
+        self.latency = latency
+        self.tick = tick
+        self.rng = rng
+        self.receiver = None            # AsyncEndpoint woken up by deliveries
+        self.flushHandle = None         # Pending flushSendQueue() callback
+
+    def send(self, seg):
+        # The segments a layer sends in one processData() are impaired together, like the send queue of an iteration
+        self.sendQueue.append(seg)
+        if self.flushHandle is None:
+            self.flushHandle = self.loop.call_soon(self.flushSendQueue)
+
+    def flushSendQueue(self):
+        self.flushHandle = None
+        self.reorderSendQueue()
+        self.impairSendQueue()
+        self.sendQueue.clear()
+
+    def forwardPacket(self, seg):
+        self.loop.call_later(self.latency, self.deliver, seg)
+
+    def delayPacket(self, seg):
+        self.countDelayedPackets += 1
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.DELAY, self.currentIteration, seg.seqnum, seg.acknum, len(seg.payload))
+        self.loop.call_later(self.latency + self.sampleDelay() * self.tick, self.deliver, seg)
+
+    def corruptPacket(self, seg, position=None):
+        if position is None and seg.payload:
+            position = self.rng.randrange(len(seg.payload))
+        super().corruptPacket(seg, position)
+
+    def deliver(self, seg):
+        self.countSentPackets += 1
+        self.receiveQueue.append(seg)
+        if self.receiver is not None:
+            self.receiver.wake()
+
+    def receive(self):
+        received = self.receiveQueue
+        self.receiveQueue = []
+        return received
+
+    def processData(self):
+        """Deliveries are driven by the event loop, nothing to do"""
+
+
+class AsyncEndpoint(object):
+    """Runs one RDTLayer whenever a segment arrives for it or one of its retransmission timers expires"""
+
+    def __init__(self, engine, layer):
+        self.engine = engine
+        self.layer = layer
+        self.event = asyncio.Event()
+        self.timerHandle = None
+        self.timerIteration = None
+        self.countWakeups = 0
+
+    def wake(self):
+        self.event.set()
+
+    async def run(self, isDone):
+        """
+        Process the layer until isDone() returns True
+        :param isDone: function without arguments checked after every processData()
+        """
+        self.event.set()                # The client sends its first window right away
+        while True:
+            await self.event.wait()
+            self.event.clear()
+            self.countWakeups += 1
+
+            self.layer.processData(self.engine.getIteration())
+            if isDone():
+                break
+            self.armTimer()
+
+        if self.timerHandle is not None:
+            self.timerHandle.cancel()
+
+    def armTimer(self):
+        """Schedule a wake-up for the earliest retransmission timer of the layer, if it changed"""
+        expiry = self.layer.getNextTimeout()
+        if expiry == self.timerIteration:
+            return
+
+        if self.timerHandle is not None:
+            self.timerHandle.cancel()
+            self.timerHandle = None
+        self.timerIteration = expiry
+        if expiry is not None:
+            self.timerHandle = self.engine.loop.call_at(self.engine.getIterationTime(expiry), self.wake)
+
+
+class AsyncConnection(object):
+    __slots__ = ('connectionId', 'client', 'server', 'clientToServerChannel', 'serverToClientChannel',
+                 'clientEndpoint', 'serverEndpoint', 'complete', 'seconds')
+
+    def __init__(self, connectionId, client, server, clientToServerChannel, serverToClientChannel, clientEndpoint,
+                 serverEndpoint):
+        self.connectionId = connectionId
+        self.client = client
+        self.server = server
+        self.clientToServerChannel = clientToServerChannel
+        self.serverToClientChannel = serverToClientChannel
+        self.clientEndpoint = clientEndpoint
+        self.serverEndpoint = serverEndpoint
+        self.complete = False
+        self.seconds = None
+
+    async def run(self):
+        startTime = time.perf_counter()
+        expectedLength = self.client.getDataToSendLength()
+
+        # The server keeps answering retransmissions until the client has every ack, even after it has all the data
+        serverTask = asyncio.ensure_future(self.serverEndpoint.run(lambda: False))
+        try:
+            await self.clientEndpoint.run(self.client.isSendComplete)
+        finally:
+            serverTask.cancel()
+
+        self.complete = self.server.isComplete(expectedLength)
+        self.seconds = time.perf_counter() - startTime
+
+
+class AsyncEngine(object):
+
+    def __init__(self, tick=0.005, latency=0.005, transferMode=RDTLayer.SELECTIVE_REPEAT,
+                 channelFlags=(True, True, True, True), rng=random):
+        """
+        :param tick: seconds per iteration of the layers' clock
+        :param latency: one-way delay of the channels in seconds
+        :param transferMode: RDTLayer.GO_BACK_N or RDTLayer.SELECTIVE_REPEAT, used on both sides of every connection
+        :param channelFlags: (outOfOrder, dropPackets, delayPackets, dataErrors) for every AsyncChannel created
+        :param rng: source of the channels' random numbers
+        """
+        self.tick = tick
+        self.latency = latency
+        self.transferMode = transferMode
+        self.channelFlags = channelFlags
+        self.rng = rng
+        self.loop = None
+        self.startTime = 0.0
+        self.pending = []               # Data of connections added before run()
+        self.connections = []
+
+    def getIteration(self):
+        """Return the current iteration of the layers' clock, the first one is 1"""
+        return int((self.loop.time() - self.startTime) / self.tick) + 1
+
+    def getIterationTime(self, iteration):
+        """Return the loop time at which an iteration starts"""
+        return self.startTime + (iteration - 1) * self.tick
+
+    def addConnection(self, dataToSend):
+        self.pending.append(dataToSend)
+
+    def createConnection(self, dataToSend):
+        client = RDTLayer()
+        server = RDTLayer()
+        client.setTransferMode(self.transferMode)
+        server.setTransferMode(self.transferMode)
+
+        clientToServerChannel = AsyncChannel(self.loop, self.latency, self.tick, *self.channelFlags, rng=self.rng)
+        serverToClientChannel = AsyncChannel(self.loop, self.latency, self.tick, *self.channelFlags, rng=self.rng)
+        client.setSendChannel(clientToServerChannel)
+        client.setReceiveChannel(serverToClientChannel)
+        server.setSendChannel(serverToClientChannel)
+        server.setReceiveChannel(clientToServerChannel)
+        client.setDataToSend(dataToSend)
+
+        clientEndpoint = AsyncEndpoint(self, client)
+        serverEndpoint = AsyncEndpoint(self, server)
+        serverToClientChannel.receiver = clientEndpoint
+        clientToServerChannel.receiver = serverEndpoint
+
+        connection = AsyncConnection(len(self.connections), client, server, clientToServerChannel,
+                                     serverToClientChannel, clientEndpoint, serverEndpoint)
+        self.connections.append(connection)
+        return connection
+
+    async def runAsync(self):
+        """Run every added connection to completion on the running loop and return a report"""
+        self.loop = asyncio.get_running_loop()
+        self.startTime = self.loop.time()
+        connections = [self.createConnection(data) for data in self.pending]
+        self.pending = []
+
+        startTime = time.perf_counter()
+        await asyncio.gather(*(connection.run() for connection in connections))
+        return self.getReport(time.perf_counter() - startTime)
+
+    def run(self):
+        return asyncio.run(self.runAsync())
+
+    def getReport(self, elapsed):
+        completed = [connection for connection in self.connections if connection.complete]
+        bytesDelivered = sum(connection.client.getDataToSendLength() for connection in completed)
+        wakeups = sum(connection.clientEndpoint.countWakeups + connection.serverEndpoint.countWakeups
+                      for connection in self.connections)
+        return {
+            'connections': len(self.connections),
+            'completed': len(completed),
+            'seconds': elapsed,
+            'bytesDelivered': bytesDelivered,
+            'bytesPerSecond': bytesDelivered / elapsed if elapsed else 0.0,
+            'meanSecondsPerConnection':
+                sum(connection.seconds for connection in completed) / len(completed) if completed else 0.0,
+            'wakeups': wakeups,
+        }
+
+
+if __name__ == '__main__':
+    engine = AsyncEngine()
+    for connectionId in range(1000):
+        engine.addConnection("Connection {0}: We choose to go to the moon in this decade. ".format(connectionId) * 4)
+    print(engine.run())
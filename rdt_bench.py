@@ -0,0 +1,342 @@
+import argparse
+import csv
+import itertools
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import rdt_ack
+import rdt_compress
+import rdt_congestion
+from rdt_layer import RDTLayer
+from rdt_fec import FecEncoder
+from rdt_segmenter import AdaptiveSegmentSizer
+from unreliable import UnreliableChannel, BatchedUnreliableChannel
+
+
+# #################################################################################################################### #
+# Benchmark harness                                                                                                    #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Headless, reproducible runs of a client/server pair over two UnreliableChannels. Every scenario is seeded and fixes  #
+# the payload size, the channel impairment ratios, DATA_LENGTH, FLOW_CONTROL_WIN_SIZE and the transfer mode. For each  #
+# scenario the harness reports iterations to completion, goodput, retransmission overhead, wall-clock time and         #
+# (optionally) peak memory, and writes the results as JSON and/or CSV to compare versions of RDTLayer.                 #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# python rdt_bench.py --suite quick --json results.json --csv results.csv                                              #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+# Channel impairment profiles: (dropped, delayed, data error, out of order) ratios
+IMPAIRMENT_PROFILES = {
+    'clean': (0.0, 0.0, 0.0, 0.0),
+    'light': (0.01, 0.01, 0.01, 0.01),
+    'default': (UnreliableChannel.RATIO_DROPPED_PACKETS, UnreliableChannel.RATIO_DELAYED_PACKETS,
+                UnreliableChannel.RATIO_DATA_ERROR_PACKETS, UnreliableChannel.RATIO_OUT_OF_ORDER_PACKETS),
+    'heavy': (0.2, 0.2, 0.2, 0.2),
+}
+
+KB = 1000
+MB = 1000 * KB
+
+WORDS = ('the', 'moon', 'we', 'choose', 'to', 'go', 'in', 'this', 'decade', 'and', 'do', 'other', 'things', 'not',
+         'because', 'they', 'are', 'easy', 'but', 'hard', 'that', 'goal', 'will', 'serve', 'organize', 'measure',
+         'best', 'of', 'our', 'energies', 'skills', 'challenge', 'is', 'one', 'willing', 'accept', 'rocket', 'metal',
+         'heat', 'watch', 'guidance', 'control', 'communications', 'food', 'survival', 'mission', 'earth', 'sun')
+
+
+class Scenario(object):
+    FIELDS = ('name', 'payloadSize', 'seed', 'impairment', 'dataLength', 'flowControlWinSize', 'transferMode',
+              'maxIterations', 'batched', 'ratios', 'ackPolicy', 'adaptiveSegments', 'compression', 'compressionLevel',
+              'fec', 'adaptiveFec', 'congestion')
+
+    def __init__(self, name, payloadSize, seed=0, impairment='default', dataLength=RDTLayer.DATA_LENGTH,
+                 flowControlWinSize=RDTLayer.FLOW_CONTROL_WIN_SIZE, transferMode=RDTLayer.SELECTIVE_REPEAT,
+                 maxIterations=None, batched=False, ratios=None, ackPolicy=None, adaptiveSegments=None,
+                 compression=None, compressionLevel=None, fec=None, adaptiveFec=None, congestion=None):
+        """
+        :param name: label of the scenario in the results
+        :param payloadSize: bytes sent from client to server
+        :param seed: seed of the payload and of the channel's random decisions
+        :param impairment: key of IMPAIRMENT_PROFILES, or only a label when ratios are given
+        :param dataLength: DATA_LENGTH of both layers
+        :param flowControlWinSize: FLOW_CONTROL_WIN_SIZE of both layers
+        :param transferMode: RDTLayer.GO_BACK_N or RDTLayer.SELECTIVE_REPEAT
+        :param maxIterations: give up after this many iterations, default scales with the number of segments
+        :param batched: use BatchedUnreliableChannel (needs NumPy), seeded from seed
+        :param ratios: (dropped, delayed, data error, out of order) ratios of this run's channels, instead of the ones
+                       of the impairment profile
+        :param ackPolicy: name of the server's ack policy in rdt_ack.POLICIES, None for one ack per segment
+        :param adaptiveSegments: True to size segments with an AdaptiveSegmentSizer between dataLength and
+                                 flowControlWinSize, None for the fixed pattern of RDTLayer.calculatePacketSizes()
+        :param compression: codec in rdt_compress.CODECS the client compresses the payload with, None for none
+        :param compressionLevel: level of the codec, None for its default
+        :param fec: data segments per parity segment of the client's FecEncoder (selective repeat), None for no FEC
+        :param adaptiveFec: True to adapt the FEC block size to the observed loss, starting at fec
+        :param congestion: name of the client's congestion controller in rdt_congestion.CONTROLLERS, None for the
+                           default fixed window
+        """
+        if ratios is None and impairment not in IMPAIRMENT_PROFILES:
+            raise ValueError("Unknown impairment profile: {0}".format(impairment))
+
+        self.name = name
+        self.payloadSize = payloadSize
+        self.seed = seed
+        self.impairment = impairment
+        self.dataLength = dataLength
+        self.flowControlWinSize = flowControlWinSize
+        self.transferMode = transferMode
+        if maxIterations is None:
+            maxIterations = max(10000, 200 * payloadSize // dataLength)
+        self.maxIterations = maxIterations
+        self.batched = batched
+        self.ratios = tuple(ratios) if ratios is not None else None
+        self.ackPolicy = ackPolicy
+        self.adaptiveSegments = adaptiveSegments
+        self.compression = compression
+        self.compressionLevel = compressionLevel
+        self.fec = fec
+        self.adaptiveFec = adaptiveFec
+        self.congestion = congestion
+
+    def toDict(self):
+        return {field: getattr(self, field) for field in Scenario.FIELDS}
+
+    def getRatios(self):
+        """Return the (dropped, delayed, data error, out of order) ratios of the channels of this scenario"""
+        if self.ratios is not None:
+            return self.ratios
+        return IMPAIRMENT_PROFILES[self.impairment]
+
+    @staticmethod
+    def fromDict(values):
+        return Scenario(**{field: values[field] for field in Scenario.FIELDS if field in values})
+
+
+def makePayload(size, seed):
+    """Return size bytes of seeded pseudo-English text"""
+    rng = random.Random(seed)
+    # Words average about 6 bytes with the separator
+    text = ' '.join(rng.choices(WORDS, k=size // 4 + 1)).encode('ascii')
+    return text[:size]
+
+
+def createLayer(dataLength, flowControlWinSize, adaptiveSegments=False):
+    """
+    Return an RDTLayer with the given segment length and receive window
+    :param adaptiveSegments: size the segments with an AdaptiveSegmentSizer that starts at dataLength
+    """
+    layer = RDTLayer()
+    layer.setDataLength(dataLength)
+    layer.setFlowControlWinSize(flowControlWinSize)
+    if adaptiveSegments:
+        layer.setSegmentSizer(AdaptiveSegmentSizer(dataLength, flowControlWinSize))
+    return layer
+
+
+def createChannel(impairment, batchedSeed=None):
+    """
+    Return an UnreliableChannel with the ratios of an impairment profile, impairments with ratio 0 are disabled
+    :param impairment: key of IMPAIRMENT_PROFILES, or a (dropped, delayed, data error, out of order) tuple
+    :param batchedSeed: create a BatchedUnreliableChannel with this seed instead
+    """
+    if isinstance(impairment, str):
+        impairment = IMPAIRMENT_PROFILES[impairment]
+    dropped, delayed, dataErrors, outOfOrder = impairment
+    flags = (outOfOrder > 0, dropped > 0, delayed > 0, dataErrors > 0)
+    if batchedSeed is None:
+        channel = UnreliableChannel(*flags)
+    else:
+        channel = BatchedUnreliableChannel(*flags, seed=batchedSeed)
+    channel.RATIO_DROPPED_PACKETS = dropped
+    channel.RATIO_DELAYED_PACKETS = delayed
+    channel.RATIO_DATA_ERROR_PACKETS = dataErrors
+    channel.RATIO_OUT_OF_ORDER_PACKETS = outOfOrder
+    return channel
+
+
+def runScenario(scenario, measureMemory=False):
+    """
+    Run one scenario to completion (or maxIterations)
+    :param scenario: the Scenario to run
+    :param measureMemory: trace allocations to report peak memory, this slows the run down
+    :return: a dictionary with the scenario fields and its results
+    """
+    data = makePayload(scenario.payloadSize, scenario.seed)
+
+    # The channels and Segment.createChecksumError() draw from the random module
+    random.seed(scenario.seed)
+
+    client = createLayer(scenario.dataLength, scenario.flowControlWinSize, scenario.adaptiveSegments)
+    server = createLayer(scenario.dataLength, scenario.flowControlWinSize)
+    client.setTransferMode(scenario.transferMode)
+    server.setTransferMode(scenario.transferMode)
+    server.setAckPolicy(rdt_ack.createPolicy(scenario.ackPolicy))
+    client.setCongestionController(rdt_congestion.createController(scenario.congestion))
+    client.setCompression(scenario.compression, scenario.compressionLevel)
+    if scenario.fec is not None:
+        client.setFec(FecEncoder(scenario.fec, adaptive=bool(scenario.adaptiveFec)))
+
+    ratios = scenario.getRatios()
+    if scenario.batched:
+        clientToServerChannel = createChannel(ratios, [scenario.seed, 0])
+        serverToClientChannel = createChannel(ratios, [scenario.seed, 1])
+    else:
+        clientToServerChannel = createChannel(ratios)
+        serverToClientChannel = createChannel(ratios)
+    client.setSendChannel(clientToServerChannel)
+    client.setReceiveChannel(serverToClientChannel)
+    server.setSendChannel(serverToClientChannel)
+    server.setReceiveChannel(clientToServerChannel)
+    client.setDataToSend(data)
+
+    if measureMemory:
+        tracemalloc.start()
+
+    iterations = 0
+    completed = False
+    startTime = time.perf_counter()
+
+    while iterations < scenario.maxIterations:
+        iterations += 1
+        client.processData()
+        clientToServerChannel.processData()
+        server.processData()
+        serverToClientChannel.processData()
+
+        if server.isComplete(len(data)):
+            completed = True
+            break
+
+    elapsed = time.perf_counter() - startTime
+
+    peakMemory = None
+    if measureMemory:
+        _, peakMemory = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    segments = client.segmenter.countSegments
+    dataPackets = clientToServerChannel.countTotalDataPackets
+    result = scenario.toDict()
+    result.update({
+        'completed': completed,
+        'verified': completed and server.getBytesReceived() == data,
+        'iterations': iterations,
+        'seconds': elapsed,
+        'goodputBytesPerIteration': server.getDataReceivedLength() / iterations,
+        'goodputBytesPerSecond': server.getDataReceivedLength() / elapsed if elapsed else 0.0,
+        'segments': segments,
+        'dataPacketsSent': dataPackets,
+        'retransmissionOverhead': (dataPackets - segments) / segments if segments else 0.0,
+        'segmentTimeouts': client.countSegmentTimeouts,
+        'ackPacketsSent': serverToClientChannel.countAckPackets,
+        'paritySegments': client.fecEncoder.countParitySegments if client.fecEncoder is not None else 0,
+        'recoveredSegments': server.fecDecoder.countRecovered if server.fecDecoder is not None else 0,
+        'peakMemoryBytes': peakMemory,
+    })
+    return result
+
+
+def buildSuite(name, sizes=None, seeds=(0,), batched=False, ackPolicy=None, adaptiveSegments=None, compression=None,
+               compressionLevel=None, fec=None, adaptiveFec=None, congestion=None):
+    """
+    Return the scenarios of a named suite
+    :param name: 'quick' or 'full'
+    :param sizes: payload sizes overriding the ones of the suite
+    :param seeds: seeds every scenario is run with
+    :param batched: run the scenarios over BatchedUnreliableChannels
+    :param ackPolicy: name of the server's ack policy, see rdt_ack.POLICIES
+    :param adaptiveSegments: size the client's segments with an AdaptiveSegmentSizer
+    :param compression: codec the client compresses the payload with, see rdt_compress.CODECS
+    :param compressionLevel: level of the codec, None for its default
+    :param fec: data segments per parity segment, None for no FEC
+    :param adaptiveFec: adapt the FEC block size to the observed loss
+    :param congestion: name of the client's congestion controller, see rdt_congestion.CONTROLLERS
+    """
+    if name == 'quick':
+        defaultSizes = (1 * KB, 10 * KB)
+        impairments = ('clean', 'default')
+        segmentParameters = ((4, 15), (64, 1024))
+    elif name == 'full':
+        defaultSizes = (1 * KB, 10 * KB, 100 * KB, 1 * MB, 10 * MB, 100 * MB)
+        impairments = tuple(IMPAIRMENT_PROFILES)
+        segmentParameters = ((4, 15), (64, 1024), (1024, 65536))
+    else:
+        raise ValueError("Unknown suite: {0}".format(name))
+
+    scenarios = []
+    for size, impairment, (dataLength, flowControlWinSize), seed in itertools.product(
+            sizes or defaultSizes, impairments, segmentParameters, seeds):
+        scenarioName = "{0}B-{1}-d{2}-w{3}-s{4}".format(size, impairment, dataLength, flowControlWinSize, seed)
+        scenarios.append(Scenario(scenarioName, size, seed, impairment, dataLength, flowControlWinSize,
+                                  batched=batched, ackPolicy=ackPolicy, adaptiveSegments=adaptiveSegments,
+                                  compression=compression, compressionLevel=compressionLevel, fec=fec,
+                                  adaptiveFec=adaptiveFec, congestion=congestion))
+    return scenarios
+
+
+def writeJson(results, path):
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2)
+
+
+def writeCsv(results, path):
+    if not results:
+        return
+    with open(path, 'w', newline='') as file:
+        writer = csv.DictWriter(file, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run seeded RDTLayer benchmark scenarios")
+    parser.add_argument('--suite', default='quick', choices=('quick', 'full'))
+    parser.add_argument('--sizes', type=int, nargs='+', help="payload sizes in bytes, overrides the suite")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0])
+    parser.add_argument('--memory', action='store_true', help="trace peak memory (slower)")
+    parser.add_argument('--batched', action='store_true', help="draw channel impairments in batches (needs NumPy)")
+    parser.add_argument('--ack-policy', choices=sorted(rdt_ack.POLICIES),
+                        help="server ack policy, default one ack per segment")
+    parser.add_argument('--adaptive-segments', action='store_const', const=True,
+                        help="grow the segments on clean links and shrink them after checksum errors")
+    parser.add_argument('--compression', choices=sorted(rdt_compress.CODECS),
+                        help="compress the payload before segmentation, default none")
+    parser.add_argument('--compression-level', type=int, help="level of the codec, default its own default")
+    parser.add_argument('--fec', type=int, metavar='K', help="send an XOR parity segment for every K data segments")
+    parser.add_argument('--adaptive-fec', action='store_const', const=True,
+                        help="adapt K to the observed loss, starting at --fec")
+    parser.add_argument('--congestion', choices=sorted(rdt_congestion.CONTROLLERS),
+                        help="client congestion controller, default a fixed window")
+    parser.add_argument('--json', help="write the results to this JSON file")
+    parser.add_argument('--csv', help="write the results to this CSV file")
+    args = parser.parse_args(argv)
+
+    results = []
+    for scenario in buildSuite(args.suite, args.sizes, args.seeds, args.batched, args.ack_policy,
+                               args.adaptive_segments, args.compression, args.compression_level, args.fec,
+                               args.adaptive_fec, args.congestion):
+        result = runScenario(scenario, args.memory)
+        results.append(result)
+        print("{0:<40} iterations={1:<8} goodput={2:>10.1f} B/it overhead={3:>6.2f} segments={4:<8} acks={5:<8} "
+              "{6:>8.2f}s{7}".format(
+                  result['name'], result['iterations'], result['goodputBytesPerIteration'],
+                  result['retransmissionOverhead'], result['segments'], result['ackPacketsSent'], result['seconds'],
+                  '' if result['verified'] else '  FAILED'))
+        sys.stdout.flush()
+
+    if args.json:
+        writeJson(results, args.json)
+    if args.csv:
+        writeCsv(results, args.csv)
+
+    return results
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import codecs
+import lzma
+import zlib
+
+
+# #################################################################################################################### #
+# Payload compression                                                                                                  #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Optional compression stage between the data of the client and its segmentation. CompressedSource compresses the      #
+# data incrementally as the stream segmenter reads it, so the first segments leave before the rest of the input has    #
+# been compressed, and the server feeds the in-order bytes to a DecompressingSink as they arrive. Seqnums, acks and    #
+# the receive window all count compressed bytes, compression only shrinks the number of segments to send.              #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The client selects a codec with RDTLayer.setCompression(name, level) and marks every data segment with its id (see   #
+# Segment.FLAG_CODEC_MASK). There is no handshake in this protocol: the server learns the codec from the first valid   #
+# data segment and decompresses with it, an unknown id fails loudly instead of delivering garbage.                     #
+# In rdt_main, before client.setDataToSend():                                                                          #
+#     client.setCompression('zlib', 9)                                                                                 #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class Codec(object):
+    """Interface of a codec, codecId is the value carried in the segment flags (1 to 3)"""
+    codecId = None
+    name = None
+    DEFAULT_LEVEL = None
+
+    def createCompressor(self, level):
+        """
+        :param level: compression level, None for DEFAULT_LEVEL
+        :return: object with compress(data) and flush() like zlib.compressobj()
+        """
+        raise NotImplementedError
+
+    def createDecompressor(self):
+        """Return an object with decompress(data) like zlib.decompressobj()"""
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    """Deflate, fast with a moderate ratio, levels 0 (store) to 9"""
+    codecId = 1
+    name = 'zlib'
+    DEFAULT_LEVEL = 6
+
+    def createCompressor(self, level):
+        return zlib.compressobj(self.DEFAULT_LEVEL if level is None else level)
+
+    def createDecompressor(self):
+        return zlib.decompressobj()
+
+
+class LzmaCodec(Codec):
+    """LZMA (xz container), slower with a better ratio, presets 0 to 9"""
+    codecId = 2
+    name = 'lzma'
+    DEFAULT_LEVEL = 6
+
+    def createCompressor(self, level):
+        return lzma.LZMACompressor(preset=self.DEFAULT_LEVEL if level is None else level)
+
+    def createDecompressor(self):
+        return lzma.LZMADecompressor()
+
+
+CODECS = {codec.name: codec for codec in (ZlibCodec(), LzmaCodec())}
+CODECS_BY_ID = {codec.codecId: codec for codec in CODECS.values()}
+
+
+def getCodec(name):
+    try:
+        return CODECS[name]
+    except KeyError:
+        raise ValueError("Unknown codec: {0}, expected one of {1}".format(name, sorted(CODECS)))
+
+
+def getCodecById(codecId):
+    try:
+        return CODECS_BY_ID[codecId]
+    except KeyError:
+        raise ValueError("Unknown codec id: {0}, expected one of {1}".format(codecId, sorted(CODECS_BY_ID)))
+
+
+class CompressedSource(object):
+    """Source for StreamSegmentationEngine that compresses another source, see rdt_stream.py"""
+
+    READ_SIZE = 16 * 1024           # Uncompressed bytes read from the source at a time
+
+    def __init__(self, source, codec, level=None):
+        """
+        :param source: uncompressed source with read(size), see rdt_stream.openSource()
+        :param codec: Codec to compress with
+        :param level: compression level, None for the default of the codec
+        """
+        self.source = source
+        self.compressor = codec.createCompressor(level)
+        self.pending = bytearray()  # Compressed bytes not read yet
+        self.finished = False       # The source is exhausted and the compressor flushed
+        self.countRead = 0          # Uncompressed bytes read from the source
+        self.countCompressed = 0    # Compressed bytes produced
+
+    def read(self, size):
+        # The compressor holds data back until it has enough to emit, keep feeding it until the request is covered
+        while len(self.pending) < size and not self.finished:
+            chunk = self.source.read(self.READ_SIZE)
+            if chunk:
+                self.countRead += len(chunk)
+                output = self.compressor.compress(chunk)
+            else:
+                output = self.compressor.flush()
+                self.finished = True
+            self.countCompressed += len(output)
+            self.pending += output
+
+        chunk = bytes(self.pending[:size])
+        del self.pending[:size]
+        return chunk
+
+
+class DecompressingSink(object):
+    """
+    Receive side of the compression stage: decompresses the in-order bytes handed to write() and passes them on to
+    the sink of main, or keeps them when there is none
+    """
+
+    ENCODING = 'utf-8'
+
+    def __init__(self, codec, sink=None):
+        """
+        :param codec: Codec the stream was compressed with
+        :param sink: function that receives the decompressed bytes, None keeps them for getBytes()/getText()
+        """
+        self.codec = codec
+        self.decompressor = codec.createDecompressor()
+        self.sink = sink
+        self.output = bytearray()
+        self.countDecompressed = 0  # Decompressed bytes produced so far, passed on or kept
+
+    def write(self, data):
+        """
+        :param data: next compressed bytes of the stream, in order
+        """
+        output = self.decompressor.decompress(data)
+        if not output:
+            return
+        self.countDecompressed += len(output)
+        if self.sink is not None:
+            self.sink(output)
+        else:
+            self.output += output
+
+    def getBytes(self):
+        """Return a copy of the decompressed data that has not gone to the sink"""
+        return bytes(self.output)
+
+    def getText(self):
+        """Return the decompressed data as a string, a character that is not complete yet is left out"""
+        decoder = codecs.getincrementaldecoder(self.ENCODING)()
+        return decoder.decode(self.output, final=False)
@@ -0,0 +1,107 @@
+# #################################################################################################################### #
+# Congestion control                                                                                                   #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Congestion controllers decide how many segments the client may have in flight (cwnd). RDTLayer asks the controller   #
+# for the window and reports new acks, duplicate acks and timeouts back to it. The effective window is the smaller of  #
+# cwnd and the receive window the server advertises, see RDTLayer.setFlowControlWinSize().                             #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Windows are counted in segments. The default is a FixedWindowController: the loss of UnreliableChannel is random,    #
+# not caused by congestion, and Reno would shrink the window to one segment after every timeout. Use                   #
+# RDTLayer.setCongestionController(RenoController()) for links whose losses do come from a full queue (LinkChannel).   #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class CongestionController(object):
+    """Interface of a congestion controller, the methods are called by RDTLayer on the client side"""
+
+    DUPLICATE_ACK_THRESHOLD = 3     # Duplicate acks that trigger a fast retransmit
+
+    def getWindow(self):
+        """Return the number of segments that may be in flight"""
+        raise NotImplementedError
+
+    def onAck(self, countAcked):
+        """
+        Called when an ack moves the window or acks segments for the first time
+        :param countAcked: number of segments newly ack'ed
+        """
+        pass
+
+    def onFastRetransmit(self, flightSize):
+        """
+        Called when DUPLICATE_ACK_THRESHOLD duplicate acks triggered a fast retransmit
+        :param flightSize: number of un-acked segments in flight
+        """
+        pass
+
+    def onTimeout(self, flightSize):
+        """
+        Called once per loss episode detected by the retransmission timer
+        :param flightSize: number of un-acked segments in flight
+        """
+        pass
+
+
+class FixedWindowController(CongestionController):
+    """Always allows the same number of segments in flight, this is how the client used to work"""
+
+    def __init__(self, window=4):
+        self.window = window
+
+    def getWindow(self):
+        return self.window
+
+
+class RenoController(CongestionController):
+    """Slow start, congestion avoidance (AIMD) and fast retransmit as in TCP Reno"""
+
+    INITIAL_WINDOW = 2              # in segments
+    INITIAL_SSTHRESH = 64           # in segments
+    MIN_SSTHRESH = 2                # in segments
+
+    def __init__(self):
+        self.cwnd = self.INITIAL_WINDOW
+        self.ssthresh = self.INITIAL_SSTHRESH
+
+    def getWindow(self):
+        return max(int(self.cwnd), 1)
+
+    def onAck(self, countAcked):
+        for _ in range(countAcked):
+            if self.cwnd < self.ssthresh:
+                # Slow start, one more segment per ack doubles the window every round trip
+                self.cwnd += 1
+            else:
+                # Congestion avoidance, about one more segment per round trip
+                self.cwnd += 1 / self.cwnd
+
+    def onFastRetransmit(self, flightSize):
+        # Multiplicative decrease, the duplicate acks show that segments are still getting through
+        self.ssthresh = max(flightSize / 2, self.MIN_SSTHRESH)
+        self.cwnd = self.ssthresh
+
+    def onTimeout(self, flightSize):
+        # Nothing came back for a whole RTO, restart from slow start
+        self.ssthresh = max(flightSize / 2, self.MIN_SSTHRESH)
+        self.cwnd = 1
+
+
+# Controllers by name, each call creates a new one: a controller keeps the state of one client
+CONTROLLERS = {
+    'fixed': FixedWindowController,
+    'reno': RenoController,
+}
+
+
+def createController(name):
+    """Return a new congestion controller registered under name, or the default FixedWindowController for None"""
+    if name is None:
+        return FixedWindowController()
+    try:
+        return CONTROLLERS[name]()
+    except KeyError:
+        raise ValueError("Unknown congestion controller: {0}, expected one of {1}".format(name, sorted(CONTROLLERS)))
@@ -0,0 +1,145 @@
+import time
+import tracemalloc
+
+from rdt_layer import RDTLayer
+from unreliable import UnreliableChannel
+
+
+# #################################################################################################################### #
+# ConnectionManager                                                                                                    #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Drives many client/server RDTLayer pairs, each over its own pair of UnreliableChannels, in a single scheduler loop.  #
+# Every iteration gives each unfinished connection the same timeslice rdt_main gives its single connection.            #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# run() returns aggregate throughput and, when measureMemory is set, the traced memory per connection.                 #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class Connection(object):
+    """One client/server pair and the two channels between them"""
+
+    __slots__ = ('connectionId', 'client', 'server', 'clientToServerChannel', 'serverToClientChannel', 'dataToSend',
+                 'iterations', 'complete')
+
+    def __init__(self, connectionId, client, server, clientToServerChannel, serverToClientChannel, dataToSend):
+        self.connectionId = connectionId
+        self.client = client
+        self.server = server
+        self.clientToServerChannel = clientToServerChannel
+        self.serverToClientChannel = serverToClientChannel
+        self.dataToSend = dataToSend
+        self.iterations = 0
+        self.complete = False
+
+    def processData(self):
+        """Run one iteration of this connection, in the same order as rdt_main"""
+        self.iterations += 1
+        self.client.processData()
+        self.clientToServerChannel.processData()
+        self.server.processData()
+        self.serverToClientChannel.processData()
+
+        if self.server.isComplete(self.client.getDataToSendLength()):
+            self.complete = True
+
+
+class ConnectionManager(object):
+
+    def __init__(self, channelFlags=(True, True, True, True), transferMode=RDTLayer.SELECTIVE_REPEAT,
+                 measureMemory=False):
+        """
+        :param channelFlags: (outOfOrder, dropPackets, delayPackets, dataErrors) for every UnreliableChannel created
+        :param transferMode: RDTLayer.GO_BACK_N or RDTLayer.SELECTIVE_REPEAT, used on both sides of every connection
+        :param measureMemory: trace allocations from now until the end of run() to report memory per connection,
+                              this slows everything down
+        """
+        self.channelFlags = channelFlags
+        self.transferMode = transferMode
+        self.measureMemory = measureMemory
+        self.connections = []
+
+        if measureMemory:
+            tracemalloc.start()
+
+    def addConnection(self, dataToSend):
+        """
+        Create a client/server pair with its own channels
+        :param dataToSend: data the client of this connection sends to its server
+        :return: the new Connection
+        """
+        client = RDTLayer()
+        server = RDTLayer()
+        client.setTransferMode(self.transferMode)
+        server.setTransferMode(self.transferMode)
+
+        clientToServerChannel = UnreliableChannel(*self.channelFlags)
+        serverToClientChannel = UnreliableChannel(*self.channelFlags)
+
+        client.setSendChannel(clientToServerChannel)
+        client.setReceiveChannel(serverToClientChannel)
+        server.setSendChannel(serverToClientChannel)
+        server.setReceiveChannel(clientToServerChannel)
+
+        client.setDataToSend(dataToSend)
+
+        connection = Connection(len(self.connections), client, server, clientToServerChannel, serverToClientChannel,
+                                dataToSend)
+        self.connections.append(connection)
+        return connection
+
+    def run(self, maxIterations=None):
+        """
+        Drive all connections until every transfer is complete
+        :param maxIterations: stop after this many iterations even if some transfers are unfinished
+        :return: a dictionary with aggregate results
+        """
+        startTime = time.perf_counter()
+        iterations = 0
+        active = [connection for connection in self.connections if not connection.complete]
+
+        while active and (maxIterations is None or iterations < maxIterations):
+            iterations += 1
+            for connection in active:
+                connection.processData()
+            active = [connection for connection in active if not connection.complete]
+
+        elapsed = time.perf_counter() - startTime
+
+        peakMemory = None
+        if self.measureMemory and tracemalloc.is_tracing():
+            _, peakMemory = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        return self.getReport(iterations, elapsed, peakMemory)
+
+    def getReport(self, iterations, elapsed, peakMemory=None):
+        """
+        Summarize a run
+        :param iterations: scheduler iterations that were run
+        :param elapsed: wall-clock seconds of the run
+        :param peakMemory: peak traced bytes during the run, or None
+        :return: a dictionary with aggregate results
+        """
+        completed = [connection for connection in self.connections if connection.complete]
+        bytesDelivered = sum(connection.client.getDataToSendLength() for connection in completed)
+
+        report = {
+            'connections': len(self.connections),
+            'completed': len(completed),
+            'iterations': iterations,
+            'seconds': elapsed,
+            'bytesDelivered': bytesDelivered,
+            'bytesPerIteration': bytesDelivered / iterations if iterations else 0.0,
+            'bytesPerSecond': bytesDelivered / elapsed if elapsed else 0.0,
+            'meanIterationsPerConnection':
+                sum(connection.iterations for connection in completed) / len(completed) if completed else 0.0,
+        }
+        if peakMemory is not None:
+            report['peakMemoryBytes'] = peakMemory
+            report['memoryBytesPerConnection'] = peakMemory / len(self.connections) if self.connections else 0.0
+
+        return report
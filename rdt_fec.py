@@ -0,0 +1,228 @@
+import struct
+from collections import deque
+
+
+# #################################################################################################################### #
+# Forward error correction                                                                                             #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# XOR parity over blocks of k data segments. The client sends one parity segment after each block, its payload is the  #
+# XOR of the block's payloads (zero padded to the longest) behind their lengths. When exactly one segment of a block   #
+# is lost or corrupt, the server rebuilds it from the parity and the others instead of waiting for a retransmission,   #
+# and acks it like any other segment, so FEC sits next to the ack path and the retransmission timers stay the backup.  #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Selective repeat only, go-back-n drops the segments behind a gap before a parity segment could help. The segments of #
+# a block are consecutive and span at most the receive window, so the server keeps the payloads of one window to       #
+# rebuild from. An adaptive encoder picks the largest k (lowest overhead 1/k) whose blocks still lose two or more      #
+# segments rarely, from the loss the client observes: retransmitted segments and acks flagged as recovered.            #
+# Use RDTLayer.setFec(FecEncoder(...)) on the client, the server follows the parity segments it receives.              #
+# In rdt_main, after setting the selective repeat mode:                                                                #
+#     from rdt_fec import FecEncoder                                                                                   #
+#     client.setFec(FecEncoder(k=4, adaptive=True))                                                                    #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class FecEncoder(object):
+    """Client side: collects the payloads of new data segments into blocks and produces their parity payloads"""
+
+    BLOCK_HEADER = struct.Struct('!H')  # Number of data segments in the block, followed by their lengths
+    LENGTH = struct.Struct('!I')
+    TARGET_FAILURE = 0.1                # Adaptive: chance that a block loses more than one segment, at most
+    LOSS_GAIN = 1.0 / 32                # Weight of the newest sample in the loss estimate
+    MIN_SAMPLES = 16                    # Acked segments before the loss estimate replaces the initial k
+
+    def __init__(self, k=4, adaptive=False, minK=2, maxK=16, maxDelay=0):
+        """
+        :param k: data segments per parity segment, the initial value when adaptive
+        :param adaptive: choose k from the observed loss ratio, between minK and maxK
+        :param maxDelay: iterations after its first segment a partial block is closed, so that its parity arrives
+                         before the retransmission timers of its segments expire
+        """
+        if k < 1 or minK < 1 or minK > maxK:
+            raise ValueError("Invalid FEC block size: k={0}, minK={1}, maxK={2}".format(k, minK, maxK))
+        self.k = k
+        self.adaptive = adaptive
+        self.minK = minK
+        self.maxK = maxK
+        self.maxDelay = maxDelay
+
+        self.lossEstimate = 0.0
+        self.countSamples = 0
+
+        # Block being filled
+        self.firstSeqnum = None         # Seqnum of its first segment, None while empty
+        self.firstIteration = 0
+        self.lengths = []
+        self.parity = 0                 # XOR of the payloads read as little-endian integers, i.e. zero padded
+        self.ready = []                 # (seqnum, payload) of parity segments to send
+
+        self.countParitySegments = 0
+
+    def add(self, seqnum, payload, window, iteration):
+        """
+        Add a data segment that is sent for the first time
+        :param seqnum: seqnum of the segment, it follows the previous one
+        :param payload: payload bytes of the segment, an empty payload (FIN) is not protected
+        :param window: receive window of the server, the span of a block stays within it
+        :param iteration: current iteration of the client
+        """
+        if not payload:
+            return
+        if self.firstSeqnum is not None and seqnum + len(payload) - self.firstSeqnum > window:
+            self.close()
+
+        if self.firstSeqnum is None:
+            self.firstSeqnum = seqnum
+            self.firstIteration = iteration
+            if self.adaptive and self.countSamples >= self.MIN_SAMPLES:
+                self.k = self.chooseK(self.lossEstimate)
+
+        self.lengths.append(len(payload))
+        self.parity ^= int.from_bytes(payload, 'little')
+        if len(self.lengths) >= self.k:
+            self.close()
+
+    def poll(self, iteration, endOfData):
+        """
+        Return the parity segments to send now, as (seqnum, payload) pairs
+        :param iteration: current iteration of the client
+        :param endOfData: no more data segments will follow, the last block is closed as it is
+        """
+        if self.firstSeqnum is not None and (endOfData or iteration - self.firstIteration >= self.maxDelay):
+            self.close()
+        ready = self.ready
+        self.ready = []
+        return ready
+
+    def close(self):
+        """Turn the current block into a parity payload: count, lengths, XOR of the payloads"""
+        lengths = self.lengths
+        payload = self.BLOCK_HEADER.pack(len(lengths)) + b''.join(self.LENGTH.pack(length) for length in lengths) + \
+            self.parity.to_bytes(max(lengths), 'little')
+        self.ready.append((self.firstSeqnum, payload))
+        self.countParitySegments += 1
+
+        self.firstSeqnum = None
+        self.lengths = []
+        self.parity = 0
+
+    def onAcked(self, lost):
+        """
+        Called for every segment acked for the first time
+        :param lost: the segment had to be sent again
+        """
+        self.countSamples += 1
+        self.lossEstimate += self.LOSS_GAIN * ((1.0 if lost else 0.0) - self.lossEstimate)
+
+    def onRecovered(self):
+        """Called for an ack that reports a segment rebuilt by the server, the segment was lost all the same"""
+        self.lossEstimate += self.LOSS_GAIN * (1.0 - self.lossEstimate)
+
+    def chooseK(self, lossRatio):
+        """Return the largest k whose block of k + 1 segments loses more than one with at most TARGET_FAILURE"""
+        for k in range(self.maxK, self.minK, -1):
+            count = k + 1
+            failure = 1.0 - (1.0 - lossRatio) ** count - count * lossRatio * (1.0 - lossRatio) ** (count - 1)
+            if failure <= self.TARGET_FAILURE:
+                return k
+        return self.minK
+
+
+class FecDecoder(object):
+    """Server side: keeps the payloads a parity block may need and rebuilds the one segment a block is missing"""
+
+    def __init__(self, contiguousEnd):
+        """
+        :param contiguousEnd: offset up to which the server has received everything when the first parity arrives
+        """
+        self.contiguousEnd = contiguousEnd  # Everything below has been received, its payload may be gone
+        self.payloads = {}                  # seqnum -> payload of the received data segments of the last window
+        self.order = deque()                # seqnums of payloads, in the order they arrived
+        self.blocks = []                    # (members, parity, length) of blocks still missing two or more segments
+        self.countRecovered = 0
+
+    def addData(self, seqnum, payload):
+        """
+        Keep the payload of a new data segment
+        :return: (seqnum, payload) of the segments this made it possible to rebuild
+        """
+        self.payloads[seqnum] = payload
+        self.order.append(seqnum)
+        if not self.blocks:
+            return ()
+
+        recovered = []
+        blocks = self.blocks
+        self.blocks = []
+        for members, parity, length in blocks:
+            self.recover(members, parity, length, recovered)
+        return recovered
+
+    def addParity(self, seqnum, payload):
+        """
+        Read a parity segment and rebuild the segment of its block that is missing, if it is the only one
+        :return: (seqnum, payload) of the rebuilt segments
+        """
+        count, = FecEncoder.BLOCK_HEADER.unpack_from(payload)
+        offset = FecEncoder.BLOCK_HEADER.size
+        members = []
+        for length, in FecEncoder.LENGTH.iter_unpack(payload[offset:offset + count * FecEncoder.LENGTH.size]):
+            members.append((seqnum, length))
+            seqnum += length
+        parityBytes = payload[offset + count * FecEncoder.LENGTH.size:]
+
+        recovered = []
+        self.recover(members, int.from_bytes(parityBytes, 'little'), len(parityBytes), recovered)
+        return recovered
+
+    def recover(self, members, parity, length, recovered):
+        """
+        Rebuild the missing segment of a block, or keep the block while two or more are missing
+        :param members: (seqnum, length) of the data segments of the block
+        :param parity: XOR of their payloads as an integer
+        :param length: length of the parity, the longest payload
+        :param recovered: list the rebuilt (seqnum, payload) is appended to
+        """
+        missing = None
+        for seqnum, memberLength in members:
+            if seqnum in self.payloads:
+                continue
+            if seqnum < self.contiguousEnd:
+                # Received before the decoder kept it, the block cannot be used
+                return
+            if missing is not None:
+                self.blocks.append((members, parity, length))
+                return
+            missing = seqnum, memberLength
+
+        if missing is None:
+            return
+        seqnum, memberLength = missing
+        for memberSeqnum, _ in members:
+            if memberSeqnum != seqnum:
+                parity ^= int.from_bytes(self.payloads[memberSeqnum], 'little')
+        payload = parity.to_bytes(length, 'little')[:memberLength]
+        self.payloads[seqnum] = payload
+        self.order.append(seqnum)
+        self.countRecovered += 1
+        recovered.append((seqnum, payload))
+
+    def prune(self, contiguousEnd, window):
+        """
+        Forget what no block can need anymore, called once per iteration
+        :param contiguousEnd: offset of the next in-order byte of the server
+        :param window: receive window of the server in bytes, a block spans no more than that
+        """
+        self.contiguousEnd = contiguousEnd
+        limit = contiguousEnd - window
+        while self.order:
+            payload = self.payloads.get(self.order[0])
+            if payload is not None and self.order[0] + len(payload) > limit:
+                break
+            self.payloads.pop(self.order.popleft(), None)
+        if self.blocks:
+            self.blocks = [block for block in self.blocks
+                           if block[0][-1][0] + block[0][-1][1] > contiguousEnd]
@@ -1,4 +1,17 @@
-from segment import Segment
+from collections import deque
+
+from segment import Segment, segmentPool
+from rdt_segmenter import SegmentationEngine, FixedSegmentSizer
+from rdt_stream import BytesSource, StreamSegmentationEngine, openSource
+from rdt_compress import CompressedSource, DecompressingSink, getCodec, getCodecById
+from rdt_fec import FecDecoder
+from rdt_timer import RetransmissionTimer, RTOEstimator
+from rdt_congestion import FixedWindowController
+from rdt_ack import AckPolicy
+from rdt_receiver import ReceiveBuffer
+from rdt_metrics import LayerMetrics
+import rdt_trace as trace
+import checksum
 
 
 # #################################################################################################################### #
@@ -25,36 +38,30 @@ class RDTLayer(object):
     #                                                                                                                  #
     #                                                                                                                  #
     # ################################################################################################################ #
-    DATA_LENGTH = 4  # in characters                     # The length of the string data that will be sent per packet...
-    FLOW_CONTROL_WIN_SIZE = 15  # in characters          # Receive window size for flow-control
-    sendChannel = None
-    receiveChannel = None
-    dataToSend = ''
-    currentIteration = 0                                # Use this for segment 'timeouts'
-    # Add items as needed
-
-    # We need to differentiate the server and client
-    thisIsServer = None
-    thisIsClient = None
-
-    # Server saves the final data in this container
-    dataReceived = ""
-
-    # Segment container, will be created by server
-    listSegments = None
+    DATA_LENGTH = 4  # in bytes                          # The length of the data that will be sent per packet...
+    FLOW_CONTROL_WIN_SIZE = 15  # in bytes               # Receive window size for flow-control
+    GO_BACK_N = 'GBN'                                   # Server drops out-of-order segments, client resends window
+    SELECTIVE_REPEAT = 'SR'                             # Server buffers out-of-order segments, acks each with SACK
+    INITIAL_RTO = 3  # in iterations                    # Segment timeout until the first round trip is measured
+    MAX_RTO = RTOEstimator.MAX_RTO  # in iterations     # Upper bound of the timeout backoff, above any round trip
+    CLOCK_GRANULARITY = 0  # in iterations              # Acks are processed before timeouts, see RTOEstimator
+    MAX_BACKOFF = 1                                     # Channel losses are random, waiting longer does not help
+    # DATA_LENGTH and FLOW_CONTROL_WIN_SIZE are the defaults of every connection, see setDataLength() and
+    # setFlowControlWinSize()
 
-    # Flow control variables, at the start of data transfer
-    flowControlStart = 0
-    flowControlEnd = 4
-
-    # Variable to store ack numbers received, for client
-    ackNumberContainer = []
-
-    # Sent ack number container, for server
-    sentAckNumberContainer = []
-
-    # Variable to store the sequence number of the last data segment received, for server
-    serverLastSeqNum = 0
+    # Every connection keeps its own state, there are no class level containers that instances could end up sharing.
+    # __slots__ also keeps each layer small when many connections run in one process.
+    __slots__ = (
+        'sendChannel', 'receiveChannel', 'dataToSend', 'currentIteration', 'transferMode', 'countSegmentTimeouts',
+        'thisIsServer', 'thisIsClient', 'tracer', 'metrics', 'dataLength', 'flowControlWinSize', 'checksumAlgorithm',
+        # client
+        'segmenter', 'sendWindow', 'sendWindowIndex', 'rtoEstimator', 'retransmissionTimer', 'congestionController',
+        'segmentsInFlight', 'duplicateAckCount', 'segmentSizer', 'peerWindow', 'compression', 'compressionLevel',
+        'fecEncoder',
+        # server
+        'receiveBuffer', 'serverLastSeqNum', 'receiveWindow', 'heldBytes', 'ackPolicy', 'checksumErrorSeen',
+        'decompressor', 'fecDecoder', 'recoveredSeen',
+    )
 
     # ################################################################################################################ #
     # __init__()                                                                                                       #
@@ -67,17 +74,79 @@ class RDTLayer(object):
     def __init__(self):
         self.sendChannel = None
         self.receiveChannel = None
-        self.dataToSend = ''
-        self.currentIteration = 0
+        self.dataToSend = b''
+        self.currentIteration = 0                       # Use this for segment 'timeouts'
+        self.transferMode = RDTLayer.GO_BACK_N
+
+        # Segment length and receive window (both in bytes) of this connection
+        self.dataLength = self.DATA_LENGTH
+        self.flowControlWinSize = self.FLOW_CONTROL_WIN_SIZE
+
+        # Checksum of the segments of this connection, see checksum.py
+        self.checksumAlgorithm = Segment.DEFAULT_CHECKSUM_ALGORITHM
 
         # Add items as needed
         self.countSegmentTimeouts = 0
+        self.tracer = trace.NULL_TRACER                 # Tracing is off until main sets a tracer
+        self.metrics = None                             # LayerMetrics, once main sets a registry
 
         # In rdt_main, the side that receives dataToSend is client. So, every object will be initialized as server, and
         # the object that receives dataToSend will be set as "client".
         self.thisIsServer = True
         self.thisIsClient = False
 
+        # Sender-side segmentation engine and window of un-acked segments, will be created for client
+        self.segmenter = None
+        self.sendWindow = None
+        self.sendWindowIndex = None                     # seqnum -> segment of sendWindow
+
+        # Round trip estimation and retransmission timers of the segments in the send window, for client
+        self.rtoEstimator = None
+        self.retransmissionTimer = None
+
+        # Congestion control, for client. A fixed window by default, the channel's losses are not congestion
+        self.congestionController = FixedWindowController()
+        self.segmentsInFlight = 0
+        self.duplicateAckCount = 0
+
+        # Segment sizes follow calculatePacketSizes() unless main sets a sizer. The client may have as many bytes in
+        # flight as the receive window the server advertised last, flowControlWinSize until the first ack.
+        self.segmentSizer = None
+        self.peerWindow = None
+
+        # Codec the client compresses its data with before segmentation, none until main sets one, see rdt_compress.py
+        self.compression = None
+        self.compressionLevel = None
+
+        # Parity segments for forward error correction, none until main sets an encoder, see rdt_fec.py
+        self.fecEncoder = None
+
+        # Server writes every accepted payload into this buffer at its seqnum. receiveBuffer.contiguousEnd is the
+        # offset of the next in-order byte, everything below it has been received.
+        self.receiveBuffer = ReceiveBuffer()
+
+        # Variable to store the sequence number of the last data segment received, for server
+        self.serverLastSeqNum = 0
+
+        # Selective repeat writes out-of-order payloads into receiveBuffer right away and remembers them here, seqnum
+        # to payload length, until the gap in front of them is filled
+        self.receiveWindow = {}
+        self.heldBytes = 0          # Sum of the payload lengths in receiveWindow
+
+        # One ack per data segment until main sets an AckPolicy, see rdt_ack.py
+        self.ackPolicy = None
+
+        # Set when a corrupt segment is discarded, the next ack reports it to the client's segment sizer
+        self.checksumErrorSeen = False
+
+        # DecompressingSink of the server, created when the first segment of a compressed stream arrives
+        self.decompressor = None
+
+        # FecDecoder of the server, created when the first parity segment arrives. recoveredSeen is set when a lost
+        # segment is rebuilt from parity, the next ack reports it to the client's FEC encoder.
+        self.fecDecoder = None
+        self.recoveredSeen = False
+
     # ################################################################################################################ #
     # setSendChannel()                                                                                                 #
     #                                                                                                                  #
@@ -100,17 +169,192 @@ class RDTLayer(object):
     def setReceiveChannel(self, channel):
         self.receiveChannel = channel
 
+    # ################################################################################################################ #
+    # setTransferMode()                                                                                                #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to select RDTLayer.GO_BACK_N (default) or RDTLayer.SELECTIVE_REPEAT. Both sides of a connection   #
+    # must use the same mode.                                                                                          #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setTransferMode(self, mode):
+        if mode not in (RDTLayer.GO_BACK_N, RDTLayer.SELECTIVE_REPEAT):
+            raise ValueError("Unknown transfer mode: {0}".format(mode))
+        self.transferMode = mode
+
+    # ################################################################################################################ #
+    # setCongestionController()                                                                                        #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to replace the default FixedWindowController, e.g. with RenoController(), see rdt_congestion.py   #
+    #                                                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setCongestionController(self, controller):
+        self.congestionController = controller
+
+    # ################################################################################################################ #
+    # setAckPolicy()                                                                                                   #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main on the server to send delayed or coalesced cumulative acks instead of one ack per segment, see    #
+    # rdt_ack.py. None goes back to one ack per segment.                                                               #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setAckPolicy(self, policy):
+        self.ackPolicy = policy
+
+    # ################################################################################################################ #
+    # setDataLength()                                                                                                  #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to set the payload length in bytes of the segments of this connection, instead of DATA_LENGTH.    #
+    # Call it before setDataToSend().                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setDataLength(self, length):
+        if length < 1:
+            raise ValueError("Data length must be at least 1 byte: {0}".format(length))
+        self.dataLength = length
+
+    # ################################################################################################################ #
+    # setFlowControlWinSize()                                                                                          #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to set the receive window in bytes of this connection, instead of FLOW_CONTROL_WIN_SIZE. Every    #
+    # ack of the server advertises the part of it not taken by out-of-order data and the client adopts that, so only   #
+    # the server needs it, also while running. The window may be smaller than the data length: the client cuts its     #
+    # segments to the window once an ack tells it.                                                                     #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setFlowControlWinSize(self, size):
+        if size < 1:
+            raise ValueError("Flow control window must be at least 1 byte: {0}".format(size))
+        self.flowControlWinSize = size
+
+    # ################################################################################################################ #
+    # setChecksumAlgorithm()                                                                                           #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to pick the checksum algorithm of this connection by name, see checksum.py, instead of            #
+    # checksum.DEFAULT_ALGORITHM. Both ends must use the same one, other connections keep theirs.                      #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setChecksumAlgorithm(self, name):
+        self.checksumAlgorithm = checksum.getAlgorithm(name)
+
+    # ################################################################################################################ #
+    # setSegmentSizer()                                                                                                #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main on the client to pick segment sizes with a SegmentSizer, e.g. AdaptiveSegmentSizer, instead of    #
+    # the fixed pattern of calculatePacketSizes(). See rdt_segmenter.py. Call it before setDataToSend().               #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setSegmentSizer(self, sizer):
+        self.segmentSizer = sizer
+
+    # ################################################################################################################ #
+    # setCompression()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main on the client to compress the data before it is cut into segments, with codec 'zlib' or 'lzma'    #
+    # at level (None for the default of the codec), see rdt_compress.py. Call it before setDataToSend(), None turns    #
+    # compression off. The server follows the codec marked in the segments, it needs no setting.                       #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setCompression(self, codec, level=None):
+        self.compression = None if codec is None else getCodec(codec)
+        self.compressionLevel = level
+
+    # ################################################################################################################ #
+    # setFec()                                                                                                         #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main on the client to send XOR parity segments for every block of data segments, e.g.                  #
+    # setFec(FecEncoder(k=4, adaptive=True)), see rdt_fec.py. Selective repeat only, None turns FEC off. The server    #
+    # rebuilds lost segments from the parity segments it receives, it needs no setting.                                #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setFec(self, encoder):
+        self.fecEncoder = encoder
+
+    # ################################################################################################################ #
+    # setTracer()                                                                                                      #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to receive the events of this layer, see rdt_trace.py                                             #
+    #                                                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setTracer(self, tracer):
+        self.tracer = tracer
+
+    # ################################################################################################################ #
+    # setMetrics()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to record the counters, gauges, histograms and phase timers of this layer in a MetricsRegistry,   #
+    # see rdt_metrics.py. labels tell the layers of a registry apart, e.g. {'component': 'client'}                     #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setMetrics(self, registry, labels=None):
+        self.metrics = LayerMetrics(registry, self, labels)
+
     # ################################################################################################################ #
     # setDataToSend()                                                                                                  #
     #                                                                                                                  #
     # Description:                                                                                                     #
-    # Called by main to set the string data to send                                                                    #
+    # Called by main to set the data to send, bytes or a string. Strings travel utf-8 encoded.                         #
     #                                                                                                                  #
     #                                                                                                                  #
     # ################################################################################################################ #
     def setDataToSend(self, data):
+        if isinstance(data, str):
+            data = data.encode(Segment.TEXT_ENCODING)
         self.dataToSend = data
 
+        # Segments are cut from dataToSend lazily, only when they enter the window. Compressed data has no known
+        # length, it is sent as a stream that ends with a FIN segment.
+        if self.compression is not None:
+            self.startSending(StreamSegmentationEngine(self.compress(BytesSource(data)), self.createSegmentSizer()))
+        else:
+            self.startSending(SegmentationEngine(data, self.createSegmentSizer()))
+
+    # ################################################################################################################ #
+    # setDataSource()                                                                                                  #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to stream data of unknown length from a file-like object, an mmap or an iterator of chunks, see   #
+    # rdt_stream.py. The source is read only as the window advances and the stream ends with a FIN segment.            #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setDataSource(self, source):
+        self.dataToSend = b''
+        self.startSending(StreamSegmentationEngine(self.compress(openSource(source)), self.createSegmentSizer()))
+
+    def compress(self, source):
+        """Return source behind the compression stage set with setCompression(), or unchanged without one"""
+        if self.compression is None:
+            return source
+        return CompressedSource(source, self.compression, self.compressionLevel)
+
+    def startSending(self, segmenter):
+        """
+        Make this layer the client and reset the sender state
+        :param segmenter: SegmentationEngine or StreamSegmentationEngine the segments are cut from
+        """
+        self.segmenter = segmenter
+        self.sendWindow = deque()
+        self.sendWindowIndex = {}
+        self.segmentsInFlight = 0
+        self.duplicateAckCount = 0
+        self.rtoEstimator = RTOEstimator(self.INITIAL_RTO, self.MAX_RTO, self.CLOCK_GRANULARITY,
+                                         self.MAX_BACKOFF)
+        self.retransmissionTimer = RetransmissionTimer(self.rtoEstimator)
+        self.peerWindow = self.flowControlWinSize
+        self.segmenter.sizer.limit = self.peerWindow
+
         # In rdt_main, the side that receives dataToSend is client. So, the object that receives dataToSend will be set
         # as "client".
         self.thisIsServer = False
@@ -132,20 +376,155 @@ class RDTLayer(object):
 
         # ############################################################################################################ #
         if self.thisIsClient is False and self.thisIsServer is True:
-            return self.dataReceived
+            if self.decompressor is not None:
+                return self.decompressor.getText()
+            return self.receiveBuffer.getText()
 
     # ################################################################################################################ #
-    # processData()                                                                                                    #
+    # setDataSink()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main on the server to receive the data as it arrives in order instead of keeping all of it. sink is a  #
+    # function or an object with write(), it is called with bytes after every iteration that delivered new data.       #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def setDataSink(self, sink):
+        sink = sink.write if hasattr(sink, 'write') else sink
+        if self.decompressor is not None:
+            self.decompressor.sink = sink
+        else:
+            self.receiveBuffer.sink = sink
+
+    # ################################################################################################################ #
+    # getBytesReceived()                                                                                               #
     #                                                                                                                  #
     # Description:                                                                                                     #
-    # "timeslice". Called by main once per iteration                                                                   #
+    # Called by main to get the data the server has received in order, as bytes                                        #
     #                                                                                                                  #
     #                                                                                                                  #
     # ################################################################################################################ #
-    def processData(self):
-        self.currentIteration += 1
-        self.processSend()
+    def getBytesReceived(self):
+        if self.decompressor is not None:
+            return self.decompressor.getBytes()
+        return self.receiveBuffer.getBytes()
+
+    # ################################################################################################################ #
+    # getDataToSendLength()                                                                                            #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to get the length in bytes of the data the client sends, to compare with isComplete()             #
+    #                                                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def getDataToSendLength(self):
+        return len(self.dataToSend)
+
+    # ################################################################################################################ #
+    # isComplete()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to check, without copying any data, whether the server has received expectedLength bytes in       #
+    # order                                                                                                            #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def isComplete(self, expectedLength):
+        if self.decompressor is not None:
+            return self.decompressor.countDecompressed >= expectedLength
+        return self.receiveBuffer.isComplete(expectedLength)
+
+    # ################################################################################################################ #
+    # isFinished()                                                                                                     #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to check whether the server has received a stream sent with setDataSource() up to its end         #
+    #                                                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def isFinished(self):
+        return self.receiveBuffer.isFinished()
+
+    # ################################################################################################################ #
+    # isSendComplete()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by a driver to check whether the client has sent every byte of its data and had it acked                  #
+    #                                                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def isSendComplete(self):
+        return self.segmenter is not None and not self.segmenter.hasMoreData() and not self.sendWindow
+
+    # ################################################################################################################ #
+    # getDataReceivedLength()                                                                                          #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to get the number of bytes the server has received in order, after decompression                  #
+    #                                                                                                                  #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def getDataReceivedLength(self):
+        if self.decompressor is not None:
+            return self.decompressor.countDecompressed
+        return self.receiveBuffer.contiguousEnd
+
+    # ################################################################################################################ #
+    # getNextTimeout()                                                                                                 #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by an event-driven driver (see rdt_async.py) to get the iteration at which the earliest retransmission    #
+    # timer of the client expires or at which the server owes a delayed ack, None if there is none                     #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def getNextTimeout(self):
+        if self.retransmissionTimer is None:
+            return self.ackPolicy.getDeadline() if self.ackPolicy is not None else None
+        return self.retransmissionTimer.getNextExpiry()
+
+    # ################################################################################################################ #
+    # getRTTEstimates()                                                                                                #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # Called by main to get the live round trip estimates of the client (srtt, rttvar, lastRTT, rto, ...) in           #
+    # iterations, None on the server                                                                                   #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def getRTTEstimates(self):
+        if self.rtoEstimator is None:
+            return None
+        return self.rtoEstimator.getEstimates()
+
+    # ################################################################################################################ #
+    # processData()                                                                                                    #
+    #                                                                                                                  #
+    # Description:                                                                                                     #
+    # "timeslice". Called by main once per iteration. An event-driven driver (see rdt_async.py) passes the current     #
+    # iteration of its clock instead, it may skip iterations in which nothing happens.                                 #
+    #                                                                                                                  #
+    # ################################################################################################################ #
+    def processData(self, iteration=None):
+        if iteration is None:
+            self.currentIteration += 1
+        else:
+            self.currentIteration = iteration
+        if self.metrics is None:
+            self.processSend()
+            self.processReceiveAndSendRespond()
+            return
+
+        # The same steps as processSend() and processReceiveAndSendRespond(), timed one by one
+        self.metrics.bind(self)
+        timer = self.metrics.phaseTimer
+        timer.start()
+        if self.thisIsClient is True and self.thisIsServer is False:
+            self.processAcks()
+            timer.lap('acks')
+            self.processTimeouts()
+            timer.lap('timeouts')
+            self.sendNewSegments()
+            timer.lap('send')
         self.processReceiveAndSendRespond()
+        timer.lap('receive')
+        self.metrics.sample(self)
 
     # ################################################################################################################ #
     # processSend()                                                                                                    #
@@ -157,127 +536,247 @@ class RDTLayer(object):
     # ################################################################################################################ #
     def processSend(self):
 
-        # If the segment list is not created and this is client sending the data, prepare the segment list
-        # I know this is inefficient but at the beginning I had not noticed that the channel was able to corrupt
-        # previously saved packets, therefore this list of segment object is created again every time
-        if self.thisIsClient is True and self.thisIsServer is False:
-            listPacketSizes = self.calculatePacketSizes()
-            listDividedData = self.divideDataToSend(listPacketSizes)
-            listSequenceNumbers = self.calculatePacketSequenceNumbers(listDividedData)
-            listSegments = self.createSegments(listDividedData, listSequenceNumbers)
-            self.listSegments = listSegments
-
         # Client
         if self.thisIsClient is True and self.thisIsServer is False:
+            self.processAcks()
+            self.processTimeouts()
+            self.sendNewSegments()
+
+    def processAcks(self):
+        """Client receives acks from server"""
+        if len(self.receiveChannel.receiveQueue) != 0:
+            listOfAckSegments = self.receiveChannel.receive()
+
+            # Check ack segments
+            for incomingSegment in listOfAckSegments:
+                if incomingSegment.window != self.peerWindow or incomingSegment.checksumError or \
+                        incomingSegment.recovered:
+                    self.processAdvertisement(incomingSegment.window, incomingSegment.checksumError,
+                                              incomingSegment.recovered)
+                # extract ack number from each segment, a window update acknowledges nothing
+                if incomingSegment.acknum != Segment.NO_ACK:
+                    self.processAck(incomingSegment.acknum, incomingSegment.cumulative,
+                                    incomingSegment.getSackRanges())
+            segmentPool.releaseAll(listOfAckSegments)
+
+    def processAdvertisement(self, window, checksumError, recovered=False):
+        """
+        Take over the receive window the server advertised in an ack, and tell the segment sizer about checksum errors
+        :param window: receive window of the server in bytes, 0 when the ack does not advertise one
+        :param checksumError: the server discarded a corrupt segment before sending the ack
+        :param recovered: the server rebuilt a lost segment from parity before sending the ack
+        """
+        if window and window != self.peerWindow:
+            self.peerWindow = window
+            self.segmenter.sizer.limit = window
+        if checksumError:
+            self.segmenter.sizer.onChecksumError()
+        if recovered and self.fecEncoder is not None:
+            self.fecEncoder.onRecovered()
+
+    def processTimeouts(self):
+        """Only segments whose ack did not arrive in time are sent again, with the backed off timeout"""
+        for pendingSegment in self.retransmissionTimer.popExpired(self.currentIteration):
+            if self.rtoEstimator.backoff(pendingSegment.sendIteration, self.currentIteration):
+                self.congestionController.onTimeout(self.segmentsInFlight)
+            self.countSegmentTimeouts += 1
+            pendingSegment.retransmissions += 1
+            if self.tracer.infoEnabled:
+                self.tracer.emit(trace.INFO, trace.TIMEOUT, self.currentIteration, pendingSegment.seqnum, -1,
+                                 len(pendingSegment.payload))
+            self.sendPendingSegment(pendingSegment)
+
+    def sendNewSegments(self):
+        """
+        After checking acks and timeouts, new segments enter the window and are sent once. The window is limited by
+        the congestion window (in segments) and by the receive window (in bytes) the server advertised.
+        """
+        # Parity only helps a receiver that keeps the segments behind a gap
+        fecEncoder = self.fecEncoder if self.transferMode == RDTLayer.SELECTIVE_REPEAT else None
+        while self.segmenter.hasMoreData() and \
+                self.segmentsInFlight < self.congestionController.getWindow() and \
+                self.segmenter.cursor + self.segmenter.nextSegmentSize() - self.getSendBase() <= self.peerWindow:
+            pendingSegment = self.segmenter.nextSegment()
+            self.sendWindow.append(pendingSegment)
+            self.sendWindowIndex[pendingSegment.seqnum] = pendingSegment
+            self.segmentsInFlight += 1
+            self.sendPendingSegment(pendingSegment)
+            if fecEncoder is not None:
+                fecEncoder.add(pendingSegment.seqnum, pendingSegment.payload, self.peerWindow, self.currentIteration)
+
+        if fecEncoder is not None:
+            self.sendParity()
 
-            # Client receives acks from server
-            if len(self.receiveChannel.receiveQueue) != 0:
-                listOfAckSegments = self.receiveChannel.receive()
-
-                # Check ack segments
-                for incomingSegment in listOfAckSegments:
-
-                    # extract ack number from each segment
-                    incomingSegmentAckNumber = incomingSegment.acknum
-                    # add this data to server ack number container
-                    self.ackNumberContainer.append(incomingSegmentAckNumber)
-
-            # After checking acks, send messages
-
-            # This should handle the cumulative ack by finding the highest ack number then shifting the control window
-            if self.ackNumberContainer:
-                ackToFind = max(self.ackNumberContainer)  # Highest char number ack'ed
-                for segment in self.listSegments:
-                    if ackToFind == segment.seqnum:
-                        self.flowControlStart = self.listSegments.index(segment) + 1
-                        self.flowControlEnd = self.flowControlStart + 4
-                        # print("Flow control window:")
-                        # print(self.listSegments[self.flowControlStart].seqnum,
-                        #       self.listSegments[self.flowControlEnd].seqnum)
+    def sendParity(self):
+        """Send the parity segments of the blocks the FEC encoder closed, see rdt_fec.py"""
+        for seqnum, payload in self.fecEncoder.poll(self.currentIteration, not self.segmenter.hasMoreData()):
+            segment = segmentPool.acquire()
+            segment.setParity(seqnum, payload, self.checksumAlgorithm)
+            if self.tracer.debugEnabled:
+                self.tracer.emit(trace.DEBUG, trace.PARITY, self.currentIteration, seqnum, -1, len(payload))
+            self.sendChannel.send(segment)
+
+    def processAck(self, ackNumber, cumulative=False, sackRanges=()):
+        """
+        Update the send window with one ack from the server
+        :param ackNumber: seqnum of the segment the server acknowledges
+        :param cumulative: the ack covers every segment up to and including ackNumber, see rdt_ack.py
+        :param sackRanges: (start, end) byte ranges the server holds past a gap, selective repeat only
+        """
+        countAcked = 0
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.ACK_RECEIVE, self.currentIteration, -1, ackNumber)
+        if self.metrics is not None:
+            self.metrics.acksReceived.inc()
+
+        if self.transferMode == RDTLayer.SELECTIVE_REPEAT:
+            # Each ack names exactly one segment, mark it and slide over the ack'ed prefix. A cumulative ack names the
+            # last segment of the prefix the server has in order.
+            newlyAcked = []
+            if cumulative:
+                for pendingSegment in self.sendWindow:
+                    if pendingSegment.seqnum > ackNumber:
+                        break
+                    if not pendingSegment.acked:
+                        newlyAcked.append(pendingSegment)
             else:
-                self.flowControlStart = 0
-                self.flowControlEnd = self.flowControlStart + 4
+                pendingSegment = self.sendWindowIndex.get(ackNumber)
+                if pendingSegment is not None and not pendingSegment.acked:
+                    newlyAcked.append(pendingSegment)
 
-            for segment in self.listSegments[self.flowControlStart: self.flowControlEnd]:
-                print("Sending Segment:", segment.to_string())
-                self.sendChannel.send(segment)
+            for start, end in sackRanges:
+                for pendingSegment in self.sendWindow:
+                    if pendingSegment.seqnum >= end:
+                        break
+                    if not pendingSegment.acked and pendingSegment.seqnum >= start and \
+                            pendingSegment.seqnum + len(pendingSegment.payload) <= end:
+                        newlyAcked.append(pendingSegment)
 
-    def calculatePacketSizes(self):
-        """Return a list of sizes that contains max number of characters per packet in flow control window size"""
+            # The segment sent last is the one the ack was sent for, the others may have waited behind a gap
+            if newlyAcked:
+                self.measureRoundTrip(max(newlyAcked, key=self.getRoundTripOrder))
+            for pendingSegment in newlyAcked:
+                if not pendingSegment.acked:
+                    self.markAcked(pendingSegment)
+                    countAcked += 1
+            windowMoved = bool(self.sendWindow) and self.sendWindow[0].acked
+            while self.sendWindow and self.sendWindow[0].acked:
+                del self.sendWindowIndex[self.sendWindow.popleft().seqnum]
+        else:
+            # This handles the cumulative ack: every segment up to and including the ack'ed one leaves the window.
+            # Acks are processed one by one so there is no need to keep all of them around.
+            while self.sendWindow and self.sendWindow[0].seqnum <= ackNumber:
+                pendingSegment = self.sendWindow.popleft()
+                del self.sendWindowIndex[pendingSegment.seqnum]
+                self.markAcked(pendingSegment)
+                countAcked += 1
+                if pendingSegment.seqnum == ackNumber:
+                    self.measureRoundTrip(pendingSegment)
+            windowMoved = countAcked > 0
 
-        # In case of DATA_LENGTH = 4 and FLOW_CONTROL_WIN_SIZE = 15, listPacketCharSize = [4, 4, 4, 3]. This will be
-        # later used for generating packets.
-        listPacketCharSizes = []
+        self.segmentsInFlight -= countAcked
+        if countAcked:
+            self.congestionController.onAck(countAcked)
+            self.segmenter.sizer.onAck(countAcked)
+            self.rtoEstimator.onAck()
 
-        numberOfPackets = self.FLOW_CONTROL_WIN_SIZE // self.DATA_LENGTH
+        if windowMoved:
+            self.duplicateAckCount = 0
+            return
 
-        for _ in range(numberOfPackets):
-            listPacketCharSizes.append(self.DATA_LENGTH)
+        # An ack that does not move the window means a segment behind it is missing: the server repeats its previous
+        # ack (go-back-n) or acks segments past the gap (selective repeat). Resend the missing one without waiting for
+        # its timer. A coalesced ack that SACKs several segments past the gap counts once for each of them, as their
+        # own acks would have.
+        previousCount = self.duplicateAckCount
+        self.duplicateAckCount += max(countAcked, 1)
+        if previousCount < self.congestionController.DUPLICATE_ACK_THRESHOLD <= self.duplicateAckCount and \
+                self.sendWindow:
+            pendingSegment = self.sendWindow[0]
+            self.congestionController.onFastRetransmit(self.segmentsInFlight)
+            pendingSegment.retransmissions += 1
+            if self.metrics is not None:
+                self.metrics.fastRetransmits.inc()
+            if self.tracer.infoEnabled:
+                self.tracer.emit(trace.INFO, trace.FAST_RETRANSMIT, self.currentIteration, pendingSegment.seqnum, -1,
+                                 len(pendingSegment.payload))
+            self.sendPendingSegment(pendingSegment)
 
-        if self.FLOW_CONTROL_WIN_SIZE % self.DATA_LENGTH != 0:
-            listPacketCharSizes.append(self.FLOW_CONTROL_WIN_SIZE - numberOfPackets * self.DATA_LENGTH)
+    def markAcked(self, pendingSegment):
+        """Mark a segment of the send window as ack'ed for the first time"""
+        pendingSegment.acked = True
+        if self.fecEncoder is not None:
+            self.fecEncoder.onAcked(pendingSegment.retransmissions > 0)
+        if self.metrics is not None:
+            self.metrics.retransmitsPerSegment.observe(pendingSegment.retransmissions)
 
-        return listPacketCharSizes
+    @staticmethod
+    def getRoundTripOrder(pendingSegment):
+        """Sort key of the segments an ack covers, segments sent once come last and then by send iteration"""
+        return pendingSegment.retransmissions == 0, pendingSegment.sendIteration
 
-    def divideDataToSend(self, packetSizes):
+    def getSendBase(self):
+        """Return the seqnum of the oldest un-acked segment, or of the next new segment if nothing is in flight"""
+        if self.sendWindow:
+            return self.sendWindow[0].seqnum
+        return self.segmenter.cursor
+
+    def measureRoundTrip(self, pendingSegment):
         """
-        Partition dataToSend to a list
-        :param packetSizes: list of packet sizes calculated according to the flow control window size
-        :return: dataToSend partitioned as a list of characters according to the given sizes
+        Feed the round trip of a newly ack'ed segment to the RTO estimator
+        :param pendingSegment: sender-side record of the ack'ed segment
         """
-        dividedData = []
-        index = 0
-
-        while index < len(self.dataToSend):
-            for size in packetSizes:
-                if index + size > len(self.dataToSend):
-                    chunk = self.dataToSend[index:]
-                    dividedData.append(chunk)
-                    index += len(chunk)
-                    break
-                else:
-                    # If enough characters are left, proceed as usual
-                    chunk = self.dataToSend[index:index + size]
-                    dividedData.append(chunk)
-                    index += size
-
-        return dividedData
-
-    def calculatePacketSequenceNumbers(self, partitionedData):
+        # Karn's rule: the ack of a retransmitted segment may belong to any of its copies, so it is not measured
+        if pendingSegment.retransmissions == 0:
+            roundTrip = self.currentIteration - pendingSegment.sendIteration
+            self.rtoEstimator.addSample(roundTrip)
+            if self.metrics is not None:
+                self.metrics.rtt.observe(roundTrip)
+
+    def sendPendingSegment(self, pendingSegment):
         """
-        Return a list of sequence numbers for packet generation
-        :param partitionedData: Sequence numbers will be generated for this list
-        :return: A list of sequence numbers
+        Send a segment of the send window and arm its retransmission timer
+        :param pendingSegment: sender-side record of the segment to send
         """
+        # The channel is able to corrupt the segments it carries, so a fresh segment object is created for every
+        # (re)transmission and the stored payload is never handed to the channel
+        segment = segmentPool.acquire()
+        segment.setData(pendingSegment.seqnum, pendingSegment.payload, pendingSegment.fin,
+                        self.compression.codecId if self.compression is not None else 0, self.checksumAlgorithm)
+        segment.setStartIteration(self.currentIteration)
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.RETRANSMIT if pendingSegment.retransmissions else trace.SEND,
+                             self.currentIteration, pendingSegment.seqnum, -1, len(pendingSegment.payload))
+        if self.metrics is not None:
+            if pendingSegment.retransmissions:
+                self.metrics.retransmissions.inc()
+            else:
+                self.metrics.segmentsSent.inc()
+        self.sendChannel.send(segment)
+        self.retransmissionTimer.start(pendingSegment, self.currentIteration)
 
-        index = 0
-        seqNum = 0
-        listSeqNumbers = [index]
+    def calculatePacketSizes(self):
+        """Return a list of sizes that contains max number of bytes per packet in flow control window size"""
 
-        for element in partitionedData:
-            seqNum += len(element)
-            listSeqNumbers.append(seqNum)
+        # In case of dataLength = 4 and flowControlWinSize = 15, listPacketCharSize = [4, 4, 4, 3]. This will be
+        # later used for generating packets.
+        listPacketCharSizes = []
 
-        # We do not need to calculate the sequence number after the last packet
-        listSeqNumbers.pop()
+        numberOfPackets = self.flowControlWinSize // self.dataLength
 
-        return listSeqNumbers
+        for _ in range(numberOfPackets):
+            listPacketCharSizes.append(self.dataLength)
 
-    def createSegments(self, listData, listSeqNum):
-        """
-        Creates a list of segment of objects containing information from the following lists
-        :param listData: a list of partitioned data according to the specifications
-        :param listSeqNum: a list of sequence numbers calculated using listData
-        :return: a list of segment objects to be sent
-        """
-        listSegments = []
+        if self.flowControlWinSize % self.dataLength != 0:
+            listPacketCharSizes.append(self.flowControlWinSize - numberOfPackets * self.dataLength)
 
-        for seqNum, data in zip(listSeqNum, listData):
-            segment = Segment()
-            segment.setData(seqNum, data)
-            listSegments.append(segment)
+        return listPacketCharSizes
 
-        return listSegments
+    def createSegmentSizer(self):
+        """Return the segment sizer set by main, or one that repeats calculatePacketSizes()"""
+        if self.segmentSizer is not None:
+            return self.segmentSizer
+        return FixedSegmentSizer(self.calculatePacketSizes())
 
     # ################################################################################################################ #
     # processReceive()                                                                                                 #
@@ -293,50 +792,255 @@ class RDTLayer(object):
         listIncomingSegments = self.receiveChannel.receive()
 
         # If this is server (the side that receives only data segments), never receives ack segments
-        if self.thisIsClient is False and self.thisIsServer is True:
+        if self.thisIsClient is False and self.thisIsServer is True and \
+                self.transferMode == RDTLayer.SELECTIVE_REPEAT:
+            self.processReceiveSelectiveRepeat(listIncomingSegments)
+
+        elif self.thisIsClient is False and self.thisIsServer is True:
 
             if listIncomingSegments:
                 for incomingSegment in listIncomingSegments:
 
-                    # If no ack segments received, then first segment received should have seqnum zero
-                    if len(self.sentAckNumberContainer) == 0 and incomingSegment.seqnum != 0:
-                        break
+                    # Go-back-n has no use for parity segments, see rdt_fec.py
+                    if incomingSegment.parity:
+                        continue
 
-                    # Check checksum and seqnum for this segment
-                    if (incomingSegment.checkChecksum() is True and
-                            # segment is in order
-                            incomingSegment.seqnum <= self.serverLastSeqNum + 4 and
-                            # segment is not duplicate
-                            incomingSegment.seqnum not in self.sentAckNumberContainer):
+                    # Check checksum and seqnum for this segment. Everything below contiguousEnd has been received,
+                    # so a segment is new and in order exactly when it starts at contiguousEnd.
+                    isChecksumValid = incomingSegment.checkChecksum(self.checksumAlgorithm)
+                    if isChecksumValid is False:
+                        self.checksumErrorSeen = True
+                    if (isChecksumValid is True and
+                            incomingSegment.seqnum == self.receiveBuffer.contiguousEnd):
+                        if incomingSegment.codec and self.decompressor is None:
+                            self.startDecompression(incomingSegment.codec)
 
                         # extract payload from each segment
                         incomingSegmentPayload = incomingSegment.payload
-                        # add this data to server data container
-                        self.dataReceived += incomingSegmentPayload
                         # extract the seqnum from the segment
                         incomingSegmentSeqNum = incomingSegment.seqnum
+                        # add this data to server data container
+                        self.receiveBuffer.write(incomingSegmentSeqNum, incomingSegmentPayload)
+                        self.receiveBuffer.advance(len(incomingSegmentPayload))
                         # assign this data to server data container
                         self.serverLastSeqNum = incomingSegmentSeqNum
+                        if incomingSegment.fin:
+                            self.receiveBuffer.finalLength = incomingSegmentSeqNum
+                        if self.tracer.debugEnabled:
+                            self.tracer.emit(trace.DEBUG, trace.DELIVER, self.currentIteration, incomingSegmentSeqNum,
+                                             -1, len(incomingSegmentPayload))
 
                         # Now send the ack segments for correctly received data segment
-                        segmentAck = Segment()
-                        segmentAck.setAck(self.serverLastSeqNum)
-                        print("Sending ack: ", segmentAck.to_string())
-                        # The following ack numbers are for segments with payload already received,
-                        # will use this to detect duplicate packets
-                        self.sentAckNumberContainer.append(self.serverLastSeqNum)
-                        self.sendChannel.send(segmentAck)
+                        self.acknowledge(self.serverLastSeqNum, True)
 
                     else:  # discard the segment by not using its payload
+                        if self.tracer.warningEnabled:
+                            self.tracer.emit(trace.WARNING, trace.DISCARD, self.currentIteration,
+                                             incomingSegment.seqnum, -1, len(incomingSegment.payload))
 
-                        # If the server is expecting the first packet and its corrupt
-                        if self.serverLastSeqNum == 0:
-                            print("First packet is corrupt")
+                        # If nothing has been received yet there is no previous segment to ack
+                        if self.receiveBuffer.contiguousEnd == 0:
                             # Do not send any ack
-                            break
+                            continue
 
                         # We should send the sequence number of last data packet received correctly
-                        segmentAck = Segment()
-                        segmentAck.setAck(self.serverLastSeqNum)
-                        print("Data Error - Sending previous ack: ", segmentAck.to_string())
-                        self.sendChannel.send(segmentAck)
+                        self.acknowledge(self.serverLastSeqNum, False)
+
+        # An ack policy sends at most one cumulative ack per iteration, also when no segment arrived
+        if self.thisIsServer is True and self.ackPolicy is not None and \
+                self.ackPolicy.isAckDue(self.currentIteration):
+            self.sendCumulativeAck()
+
+        # Hand the new in-order data to the sink, see setDataSink()
+        if self.receiveBuffer.sink is not None:
+            self.receiveBuffer.flush()
+
+        # The payloads have been copied into receiveBuffer, the segments can be reused
+        segmentPool.releaseAll(listIncomingSegments)
+
+    def processReceiveSelectiveRepeat(self, listIncomingSegments):
+        """
+        Server side of selective repeat: buffer segments that fall inside the receive window, deliver the contiguous
+        prefix and ack every valid segment individually
+        :param listIncomingSegments: data segments received from the channel in this iteration
+        """
+        for incomingSegment in listIncomingSegments:
+
+            # Corrupt segments are dropped without an ack, the client will resend them
+            if incomingSegment.checkChecksum(self.checksumAlgorithm) is False:
+                self.checksumErrorSeen = True
+                if self.tracer.warningEnabled:
+                    self.tracer.emit(trace.WARNING, trace.DISCARD, self.currentIteration, incomingSegment.seqnum, -1,
+                                     len(incomingSegment.payload))
+                continue
+
+            if incomingSegment.parity:
+                self.processParity(incomingSegment)
+                continue
+
+            seqNum = incomingSegment.seqnum
+            payload = incomingSegment.payload
+            if incomingSegment.codec and self.decompressor is None:
+                self.startDecompression(incomingSegment.codec)
+
+            # Segments past the receive window would overflow the buffer, drop them but send the window so the client
+            # stops sending past it. The segment at contiguousEnd is delivered right away and never held, it is taken
+            # even if it is larger than the window, or a client that cut it before learning the window would resend
+            # it forever.
+            if seqNum + len(payload) > self.receiveBuffer.contiguousEnd + self.flowControlWinSize and \
+                    seqNum != self.receiveBuffer.contiguousEnd:
+                self.sendWindowUpdate()
+                continue
+
+            # The FIN segment of a stream tells its length, the stream is finished once everything before it arrived
+            if incomingSegment.fin:
+                self.receiveBuffer.finalLength = seqNum
+
+            # Anything below contiguousEnd or already buffered is a duplicate whose ack was lost, ack it again. A
+            # segment that fills a gap is not in order for the ack policy either, the client is waiting for that ack.
+            inOrder = False
+            isNew = seqNum >= self.receiveBuffer.contiguousEnd and seqNum not in self.receiveWindow
+            if isNew:
+                inOrder = self.storeSegment(seqNum, payload)
+            self.acknowledge(seqNum, inOrder)
+
+            # A new segment may leave a parity block with only one segment missing
+            if isNew and self.fecDecoder is not None:
+                self.storeRecovered(self.fecDecoder.addData(seqNum, payload))
+
+        if self.fecDecoder is not None:
+            self.fecDecoder.prune(self.receiveBuffer.contiguousEnd, self.flowControlWinSize)
+
+    def storeSegment(self, seqNum, payload):
+        """
+        Selective repeat: write a new segment into the receive window and deliver the contiguous prefix
+        :return: True if the segment extended the in-order data and left no gap behind it
+        """
+        inOrder = seqNum == self.receiveBuffer.contiguousEnd and not self.receiveWindow
+        self.receiveBuffer.write(seqNum, payload)
+        self.receiveWindow[seqNum] = len(payload)
+        self.heldBytes += len(payload)
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.DELIVER, self.currentIteration, seqNum, -1, len(payload))
+
+        # Deliver the contiguous prefix of the receive window
+        while self.receiveBuffer.contiguousEnd in self.receiveWindow:
+            self.serverLastSeqNum = self.receiveBuffer.contiguousEnd
+            length = self.receiveWindow.pop(self.receiveBuffer.contiguousEnd)
+            self.heldBytes -= length
+            self.receiveBuffer.advance(length)
+        return inOrder
+
+    def processParity(self, incomingSegment):
+        """
+        Selective repeat: rebuild the lost segment of a block from a parity segment, see rdt_fec.py
+        :param incomingSegment: parity segment with a valid checksum, it is not acked
+        """
+        if self.fecDecoder is None:
+            self.fecDecoder = FecDecoder(self.receiveBuffer.contiguousEnd)
+        self.storeRecovered(self.fecDecoder.addParity(incomingSegment.seqnum, incomingSegment.payload))
+
+    def storeRecovered(self, recovered):
+        """
+        Store and ack the segments the FEC decoder rebuilt, as if they had arrived
+        :param recovered: (seqnum, payload) pairs
+        """
+        for seqNum, payload in recovered:
+            # The decoder does not know the segments that arrived out of order before the first parity segment
+            if seqNum < self.receiveBuffer.contiguousEnd or seqNum in self.receiveWindow:
+                continue
+            self.recoveredSeen = True
+            if self.tracer.infoEnabled:
+                self.tracer.emit(trace.INFO, trace.RECOVER, self.currentIteration, seqNum, -1, len(payload))
+            self.acknowledge(seqNum, self.storeSegment(seqNum, payload))
+
+    def startDecompression(self, codecId):
+        """
+        Put a DecompressingSink between the receive buffer and the sink of main, the in-order bytes are compressed
+        :param codecId: codec id carried by the data segments, see Segment.FLAG_CODEC_MASK
+        """
+        self.decompressor = DecompressingSink(getCodecById(codecId), self.receiveBuffer.sink)
+        self.receiveBuffer.sink = self.decompressor.write
+
+    def acknowledge(self, ackNumber, inOrder):
+        """
+        Ack one data segment right away, or report it to the ack policy
+        :param ackNumber: seqnum the ack would carry without a policy
+        :param inOrder: the segment extended the in-order data and left no gap behind it
+        """
+        # Selective repeat without a policy acks every segment with all the server holds, any ack that gets through
+        # then also covers the acks lost before it
+        if self.ackPolicy is None:
+            if self.transferMode == RDTLayer.SELECTIVE_REPEAT:
+                self.sendCumulativeAck(AckPolicy.MAX_SACK_RANGES)
+            else:
+                self.sendAck(ackNumber)
+        # Without SACK ranges (and go-back-n never has any) one ack cannot tell how many segments arrived past a gap,
+        # those keep their own ack so the client still counts the duplicate acks that trigger fast retransmit
+        elif not inOrder and not self.isSackEnabled():
+            self.sendAck(ackNumber)
+        else:
+            self.ackPolicy.onSegment(inOrder, self.currentIteration)
+
+    def isSackEnabled(self):
+        return self.ackPolicy.sack and self.transferMode == RDTLayer.SELECTIVE_REPEAT
+
+    def sendCumulativeAck(self, maxSackRanges=None):
+        """
+        Send one ack for everything received so far, with the SACK ranges if the ack policy asks for them
+        :param maxSackRanges: SACK ranges to send at most, None takes them from the ack policy
+        """
+        if maxSackRanges is None and self.isSackEnabled():
+            maxSackRanges = self.ackPolicy.MAX_SACK_RANGES
+        sackRanges = self.getSackRanges()[:maxSackRanges] if maxSackRanges else None
+        if self.receiveBuffer.contiguousEnd > 0 or self.receiveBuffer.isFinished():
+            self.sendAck(self.serverLastSeqNum, True, sackRanges)
+        elif self.receiveWindow:
+            # Nothing in order yet, the ack of the first buffered segment still tells the client about the gap
+            self.sendAck(min(self.receiveWindow), False, sackRanges)
+
+    def sendWindowUpdate(self):
+        """Selective repeat: send the receive window after dropping a segment past it, with what has been received"""
+        if self.receiveBuffer.contiguousEnd > 0 or self.receiveWindow:
+            self.sendCumulativeAck(AckPolicy.MAX_SACK_RANGES)
+        else:
+            # Nothing to ack yet. acknum -1 would make the ack a data segment, NO_ACK names no segment.
+            self.sendAck(Segment.NO_ACK)
+
+    def getSackRanges(self):
+        """Return the (start, end) byte ranges of the out-of-order data in the receive window, in order"""
+        sackRanges = []
+        for seqNum in sorted(self.receiveWindow):
+            end = seqNum + self.receiveWindow[seqNum]
+            if sackRanges and sackRanges[-1][1] == seqNum:
+                sackRanges[-1][1] = end
+            else:
+                sackRanges.append([seqNum, end])
+        return sackRanges
+
+    def getAdvertisedWindow(self):
+        """
+        Return the receive window to advertise: flowControlWinSize less the out-of-order bytes held past contiguousEnd.
+        It does not go below one segment (or the whole window if that is smaller): the client measures the window from
+        its send base, which never passes contiguousEnd, so any value up to flowControlWinSize is safe, and a window of
+        a few bytes would only make it send tiny segments. 0 would mean no advertisement at all.
+        """
+        return max(self.flowControlWinSize - self.heldBytes, min(self.dataLength, self.flowControlWinSize))
+
+    def sendAck(self, ackNumber, cumulative=False, sackRanges=None):
+        """
+        Send an ack segment to the client
+        :param ackNumber: seqnum of the data segment being acknowledged
+        :param cumulative: the ack covers every segment up to and including ackNumber
+        :param sackRanges: (start, end) byte ranges received past the in-order data
+        """
+        segmentAck = segmentPool.acquire()
+        segmentAck.setAck(ackNumber, cumulative, sackRanges, self.getAdvertisedWindow(), self.checksumErrorSeen,
+                          self.recoveredSeen, self.checksumAlgorithm)
+        self.checksumErrorSeen = False
+        self.recoveredSeen = False
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.ACK_SEND, self.currentIteration, -1, ackNumber)
+        if self.metrics is not None:
+            self.metrics.acksSent.inc()
+        self.sendChannel.send(segmentAck)
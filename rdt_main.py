@@ -1,5 +1,8 @@
 from rdt_layer import *
 from unreliable import UnreliableChannel
+from rdt_trace import Tracer, StdoutSink, DEBUG
+from rdt_metrics import MetricsRegistry
+import os
 import time
 
 # #################################################################################################################### #
@@ -59,6 +62,31 @@ client.setReceiveChannel(serverToClientChannel)
 server.setSendChannel(serverToClientChannel)
 server.setReceiveChannel(clientToServerChannel)
 
+# Print every segment event, use level=rdt_trace.INFO for retransmissions only or leave the tracer out for no output
+tracer = Tracer([StdoutSink()], level=DEBUG)
+client.setTracer(tracer.withTag("main/client"))
+server.setTracer(tracer.withTag("main/server"))
+clientToServerChannel.setTracer(tracer.withTag("main/c2s"))
+serverToClientChannel.setTracer(tracer.withTag("main/s2c"))
+
+# Counters, gauges, histograms and phase timers of all four components, exported at the end when the environment
+# variable RDT_METRICS is set to prometheus or json
+metricsFormat = os.environ.get('RDT_METRICS')
+metrics = None
+if metricsFormat:
+    if metricsFormat not in ('prometheus', 'json'):
+        raise ValueError("RDT_METRICS must be prometheus or json, not {0}".format(metricsFormat))
+    metrics = MetricsRegistry()
+    client.setMetrics(metrics, {'component': 'client'})
+    server.setMetrics(metrics, {'component': 'server'})
+    clientToServerChannel.setMetrics(metrics, {'component': 'c2s'})
+    serverToClientChannel.setMetrics(metrics, {'component': 's2c'})
+
+# Both sides must use the same transfer mode: RDTLayer.GO_BACK_N or RDTLayer.SELECTIVE_REPEAT
+transferMode = RDTLayer.SELECTIVE_REPEAT
+client.setTransferMode(transferMode)
+server.setTransferMode(transferMode)
+
 # Set initial data that will be sent from client to server
 client.setDataToSend(dataToSend)
 
@@ -77,14 +105,19 @@ while True:
     serverToClientChannel.processData()
 
 
-    # show the data received so far
+    # show how much data has been received so far, the received string is only built once at the end
     print("Main--------------------------------------------")
-    dataReceivedFromClient = server.getDataReceived()
-    print("DataReceivedFromClient: {0}".format(dataReceivedFromClient))
+    print("DataReceivedFromClient: {0} of {1} bytes".format(server.getDataReceivedLength(),
+                                                            client.getDataToSendLength()))
 
-    if dataReceivedFromClient == dataToSend:
+    if server.isComplete(client.getDataToSendLength()):
+        dataReceivedFromClient = server.getDataReceived()
+        print("DataReceivedFromClient: {0}".format(dataReceivedFromClient))
 
-        print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+        if dataReceivedFromClient == dataToSend:
+            print('$$$$$$$$ ALL DATA RECEIVED $$$$$$$$')
+        else:
+            print('######## DATA RECEIVED DOES NOT MATCH ########')
         break
 
     #time.sleep(1)
@@ -100,5 +133,9 @@ print("countAckPackets: {0}".format(serverToClientChannel.countAckPackets))
 print("countDroppedAckPackets: {0}".format(serverToClientChannel.countDroppedPackets))
 
 print("# segment timeouts: {0}".format(client.countSegmentTimeouts))
+print("RTT estimates (iterations): {0}".format(client.getRTTEstimates()))
 
 print("TOTAL ITERATIONS: {0}".format(loopIter))
+
+if metrics is not None:
+    print(metrics.toJson(loopIter, indent=2) if metricsFormat == 'json' else metrics.toPrometheus())
@@ -0,0 +1,316 @@
+import bisect
+import json
+import time
+
+
+# #################################################################################################################### #
+# Metrics                                                                                                              #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# A registry of counters, gauges and histograms for RDTLayer and UnreliableChannel. A snapshot can be taken at any     #
+# iteration and exported as Prometheus text or JSON. PhaseTimer accumulates the wall-clock time spent in each step of  #
+# processData().                                                                                                       #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Counters and gauges can read their value from a function, so state the layer and channel already keep (count*        #
+# attributes, window sizes) costs nothing until a snapshot is taken. Layers and channels without a registry skip all   #
+# of this with a single "is None" check.                                                                               #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+# Histogram bucket upper bounds
+ITERATION_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16, 24, 32, 64)
+RETRANSMIT_BUCKETS = (0, 1, 2, 3, 5, 8, 13)
+SIZE_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 4096, 16384, 65536)
+
+
+class Counter(object):
+    """A value that only goes up"""
+
+    def __init__(self, function=None):
+        """:param function: called without arguments to read the value, instead of counting with inc()"""
+        self.count = 0
+        self.function = function
+
+    def inc(self, amount=1):
+        self.count += amount
+
+    def getValue(self):
+        if self.function is not None:
+            return self.function()
+        return self.count
+
+
+class Gauge(object):
+    """A value that goes up and down"""
+
+    def __init__(self, function=None):
+        """:param function: called without arguments to read the value, instead of setting it with set()"""
+        self.value = 0
+        self.function = function
+
+    def set(self, value):
+        self.value = value
+
+    def getValue(self):
+        if self.function is not None:
+            return self.function()
+        return self.value
+
+
+class Histogram(object):
+    """Counts observations per bucket, a value goes into the first bucket whose upper bound is not below it"""
+
+    def __init__(self, buckets=SIZE_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)     # The last one is the +Inf bucket
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def getValue(self):
+        """Return the cumulative bucket counts, sum and count like Prometheus does"""
+        cumulative = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative.append((bound, total))
+        return {'buckets': cumulative, 'sum': self.sum, 'count': self.count}
+
+
+class MetricsRegistry(object):
+
+    def __init__(self):
+        # name -> [type, description, {sorted label items -> metric}]
+        self.families = {}
+
+    def counter(self, name, description, labels=None, function=None):
+        return self.register(name, COUNTER, description, labels, lambda: Counter(function))
+
+    def gauge(self, name, description, labels=None, function=None):
+        return self.register(name, GAUGE, description, labels, lambda: Gauge(function))
+
+    def histogram(self, name, description, labels=None, buckets=SIZE_BUCKETS):
+        return self.register(name, HISTOGRAM, description, labels, lambda: Histogram(buckets))
+
+    def register(self, name, metricType, description, labels, factory):
+        """
+        Return the metric of a family for a set of labels, creating both if needed
+        :param name: family name, e.g. rdt_segments_sent_total
+        :param metricType: COUNTER, GAUGE or HISTOGRAM
+        :param description: one line description of the family
+        :param labels: dictionary of label names to values, e.g. {'component': 'client'}
+        :param factory: creates the metric when this set of labels is new
+        """
+        family = self.families.get(name)
+        if family is None:
+            family = self.families[name] = [metricType, description, {}]
+        elif family[0] != metricType:
+            raise ValueError("Metric {0} is a {1}, not a {2}".format(name, family[0], metricType))
+
+        key = tuple(sorted((labels or {}).items()))
+        metric = family[2].get(key)
+        if metric is None:
+            metric = family[2][key] = factory()
+        return metric
+
+    def snapshot(self, iteration=None):
+        """
+        Read every metric
+        :param iteration: stored with the snapshot to tell snapshots apart
+        :return: dictionary with the iteration, the wall-clock time and a list of metrics
+        """
+        metrics = []
+        for name, (metricType, description, members) in sorted(self.families.items()):
+            for key, metric in members.items():
+                metrics.append({'name': name, 'type': metricType, 'labels': dict(key), 'value': metric.getValue()})
+        return {'iteration': iteration, 'time': time.time(), 'metrics': metrics}
+
+    def toJson(self, iteration=None, indent=None):
+        return json.dumps(self.snapshot(iteration), indent=indent)
+
+    def toPrometheus(self):
+        """Return every metric in the Prometheus text exposition format"""
+        lines = []
+        for name, (metricType, description, members) in sorted(self.families.items()):
+            lines.append("# HELP {0} {1}".format(name, description))
+            lines.append("# TYPE {0} {1}".format(name, metricType))
+            for key, metric in members.items():
+                value = metric.getValue()
+                if metricType != HISTOGRAM:
+                    lines.append("{0}{1} {2}".format(name, formatLabels(key), value))
+                    continue
+                for bound, count in value['buckets']:
+                    lines.append("{0}_bucket{1} {2}".format(name, formatLabels(key + (('le', bound),)), count))
+                lines.append("{0}_sum{1} {2}".format(name, formatLabels(key), value['sum']))
+                lines.append("{0}_count{1} {2}".format(name, formatLabels(key), value['count']))
+        return '\n'.join(lines) + '\n'
+
+
+def formatLabels(items):
+    """Return label items as {name="value",...}, or nothing without labels"""
+    if not items:
+        return ''
+    escaped = ('{0}="{1}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+               for name, value in items)
+    return '{' + ','.join(escaped) + '}'
+
+
+class PhaseTimer(object):
+    """Adds the time between consecutive laps to a counter per phase"""
+
+    def __init__(self, registry, labels=None):
+        self.registry = registry
+        self.labels = dict(labels or {})
+        self.counters = {}
+        self.lastTime = 0.0
+
+    def start(self):
+        self.lastTime = time.perf_counter()
+
+    def lap(self, phase):
+        """Charge the time since start() or the previous lap to phase"""
+        now = time.perf_counter()
+        counter = self.counters.get(phase)
+        if counter is None:
+            labels = dict(self.labels, phase=phase)
+            counter = self.counters[phase] = self.registry.counter(
+                'rdt_phase_seconds_total', "Wall-clock seconds spent in each phase of processData()", labels)
+        counter.inc(now - self.lastTime)
+        self.lastTime = now
+
+
+# #################################################################################################################### #
+# LayerMetrics                                                                                                         #
+# #################################################################################################################### #
+
+
+class LayerMetrics(object):
+    """
+    The metrics of one RDTLayer, see RDTLayer.setMetrics(). The send side metrics are registered for a client and the
+    receive side metrics for a server, once bind() sees which of the two the layer is
+    """
+
+    def __init__(self, registry, layer, labels=None):
+        """
+        :param registry: MetricsRegistry the metrics are added to
+        :param layer: the RDTLayer, read by the function based metrics
+        :param labels: labels of every metric of this layer, e.g. {'connection': 'main', 'component': 'client'}
+        """
+        self.registry = registry
+        self.labels = labels = dict(labels or {})
+        self.isClient = None                # None until bind()
+        self.phaseTimer = PhaseTimer(registry, labels)
+        registry.counter('rdt_iterations_total', "Iterations run", labels, lambda: layer.currentIteration)
+
+    def bind(self, layer):
+        """
+        Register the metrics of the role of the layer, called by RDTLayer.processData() every iteration. The role is
+        only known once main has called setDataToSend() or not, after setMetrics()
+        """
+        if self.isClient is not None:
+            return
+        self.isClient = layer.thisIsClient is True and layer.thisIsServer is False
+        if self.isClient:
+            self.bindClient(layer)
+        else:
+            self.bindServer(layer)
+
+    def bindClient(self, layer):
+        """Register the send side metrics"""
+        registry = self.registry
+        labels = self.labels
+
+        # Updated by the layer
+        self.segmentsSent = registry.counter('rdt_segments_sent_total', "Data segments sent for the first time",
+                                             labels)
+        self.retransmissions = registry.counter('rdt_retransmissions_total', "Data segments sent again", labels)
+        self.fastRetransmits = registry.counter('rdt_fast_retransmits_total',
+                                                "Segments resent after duplicate acks", labels)
+        self.acksReceived = registry.counter('rdt_acks_received_total', "Ack segments received", labels)
+        self.rtt = registry.histogram('rdt_rtt_iterations', "Measured round trip times", labels, ITERATION_BUCKETS)
+        self.retransmitsPerSegment = registry.histogram('rdt_retransmits_per_segment',
+                                                        "Retransmissions of each segment until it was acked", labels,
+                                                        RETRANSMIT_BUCKETS)
+
+        # Sampled once per iteration
+        self.windowOccupancy = registry.histogram('rdt_send_window_occupancy_segments',
+                                                  "Un-acked segments in the send window, per iteration", labels)
+
+        # Read from the layer when a snapshot is taken
+        registry.counter('rdt_segment_timeouts_total', "Retransmission timer expirations", labels,
+                         lambda: layer.countSegmentTimeouts)
+        registry.gauge('rdt_send_window_segments', "Un-acked segments in the send window", labels,
+                       lambda: len(layer.sendWindow) if layer.sendWindow is not None else 0)
+        registry.gauge('rdt_segments_in_flight', "Segments sent and not acked yet", labels,
+                       lambda: layer.segmentsInFlight)
+        registry.gauge('rdt_congestion_window_segments', "Congestion window", labels,
+                       lambda: layer.congestionController.getWindow())
+        registry.gauge('rdt_segment_size_bytes', "Payload size of the next segment", labels,
+                       lambda: layer.segmenter.sizer.getSize() if layer.segmenter is not None else 0)
+        registry.gauge('rdt_peer_window_bytes', "Receive window the server advertised last", labels,
+                       lambda: layer.peerWindow or 0)
+        registry.gauge('rdt_rto_iterations', "Current retransmission timeout", labels,
+                       lambda: layer.rtoEstimator.rto if layer.rtoEstimator is not None else 0)
+
+    def bindServer(self, layer):
+        """Register the receive side metrics"""
+        registry = self.registry
+        labels = self.labels
+
+        # Updated by the layer
+        self.acksSent = registry.counter('rdt_acks_sent_total', "Ack segments sent", labels)
+
+        # Sampled once per iteration
+        self.receiveWindowOccupancy = registry.histogram('rdt_receive_window_occupancy_bytes',
+                                                         "Out-of-order bytes held by the receiver, per iteration",
+                                                         labels)
+        self.goodput = registry.histogram('rdt_goodput_bytes_per_iteration',
+                                          "Bytes delivered in order, per iteration", labels)
+        self.lastDelivered = 0
+
+        # Read from the layer when a snapshot is taken
+        registry.counter('rdt_bytes_delivered_total', "Bytes received in order", labels,
+                         lambda: layer.receiveBuffer.contiguousEnd)
+        registry.gauge('rdt_receive_window_bytes', "Out-of-order bytes held by the receiver", labels,
+                       lambda: sum(layer.receiveWindow.values()))
+
+    def sample(self, layer):
+        """Record the per-iteration histograms, called at the end of RDTLayer.processData()"""
+        if self.isClient:
+            self.windowOccupancy.observe(len(layer.sendWindow) if layer.sendWindow is not None else 0)
+        else:
+            delivered = layer.receiveBuffer.contiguousEnd
+            self.goodput.observe(delivered - self.lastDelivered)
+            self.lastDelivered = delivered
+            self.receiveWindowOccupancy.observe(sum(layer.receiveWindow.values()))
+
+
+def addChannelMetrics(registry, channel, labels=None):
+    """
+    Export the statistics of an UnreliableChannel, read from its count* attributes when a snapshot is taken
+    :param registry: MetricsRegistry the metrics are added to
+    :param channel: the UnreliableChannel
+    :param labels: labels of every metric of this channel, e.g. {'connection': 'main', 'component': 'c2s'}
+    """
+    for name, attribute, description in (
+            ('rdt_channel_data_packets_total', 'countTotalDataPackets', "Data segments carried"),
+            ('rdt_channel_ack_packets_total', 'countAckPackets', "Ack segments carried"),
+            ('rdt_channel_delivered_packets_total', 'countSentPackets', "Segments delivered"),
+            ('rdt_channel_dropped_packets_total', 'countDroppedPackets', "Segments dropped"),
+            ('rdt_channel_delayed_packets_total', 'countDelayedPackets', "Segments delayed"),
+            ('rdt_channel_checksum_error_packets_total', 'countChecksumErrorPackets', "Segments corrupted"),
+            ('rdt_channel_out_of_order_total', 'countOutOfOrderPackets', "Send queues delivered in reverse order")):
+        registry.counter(name, description, labels, lambda attribute=attribute: getattr(channel, attribute))
+    registry.gauge('rdt_channel_delayed_queue_packets', "Segments held back by the channel right now", labels,
+                   lambda: len(channel.delayedPackets))
@@ -0,0 +1,87 @@
+import codecs
+
+
+# #################################################################################################################### #
+# ReceiveBuffer                                                                                                        #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Server-side reassembly buffer. Every accepted payload is written once, at its seqnum offset, into a preallocated     #
+# bytearray. contiguousEnd marks how much of the buffer is received in order, so checking for completion does not      #
+# copy anything and the received string is only built when somebody asks for it.                                       #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Seqnums count bytes, so they are buffer offsets. Text is utf-8, see Segment.TEXT_ENCODING.                           #
+# With a sink, flush() hands the in-order bytes to it and drops them from the buffer, which then only holds the        #
+# receive window and baseOffset is the seqnum of its first byte.                                                       #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class ReceiveBuffer(object):
+    INITIAL_CAPACITY = 4096         # in bytes, the buffer doubles when a segment does not fit
+    ENCODING = 'utf-8'
+
+    __slots__ = ('buffer', 'contiguousEnd', 'baseOffset', 'highestEnd', 'finalLength', 'sink')
+
+    def __init__(self, capacity=INITIAL_CAPACITY):
+        self.buffer = bytearray(capacity)
+        self.contiguousEnd = 0      # Everything below this offset has been received in order
+        self.baseOffset = 0         # Offset of buffer[0], everything below it went to the sink
+        self.highestEnd = 0         # End of the furthest payload written so far
+        self.finalLength = None     # Length of the stream, once its FIN segment has arrived
+        self.sink = None            # Function that receives the in-order bytes, see flush()
+
+    def write(self, offset, payload):
+        """
+        Copy a payload into the buffer at its offset, this does not make it part of the in-order data yet
+        :param offset: seqnum of the segment
+        :param payload: the segment payload
+        """
+        if isinstance(payload, str):
+            payload = payload.encode(self.ENCODING)
+
+        start = offset - self.baseOffset
+        end = start + len(payload)
+        if end > len(self.buffer):
+            self.buffer.extend(bytes(max(end, 2 * len(self.buffer)) - len(self.buffer)))
+
+        self.buffer[start:end] = payload
+        self.highestEnd = max(self.highestEnd, offset + len(payload))
+
+    def advance(self, length):
+        """
+        Mark the next length bytes after the in-order data as received
+        :param length: payload length of the segment that starts at contiguousEnd
+        """
+        self.contiguousEnd += length
+
+    def isComplete(self, expectedLength):
+        """Return True if the first expectedLength bytes have been received in order"""
+        return self.contiguousEnd >= expectedLength
+
+    def isFinished(self):
+        """Return True once a stream has been received in order up to its FIN segment"""
+        return self.finalLength is not None and self.contiguousEnd >= self.finalLength
+
+    def getBytes(self):
+        """Return a copy of the in-order data that has not gone to the sink, as bytes"""
+        return bytes(memoryview(self.buffer)[:self.contiguousEnd - self.baseOffset])
+
+    def getText(self):
+        """Return the in-order data as a string, a character that is not complete yet is left out"""
+        decoder = codecs.getincrementaldecoder(self.ENCODING)()
+        return decoder.decode(memoryview(self.buffer)[:self.contiguousEnd - self.baseOffset], final=False)
+
+    def flush(self):
+        """Hand the in-order bytes to the sink and move the out-of-order ones to the front of the buffer"""
+        length = self.contiguousEnd - self.baseOffset
+        if length <= 0:
+            return
+
+        self.sink(bytes(memoryview(self.buffer)[:length]))
+
+        remaining = self.highestEnd - self.contiguousEnd
+        if remaining > 0:
+            self.buffer[:remaining] = self.buffer[length:length + remaining]
+        self.baseOffset = self.contiguousEnd
@@ -0,0 +1,152 @@
+# #################################################################################################################### #
+# SegmentationEngine                                                                                                   #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Sender-side segmentation. Instead of slicing the whole payload into Segment objects on every iteration, the engine   #
+# keeps a cursor into the data and cuts the next chunk only when the sender window has room for it.                    #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# A segment sizer picks the size of each chunk (in bytes). FixedSegmentSizer repeats the pattern of                    #
+# RDTLayer.calculatePacketSizes(), e.g. [4, 4, 4, 3]. AdaptiveSegmentSizer grows the segments while the server         #
+# reports no checksum errors and halves them after one, so a corrupt segment costs less to send again. Both are        #
+# capped by limit, the receive window the server advertises, see RDTLayer.setSegmentSizer().                           #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class PendingSegment(object):
+    """Sender-side record of a segment that has entered the window but has not been acknowledged yet"""
+
+    __slots__ = ('seqnum', 'payload', 'acked', 'sendIteration', 'expiry', 'retransmissions', 'fin')
+
+    def __init__(self, seqnum, payload):
+        self.seqnum = seqnum
+        self.payload = payload
+        self.acked = False          # Set when the segment is ack'ed, individually or cumulatively
+        self.sendIteration = 0      # Iteration of the last (re)transmission
+        self.expiry = 0             # Iteration at which the retransmission timer fires
+        self.retransmissions = 0
+        self.fin = False            # Marks the end of a stream, see rdt_stream.py
+
+
+class SegmentSizer(object):
+    """Interface of a segment sizer, the feedback methods are called by RDTLayer on the client side"""
+
+    def __init__(self):
+        self.limit = None           # Largest size allowed, the receive window of the server
+
+    def getSize(self):
+        """Return the payload size of the next segment"""
+        raise NotImplementedError
+
+    def advance(self):
+        """Called after a segment of getSize() bytes has been cut"""
+        pass
+
+    def onAck(self, countAcked):
+        """
+        Called when segments are ack'ed for the first time
+        :param countAcked: number of segments newly ack'ed
+        """
+        pass
+
+    def onChecksumError(self):
+        """Called when an ack reports that the server discarded a corrupt segment"""
+        pass
+
+
+class FixedSegmentSizer(SegmentSizer):
+    """Repeats a pattern of sizes, this is how the client used to cut its segments"""
+
+    def __init__(self, packetSizes):
+        """
+        :param packetSizes: repeating list of chunk sizes, see RDTLayer.calculatePacketSizes()
+        """
+        super(FixedSegmentSizer, self).__init__()
+        self.packetSizes = packetSizes
+        self.sizeIndex = 0          # Position in packetSizes for the next chunk
+
+    def getSize(self):
+        size = self.packetSizes[self.sizeIndex]
+        if self.limit is not None:
+            return min(size, self.limit)
+        return size
+
+    def advance(self):
+        self.sizeIndex = (self.sizeIndex + 1) % len(self.packetSizes)
+
+
+class AdaptiveSegmentSizer(SegmentSizer):
+    """
+    AIMD on the segment size: grows by GROWTH per ack'ed segment up to threshold and by minSize per ack'ed segment
+    above it, a checksum error halves both the size and threshold
+    """
+
+    GROWTH = 1.25
+
+    def __init__(self, minSize=4, maxSize=1024, initialSize=None):
+        """
+        :param minSize: smallest segment payload in bytes
+        :param maxSize: largest segment payload in bytes
+        :param initialSize: size of the first segments, default minSize
+        """
+        super(AdaptiveSegmentSizer, self).__init__()
+        self.minSize = minSize
+        self.maxSize = maxSize
+        self.size = float(initialSize or minSize)
+        self.threshold = float(maxSize)
+
+    def getSize(self):
+        size = max(int(self.size), self.minSize)
+        if self.limit is not None:
+            return max(min(size, self.limit), 1)
+        return size
+
+    def onAck(self, countAcked):
+        for _ in range(countAcked):
+            if self.size < self.threshold:
+                self.size *= self.GROWTH
+            else:
+                self.size += self.minSize
+        self.size = min(self.size, self.maxSize)
+
+    def onChecksumError(self):
+        self.threshold = max(self.size / 2, self.minSize)
+        self.size = self.threshold
+
+
+class SegmentationEngine(object):
+
+    def __init__(self, data, sizer):
+        """
+        :param data: the complete data to send, as bytes
+        :param sizer: SegmentSizer that picks the size of every chunk
+        """
+        self.data = data
+        self.sizer = sizer
+        self.cursor = 0             # Offset of the first byte that has not been cut into a segment yet
+        self.countSegments = 0      # Number of distinct segments cut so far
+
+    def hasMoreData(self):
+        """Return True if there is data left that has not entered the window yet"""
+        return self.cursor < len(self.data)
+
+    def nextSegmentSize(self):
+        """Return the payload length of the segment nextSegment() would cut"""
+        return min(self.sizer.getSize(), len(self.data) - self.cursor)
+
+    def nextSegment(self):
+        """
+        Cut the next chunk from the data and advance the cursor
+        :return: a PendingSegment whose seqnum is the offset of its first byte
+        """
+        size = self.sizer.getSize()
+        self.sizer.advance()
+
+        seqnum = self.cursor
+        payload = self.data[seqnum:seqnum + size]
+        self.cursor += len(payload)
+        self.countSegments += 1
+
+        return PendingSegment(seqnum, payload)
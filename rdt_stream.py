@@ -0,0 +1,166 @@
+import io
+import mmap
+
+from rdt_segmenter import PendingSegment
+
+
+# #################################################################################################################### #
+# Streaming sources                                                                                                    #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Data sources for RDTLayer.setDataSource(), for payloads that are too large to hold in memory or that do not exist    #
+# yet when the transfer starts. StreamSegmentationEngine reads the next segment from its source only when the send     #
+# window has room for it, so the producer is paused (backpressure) while the window is full: a generator is not        #
+# resumed and a file is not read ahead of the window.                                                                  #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# The length of a stream is not known in advance, the client ends it with a FIN segment (empty payload, seqnum = total #
+# length) and the server reports the end with RDTLayer.isFinished(). See RDTLayer.setDataSink() for the receive side.  #
+# In rdt_main, stream a file of any length instead of calling client.setDataToSend() and write it out as it arrives,   #
+# running the loop until server.isFinished() instead of comparing the received data:                                   #
+#     client.setDataSource(open(inputPath, 'rb'))                                                                      #
+#     server.setDataSink(open(outputPath, 'wb'))                                                                       #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class BytesSource(object):
+    """Reads from a bytes-like object, e.g. an mmap of a file, without copying more than one segment at a time"""
+
+    def __init__(self, data):
+        self.view = memoryview(data).cast('B')
+        self.position = 0
+
+    def read(self, size):
+        chunk = bytes(self.view[self.position:self.position + size])
+        self.position += len(chunk)
+        return chunk
+
+
+class FileSource(object):
+    """Reads from a file-like object, text files are utf-8 encoded"""
+
+    ENCODING = 'utf-8'
+
+    def __init__(self, file):
+        self.file = file
+        self.pending = b''          # Encoded text that did not fit in the previous read
+
+    def read(self, size):
+        chunks = [self.pending]
+        length = len(self.pending)
+        while length < size:
+            chunk = self.file.read(size - length)
+            if not chunk:
+                break
+            if isinstance(chunk, str):
+                chunk = chunk.encode(self.ENCODING)
+            chunks.append(chunk)
+            length += len(chunk)
+
+        data = b''.join(chunks)
+        self.pending = data[size:]
+        return data[:size]
+
+
+class IteratorSource(object):
+    """Reads from an iterator of chunks (bytes or str), the next chunk is only requested when it is needed"""
+
+    ENCODING = 'utf-8'
+
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.current = b''
+        self.offset = 0
+
+    def read(self, size):
+        parts = []
+        length = 0
+        while length < size:
+            if self.offset >= len(self.current):
+                chunk = next(self.chunks, None)
+                if chunk is None:
+                    break
+                if isinstance(chunk, str):
+                    chunk = chunk.encode(self.ENCODING)
+                self.current = chunk
+                self.offset = 0
+                continue
+
+            part = self.current[self.offset:self.offset + size - length]
+            self.offset += len(part)
+            parts.append(part)
+            length += len(part)
+        return b''.join(parts)
+
+
+def openSource(source):
+    """
+    Wrap an object in the matching source
+    :param source: an mmap or bytes-like object, a file-like object with read(), or an iterable of chunks
+    """
+    if isinstance(source, (bytes, bytearray, memoryview, mmap.mmap)):
+        return BytesSource(source)
+    if isinstance(source, (BytesSource, FileSource, IteratorSource)):
+        return source
+    if hasattr(source, 'read'):
+        return FileSource(source)
+    if isinstance(source, str):
+        return FileSource(io.StringIO(source))
+    return IteratorSource(source)
+
+
+class StreamSegmentationEngine(object):
+    """SegmentationEngine for a source of unknown length, see rdt_segmenter.py"""
+
+    def __init__(self, source, sizer):
+        """
+        :param source: object with read(size) that returns exactly size bytes, fewer only at the end, see openSource()
+        :param sizer: SegmentSizer that picks the size of every chunk, see rdt_segmenter.py
+        """
+        self.source = source
+        self.sizer = sizer
+        self.cursor = 0             # Offset of the first byte that has not been cut into a segment yet
+        self.countSegments = 0      # Number of distinct segments cut so far
+        self.lookahead = b''        # Data of the next segment, read early to find out whether the stream has ended
+        self.endOfStream = False
+        self.finCut = False
+
+    def fill(self):
+        if not self.lookahead and not self.endOfStream:
+            self.lookahead = self.source.read(self.sizer.getSize())
+            if not self.lookahead:
+                self.endOfStream = True
+
+    def hasMoreData(self):
+        """Return True until the FIN segment has entered the window"""
+        self.fill()
+        return bool(self.lookahead) or not self.finCut
+
+    def nextSegmentSize(self):
+        self.fill()
+        return min(len(self.lookahead), self.sizer.getSize())
+
+    def nextSegment(self):
+        """
+        Cut the next chunk from the source, or the FIN segment once the source is exhausted
+        :return: a PendingSegment whose seqnum is the offset of its first byte
+        """
+        self.fill()
+        seqnum = self.cursor
+
+        # The size may have shrunk since the lookahead was read, the rest waits for the next segment
+        size = self.sizer.getSize()
+        payload = self.lookahead[:size]
+        self.lookahead = self.lookahead[size:]
+        self.countSegments += 1
+
+        pendingSegment = PendingSegment(seqnum, payload)
+        if payload:
+            self.sizer.advance()
+            self.cursor += len(payload)
+        else:
+            pendingSegment.fin = True
+            self.finCut = True
+        return pendingSegment
@@ -0,0 +1,184 @@
+import argparse
+import itertools
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from rdt_bench import IMPAIRMENT_PROFILES, KB, Scenario, runScenario
+from rdt_layer import RDTLayer
+
+
+# #################################################################################################################### #
+# Parameter sweep                                                                                                      #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Runs the seeded benchmark scenarios of rdt_bench for every combination of DATA_LENGTH, FLOW_CONTROL_WIN_SIZE,        #
+# transfer mode, impairment profile and seed, spread over a ProcessPoolExecutor with one worker per core. Every        #
+# scenario carries its whole configuration (segment sizes, channel ratios, seed), so runs share no class attributes.   #
+# Results are appended to a JSON lines store as they come back, and scenarios already in the store are skipped, so an  #
+# interrupted sweep picks up where it stopped. At the end the best configuration of each impairment profile is shown.  #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# python rdt_sweep.py --store sweep.jsonl --data-lengths 4 16 64 --windows 15 64 256 --seeds 0 1 2                     #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+def getScenarioKey(values):
+    """Return a string that identifies a scenario by its configuration, from its toDict() or a stored result"""
+    return json.dumps([values.get(field) for field in Scenario.FIELDS if field != 'name'])
+
+
+class ResultStore(object):
+    """Results of a sweep, one JSON object per line, appended and flushed as each run finishes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.results = []
+        self.keys = set()
+
+        if path is None or not os.path.exists(path):
+            return
+
+        with open(path) as file:
+            content = file.read()
+
+        # The last line of an interrupted sweep may be cut short, it is removed and that run is simply done again
+        if content and not content.endswith('\n'):
+            content = content[:content.rfind('\n') + 1]
+            with open(path, 'w') as file:
+                file.write(content)
+
+        for line in content.splitlines():
+            if line.strip():
+                result = json.loads(line)
+                self.results.append(result)
+                self.keys.add(getScenarioKey(result))
+
+    def contains(self, scenario):
+        return getScenarioKey(scenario.toDict()) in self.keys
+
+    def add(self, result):
+        self.results.append(result)
+        self.keys.add(getScenarioKey(result))
+        if self.path is not None:
+            with open(self.path, 'a') as file:
+                file.write(json.dumps(result) + '\n')
+
+
+def buildSweep(payloadSize, dataLengths, windows, profiles, seeds, transferModes, batched=False):
+    """Return a scenario for every combination of the parameters, segments larger than the window are left out"""
+    scenarios = []
+    for dataLength, window, profile, transferMode, seed in itertools.product(dataLengths, windows, profiles,
+                                                                             transferModes, seeds):
+        if dataLength > window:
+            continue
+        name = "{0}B-{1}-d{2}-w{3}-{4}-s{5}".format(payloadSize, profile, dataLength, window, transferMode, seed)
+        scenarios.append(Scenario(name, payloadSize, seed, profile, dataLength, window, transferMode,
+                                  batched=batched))
+    return scenarios
+
+
+def runSweep(scenarios, store, workers=None, progress=None):
+    """
+    Run the scenarios that are not in the store yet, in parallel
+    :param scenarios: list of Scenario
+    :param store: ResultStore every result is added to as soon as it arrives
+    :param workers: number of worker processes, default one per core
+    :param progress: called with (result, done, total) after every run
+    :return: the results of this call, in completion order
+    """
+    remaining = [scenario for scenario in scenarios if not store.contains(scenario)]
+    results = []
+    if not remaining:
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(runScenario, scenario) for scenario in remaining]
+        for future in as_completed(futures):
+            result = future.result()
+            store.add(result)
+            results.append(result)
+            if progress is not None:
+                progress(result, len(results), len(remaining))
+
+    return results
+
+
+def findBestConfigurations(results):
+    """
+    Average the goodput of each configuration over its seeds and pick the best one per impairment profile
+    :param results: results of runScenario(), runs that did not deliver every byte count as 0 goodput
+    :return: dictionary impairment -> summary of its best configuration
+    """
+    runs = {}
+    for result in results:
+        configuration = (result['impairment'], result['dataLength'], result['flowControlWinSize'],
+                         result['transferMode'])
+        runs.setdefault(configuration, []).append(result)
+
+    best = {}
+    for (impairment, dataLength, window, transferMode), configurationRuns in runs.items():
+        goodput = sum(run['goodputBytesPerIteration'] if run['verified'] else 0.0
+                      for run in configurationRuns) / len(configurationRuns)
+        if impairment in best and best[impairment]['goodputBytesPerIteration'] >= goodput:
+            continue
+        best[impairment] = {
+            'dataLength': dataLength,
+            'flowControlWinSize': window,
+            'transferMode': transferMode,
+            'goodputBytesPerIteration': goodput,
+            'meanIterations': sum(run['iterations'] for run in configurationRuns) / len(configurationRuns),
+            'retransmissionOverhead':
+                sum(run['retransmissionOverhead'] for run in configurationRuns) / len(configurationRuns),
+            'runs': len(configurationRuns),
+            'failed': sum(1 for run in configurationRuns if not run['verified']),
+        }
+    return best
+
+
+def printProgress(result, done, total):
+    print("[{0}/{1}] {2:<44} iterations={3:<8} goodput={4:>9.2f} B/it{5}".format(
+        done, total, result['name'], result['iterations'], result['goodputBytesPerIteration'],
+        '' if result['verified'] else '  FAILED'))
+    sys.stdout.flush()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep RDTLayer parameters over seeded scenarios in parallel")
+    parser.add_argument('--size', type=int, default=10 * KB, help="payload bytes of every run")
+    parser.add_argument('--data-lengths', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    parser.add_argument('--windows', type=int, nargs='+', default=[15, 32, 64, 128, 256])
+    parser.add_argument('--profiles', nargs='+', default=sorted(IMPAIRMENT_PROFILES),
+                        choices=sorted(IMPAIRMENT_PROFILES))
+    parser.add_argument('--modes', nargs='+', default=[RDTLayer.SELECTIVE_REPEAT, RDTLayer.GO_BACK_N],
+                        choices=[RDTLayer.SELECTIVE_REPEAT, RDTLayer.GO_BACK_N])
+    parser.add_argument('--seeds', type=int, nargs='+', default=[0, 1, 2])
+    parser.add_argument('--workers', type=int, help="worker processes, default one per core")
+    parser.add_argument('--batched', action='store_true', help="draw channel impairments in batches (needs NumPy)")
+    parser.add_argument('--store', help="JSON lines file the results are appended to, existing runs are skipped")
+    args = parser.parse_args(argv)
+
+    store = ResultStore(args.store)
+    scenarios = buildSweep(args.size, args.data_lengths, args.windows, args.profiles, args.seeds, args.modes,
+                           args.batched)
+    print("{0} scenarios, {1} already in the store".format(len(scenarios), sum(map(store.contains, scenarios))))
+    runSweep(scenarios, store, args.workers, printProgress)
+
+    # Only the configurations of this sweep are compared, the store may hold others
+    keys = set(getScenarioKey(scenario.toDict()) for scenario in scenarios)
+    best = findBestConfigurations([result for result in store.results if getScenarioKey(result) in keys])
+    print("Best configuration per impairment profile:")
+    for impairment, summary in sorted(best.items()):
+        print("  {0:<8} DATA_LENGTH={1:<4} FLOW_CONTROL_WIN_SIZE={2:<5} {3:<3} goodput={4:.2f} B/it "
+              "iterations={5:.0f} overhead={6:.2f} ({7} runs, {8} failed)".format(
+                  impairment, summary['dataLength'], summary['flowControlWinSize'], summary['transferMode'],
+                  summary['goodputBytesPerIteration'], summary['meanIterations'], summary['retransmissionOverhead'],
+                  summary['runs'], summary['failed']))
+    return best
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+import heapq
+
+
+# #################################################################################################################### #
+# RetransmissionTimer                                                                                                  #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Keeps track of the segments the client has in flight, by the iteration they were last sent, and hands back the ones  #
+# whose timeout has expired so that only those are retransmitted.                                                      #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Deadlines live in a heap. Ack'ed or re-armed segments are not removed from the heap, their stale entries are simply  #
+# skipped when they reach the top. With a fixed timeout of one iteration, the round trip of an undelayed packet, the   #
+# timers resend every un-acked segment each iteration just like resending the whole window did. They only pay off with #
+# longer timeouts, e.g. on a slower link whose round trip RTOEstimator measures.                                       #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class RetransmissionTimer(object):
+
+    def __init__(self, rtoEstimator):
+        """
+        :param rtoEstimator: RTOEstimator that supplies the number of iterations to wait for an ack
+        """
+        self.rtoEstimator = rtoEstimator
+        self.deadlines = []         # heap of (expiry iteration, order, pending segment)
+        self.order = 0              # tie breaker, keeps segments with the same expiry in send order
+
+    def start(self, pendingSegment, iteration):
+        """
+        Arm (or re-arm) the timer of a segment that has just been sent
+        :param pendingSegment: the sender-side record of the segment
+        :param iteration: iteration in which the segment was sent
+        """
+        pendingSegment.sendIteration = iteration
+        expiry = iteration + self.rtoEstimator.getTimeout()
+        pendingSegment.expiry = expiry
+        self.order += 1
+        heapq.heappush(self.deadlines, (expiry, self.order, pendingSegment))
+
+    def popExpired(self, iteration):
+        """
+        Remove and return the in-flight segments whose timeout has expired
+        :param iteration: the current iteration
+        :return: a list of pending segments, in the order they were sent
+        """
+        listExpired = []
+
+        while self.deadlines and self.deadlines[0][0] <= iteration:
+            expiry, _, pendingSegment = heapq.heappop(self.deadlines)
+
+            # Skip entries of segments that were ack'ed or re-armed since
+            if pendingSegment.acked or pendingSegment.expiry != expiry:
+                continue
+
+            listExpired.append(pendingSegment)
+
+        return listExpired
+
+    def getNextExpiry(self):
+        """Return the iteration of the earliest pending deadline, or None if nothing is in flight"""
+        while self.deadlines:
+            expiry, _, pendingSegment = self.deadlines[0]
+            if pendingSegment.acked or pendingSegment.expiry != expiry:
+                heapq.heappop(self.deadlines)
+                continue
+            return expiry
+        return None
+
+
+# #################################################################################################################### #
+# RTOEstimator                                                                                                         #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Jacobson/Karels round trip time estimation, measured in iterations. The retransmission timeout follows the smoothed  #
+# RTT and its variation instead of being a fixed number, and is doubled on every timeout until an ack arrives.         #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Karn's rule: the caller must not feed samples of retransmitted segments, their acks are ambiguous. The timeout is    #
+# srtt + max(G, K * rttvar): on a steady link rttvar decays to zero, the clock granularity G keeps it above the RTT.   #
+# When the acks of an iteration are always processed before its timeouts, as in the lockstep loop of rdt_main, an ack  #
+# arriving one RTT after the send still beats the timer and G can be 0.                                                #
+# maxRTO bounds the backoff, it must be well above any RTT of the link or no segment is ever acked unambiguously.      #
+# maxBackoff bounds it tighter, as a factor of the estimate: on a channel whose losses are random rather than          #
+# congestion a longer timeout only delays the retransmission, RDTLayer uses 1 (no backoff). Before the first sample    #
+# only the doubling can find a timeout above the RTT, the bound starts with the estimate. Any ack of a new segment     #
+# ends the backoff, see onAck().                                                                                       #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class RTOEstimator(object):
+    ALPHA = 1 / 8                   # Gain of the smoothed RTT
+    BETA = 1 / 4                    # Gain of the RTT variation
+    K = 4                           # Weight of the variation in the timeout
+    MIN_RTO = 1                     # in iterations, one iteration is the round trip of an undelayed packet
+    MAX_RTO = 64                    # in iterations, default upper bound of the backoff
+    MAX_BACKOFF = None              # Factor over the estimate the backoff stops at, None for maxRTO only
+    CLOCK_GRANULARITY = 1           # in iterations, least margin of the timeout above the smoothed RTT
+
+    def __init__(self, initialRTO, maxRTO=MAX_RTO, granularity=CLOCK_GRANULARITY, maxBackoff=MAX_BACKOFF):
+        """
+        :param initialRTO: timeout used until the first round trip has been measured, in iterations
+        :param maxRTO: largest timeout the backoff reaches, in iterations
+        :param granularity: least margin of the timeout above the smoothed RTT, in iterations. 0 when the acks of an
+                            iteration are always processed before its timeouts, as in the lockstep loop of rdt_main
+        :param maxBackoff: factor over the estimate the backoff stops at, None lets it double up to maxRTO. It does
+                           not apply before the first sample
+        """
+        self.maxRTO = maxRTO
+        self.granularity = granularity
+        self.maxBackoff = maxBackoff
+        self.srtt = None            # Smoothed round trip time
+        self.rttvar = None          # Round trip time variation
+        self.lastRTT = None         # Most recent sample
+        self.rto = initialRTO
+        self.backoffIteration = 0   # Iteration of the last backoff
+        self.countSamples = 0
+        self.countBackoffs = 0
+
+    def addSample(self, rtt):
+        """
+        Update the estimates with a new round trip measurement
+        :param rtt: iterations between sending a segment (never retransmitted) and receiving its ack
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+        self.lastRTT = rtt
+        self.countSamples += 1
+
+        # A fresh sample also ends any exponential backoff
+        self.rto = self.computeRTO()
+
+    def computeRTO(self):
+        """Return the timeout of the current estimates, without backoff"""
+        return min(max(self.srtt + max(self.granularity, self.K * self.rttvar), self.MIN_RTO), self.maxRTO)
+
+    def onAck(self):
+        """
+        Called for every ack that acknowledges a segment for the first time. The path delivers again, so the backoff
+        ends even if Karn's rule kept the ack from being measured, as long as there is an estimate to go back to.
+        """
+        if self.srtt is not None:
+            self.rto = self.computeRTO()
+
+    def backoff(self, sendIteration, iteration):
+        """
+        Double the timeout after a retransmission timeout
+        :param sendIteration: iteration in which the expired segment was sent
+        :param iteration: the current iteration
+        :return: True if this timeout starts a new loss episode and the timeout was backed off
+        """
+        # Segments armed before the last backoff expire as part of the same loss episode. Doubling again for each of
+        # them would push the timeout to maxRTO after a single loss.
+        if sendIteration < self.backoffIteration:
+            return False
+
+        self.rto = min(self.rto * 2, self.maxRTO)
+        # Before the first sample the round trip is unknown and only the backoff can find a timeout above it
+        if self.maxBackoff is not None and self.srtt is not None:
+            self.rto = min(self.rto, self.computeRTO() * self.maxBackoff)
+        self.backoffIteration = iteration
+        self.countBackoffs += 1
+        return True
+
+    def getTimeout(self):
+        """
+        Return the timeout in whole iterations. Samples are whole iterations too, the fraction left by the decaying
+        variation of a steady link is rounded off instead of adding an iteration to every timeout.
+        """
+        return max(int(self.rto + 0.5), self.MIN_RTO)
+
+    def getEstimates(self):
+        """Return the live estimates as a dictionary, values are in iterations"""
+        return {
+            'srtt': self.srtt,
+            'rttvar': self.rttvar,
+            'lastRTT': self.lastRTT,
+            'rto': self.rto,
+            'samples': self.countSamples,
+            'backoffs': self.countBackoffs,
+        }
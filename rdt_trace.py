@@ -0,0 +1,217 @@
+import struct
+import sys
+from collections import deque
+
+
+# #################################################################################################################### #
+# Tracing                                                                                                              #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Structured events for RDTLayer and UnreliableChannel. A Tracer forwards events to its sinks (stdout, ring buffer,    #
+# binary trace file). Events are plain tuples, nothing is formatted until a sink that prints them receives them.       #
+# TraceReplayer rebuilds per-segment timelines (send, drop, delay, corrupt, ack, retransmit...) from a trace.          #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Call sites check the precomputed flags before building an event, e.g.                                                #
+#     if self.tracer.debugEnabled: self.tracer.emit(DEBUG, SEND, iteration, seqnum, acknum, length)                    #
+# so a disabled tracer costs one attribute lookup. Tags are "<connection>/<component>", e.g. "conn0/client".           #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+# Levels
+DEBUG = 10                          # Every segment: sends, acks, deliveries and channel decisions
+INFO = 20                           # Retransmissions and timeouts
+WARNING = 30                        # Discarded segments
+LEVEL_NAMES = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING'}
+
+# Event kinds
+SEND = 0                            # Client sends a segment for the first time
+RETRANSMIT = 1                      # Client sends a segment again
+FAST_RETRANSMIT = 2                 # Client resends a segment after duplicate acks
+TIMEOUT = 3                         # Retransmission timer of a segment expired
+ACK_SEND = 4                        # Server sends an ack
+ACK_RECEIVE = 5                     # Client receives an ack
+DELIVER = 6                         # Server accepts a data segment
+DISCARD = 7                         # Server drops a corrupt or unexpected data segment
+DROP = 8                            # Channel drops a segment
+DELAY = 9                           # Channel holds a segment back
+RELEASE = 10                        # Channel delivers a held back segment
+CORRUPT = 11                        # Channel corrupts a data segment
+REORDER = 12                        # Channel reverses the order of its send queue
+PARITY = 13                         # Client sends a parity segment, see rdt_fec.py
+RECOVER = 14                        # Server rebuilds a lost data segment from parity
+EVENT_NAMES = ('SEND', 'RETRANSMIT', 'FAST_RETRANSMIT', 'TIMEOUT', 'ACK_SEND', 'ACK_RECEIVE', 'DELIVER', 'DISCARD',
+               'DROP', 'DELAY', 'RELEASE', 'CORRUPT', 'REORDER', 'PARITY', 'RECOVER')
+
+# Positions in an event tuple
+EVENT_ITERATION, EVENT_LEVEL, EVENT_TAG, EVENT_KIND, EVENT_SEQNUM, EVENT_ACKNUM, EVENT_LENGTH = range(7)
+
+
+class Tracer(object):
+
+    def __init__(self, sinks=(), level=DEBUG, tag='rdt'):
+        """
+        :param sinks: objects with write(event) and close() that receive the events
+        :param level: events below this level are not emitted
+        :param tag: identifies the component in every event of this tracer
+        """
+        self.sinks = list(sinks)
+        self.level = level
+        self.tag = tag
+
+        active = bool(self.sinks)
+        self.debugEnabled = active and level <= DEBUG
+        self.infoEnabled = active and level <= INFO
+        self.warningEnabled = active and level <= WARNING
+
+    def withTag(self, tag):
+        """Return a tracer with the same sinks and level for another component"""
+        return Tracer(self.sinks, self.level, tag)
+
+    def emit(self, level, kind, iteration, seqnum=-1, acknum=-1, length=0):
+        """
+        Send an event to every sink, callers check debugEnabled/infoEnabled/warningEnabled first
+        :param level: DEBUG, INFO or WARNING
+        :param kind: one of the event kinds, e.g. SEND
+        :param iteration: iteration of the component that emits the event
+        :param seqnum: seqnum of the segment, -1 for acks
+        :param acknum: acknum of the segment, -1 for data
+        :param length: payload length of the segment
+        """
+        event = (iteration, level, self.tag, kind, seqnum, acknum, length)
+        for sink in self.sinks:
+            sink.write(event)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+# Shared tracer without sinks, used when tracing is off
+NULL_TRACER = Tracer()
+
+
+def formatEvent(event):
+    """Return a one line description of an event"""
+    iteration, level, tag, kind, seqnum, acknum, length = event
+    return "{0:>7} {1:<7} {2:<14} {3:<15} seq: {4}, ack: {5}, len: {6}".format(
+        iteration, LEVEL_NAMES.get(level, level), tag, EVENT_NAMES[kind], seqnum, acknum, length)
+
+
+class StdoutSink(object):
+    """Prints every event as a line of text"""
+
+    def __init__(self, stream=None):
+        self.stream = stream
+
+    def write(self, event):
+        print(formatEvent(event), file=self.stream or sys.stdout)
+
+    def close(self):
+        pass
+
+
+class RingBufferSink(object):
+    """Keeps the most recent events in memory"""
+
+    def __init__(self, capacity=100000):
+        self.events = deque(maxlen=capacity)
+
+    def write(self, event):
+        self.events.append(event)
+
+    def close(self):
+        pass
+
+
+class BinaryTraceSink(object):
+    """
+    Appends events to a compact binary file. Each tag is written once as a definition record, events refer to it by
+    number.
+    """
+
+    MAGIC = b'RDTT\x01'
+    TAG_RECORD = 0
+    EVENT_RECORD = 1
+    TAG = struct.Struct('!BHH')                 # record type, tag id, tag length
+    EVENT = struct.Struct('!BIBBHiiI')          # record type, iteration, level, kind, tag id, seqnum, acknum, length
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(self.MAGIC)
+        self.tagIds = {}
+
+    def write(self, event):
+        iteration, level, tag, kind, seqnum, acknum, length = event
+
+        tagId = self.tagIds.get(tag)
+        if tagId is None:
+            tagId = len(self.tagIds)
+            self.tagIds[tag] = tagId
+            encodedTag = tag.encode('utf-8')
+            self.file.write(self.TAG.pack(self.TAG_RECORD, tagId, len(encodedTag)) + encodedTag)
+
+        self.file.write(self.EVENT.pack(self.EVENT_RECORD, iteration, level, kind, tagId, seqnum, acknum, length))
+
+    def close(self):
+        self.file.close()
+
+    @staticmethod
+    def read(path):
+        """Return the events stored in a binary trace file"""
+        sink = BinaryTraceSink
+        with open(path, 'rb') as file:
+            data = file.read()
+        if not data.startswith(sink.MAGIC):
+            raise ValueError("{0} is not an RDT trace file".format(path))
+
+        events = []
+        tags = {}
+        offset = len(sink.MAGIC)
+        while offset < len(data):
+            if data[offset] == sink.TAG_RECORD:
+                _, tagId, length = sink.TAG.unpack_from(data, offset)
+                offset += sink.TAG.size
+                tags[tagId] = data[offset:offset + length].decode('utf-8')
+                offset += length
+            else:
+                _, iteration, level, kind, tagId, seqnum, acknum, length = sink.EVENT.unpack_from(data, offset)
+                offset += sink.EVENT.size
+                events.append((iteration, level, tags[tagId], kind, seqnum, acknum, length))
+        return events
+
+
+class TraceReplayer(object):
+    """Rebuilds the life of every segment from a list of events"""
+
+    def __init__(self, events):
+        self.events = list(events)
+
+    @staticmethod
+    def fromFile(path):
+        return TraceReplayer(BinaryTraceSink.read(path))
+
+    def getTimelines(self):
+        """
+        Group the events by connection and segment
+        :return: dictionary (connection, seqnum) -> list of (iteration, component, event name, isAck). Ack events are
+                 filed under the seqnum they acknowledge.
+        """
+        timelines = {}
+        for iteration, level, tag, kind, seqnum, acknum, length in self.events:
+            connection, _, component = tag.rpartition('/')
+            isAck = seqnum < 0 <= acknum
+            key = (connection, acknum if isAck else seqnum)
+            if key[1] < 0:
+                continue
+            timelines.setdefault(key, []).append((iteration, component, EVENT_NAMES[kind], isAck))
+        return timelines
+
+    def formatTimeline(self, connection, seqnum):
+        """Return the timeline of one segment as text"""
+        lines = []
+        for iteration, component, name, isAck in self.getTimelines().get((connection, seqnum), []):
+            lines.append("{0:>7} {1:<8} {2}{3}".format(iteration, component, name, ' (ack)' if isAck else ''))
+        return '\n'.join(lines)
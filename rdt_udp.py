@@ -0,0 +1,244 @@
+import argparse
+import multiprocessing
+import select
+import socket
+import struct
+import time
+
+from rdt_bench import createLayer, makePayload
+from segment import Segment, segmentPool
+from unreliable import UnreliableChannel
+
+
+# #################################################################################################################### #
+# UDPChannel                                                                                                           #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# A channel endpoint backed by a non-blocking UDP socket, with the send()/receive()/processData() contract of          #
+# UnreliableChannel. Each side of a connection has its own endpoint and uses it as both its send and receive channel:  #
+# send() queues segments for the peer, processData() writes them as datagrams in the Segment wire format and drains    #
+# every datagram that has arrived, and receive() returns the decoded segments.                                         #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Python has no recvmmsg(), so the socket is drained with recvfrom_into() on one preallocated buffer until it would    #
+# block or RECEIVE_BATCH datagrams have been read. An UnreliableChannel passed as impairment drops, delays, reorders   #
+# and corrupts outgoing segments before they reach the socket, with its usual counters.                                #
+# python rdt_udp.py --size 10000000 runs the loopback benchmark between two processes.                                 #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class UDPChannel(object):
+    RECEIVE_BATCH = 256             # Datagrams read per processData() at most
+    MAX_DATAGRAM = 65507            # Largest UDP payload over IPv4
+    SOCKET_BUFFER = 4 * 1024 * 1024
+
+    def __init__(self, localAddress, remoteAddress=None, impairment=None, pollTimeout=0.0):
+        """
+        :param localAddress: (host, port) to bind, port 0 picks a free one
+        :param remoteAddress: (host, port) of the peer, or None to answer whoever sent the last datagram
+        :param impairment: an UnreliableChannel applied to outgoing segments, None sends them unchanged
+        :param pollTimeout: seconds processData() waits for a datagram when none is ready, 0 never waits
+        """
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, option, self.SOCKET_BUFFER)
+            except OSError:
+                pass
+        self.socket.bind(localAddress)
+        self.socket.setblocking(False)
+
+        self.remoteAddress = remoteAddress
+        self.impairment = impairment
+        self.pollTimeout = pollTimeout
+        self.buffer = bytearray(self.MAX_DATAGRAM)
+
+        self.sendQueue = []
+        self.receiveQueue = []
+
+        # stats
+        self.countSentDatagrams = 0
+        self.countReceivedDatagrams = 0
+        self.countSentBytes = 0
+        self.countReceivedBytes = 0
+        self.countMalformedDatagrams = 0
+        self.countSendErrors = 0        # Datagrams the kernel refused, e.g. full send buffer, they count as lost
+        self.currentIteration = 0
+
+    def getLocalAddress(self):
+        return self.socket.getsockname()
+
+    def send(self, seg):
+        self.sendQueue.append(seg)
+
+    def receive(self):
+        received = self.receiveQueue
+        self.receiveQueue = []
+        return received
+
+    def processData(self):
+        self.currentIteration += 1
+        self.flush()
+        self.drain()
+
+    def flush(self):
+        """Write the queued segments to the socket, through the impairment channel if there is one"""
+        outgoing = self.sendQueue
+        self.sendQueue = []
+
+        if self.impairment is not None:
+            for seg in outgoing:
+                self.impairment.send(seg)
+            self.impairment.processData()
+            outgoing = self.impairment.receive()
+
+        # The segments only live on as datagrams, they are recycled once encoded
+        if self.remoteAddress is None:
+            segmentPool.releaseAll(outgoing)
+            return
+
+        for seg in outgoing:
+            datagram = seg.encode()
+            segmentPool.release(seg)
+            try:
+                self.socket.sendto(datagram, self.remoteAddress)
+            except (BlockingIOError, ConnectionRefusedError):
+                self.countSendErrors += 1
+                continue
+            self.countSentDatagrams += 1
+            self.countSentBytes += len(datagram)
+
+    def drain(self):
+        """Decode the datagrams that have arrived, waiting up to pollTimeout if there are none"""
+        if self.pollTimeout > 0:
+            select.select([self.socket], [], [], self.pollTimeout)
+
+        view = memoryview(self.buffer)
+        for _ in range(self.RECEIVE_BATCH):
+            try:
+                length, address = self.socket.recvfrom_into(self.buffer)
+            except (BlockingIOError, ConnectionRefusedError):
+                break
+
+            if self.remoteAddress is None:
+                self.remoteAddress = address
+
+            self.countReceivedDatagrams += 1
+            self.countReceivedBytes += length
+            try:
+                self.receiveQueue.append(Segment.decode(view[:length]))
+            except (ValueError, struct.error):
+                # Truncated or garbage datagrams are dropped like corrupt segments
+                self.countMalformedDatagrams += 1
+
+    def close(self):
+        self.socket.close()
+
+
+# #################################################################################################################### #
+# Loopback benchmark                                                                                                   #
+# #################################################################################################################### #
+
+
+def createImpairment(ratio):
+    """Return an UnreliableChannel with every impairment at ratio, or None for ratio 0"""
+    if ratio <= 0:
+        return None
+    channel = UnreliableChannel(True, True, True, True)
+    channel.RATIO_DROPPED_PACKETS = ratio
+    channel.RATIO_DELAYED_PACKETS = ratio
+    channel.RATIO_DATA_ERROR_PACKETS = ratio
+    channel.RATIO_OUT_OF_ORDER_PACKETS = ratio
+    return channel
+
+
+def runServer(address, size, dataLength, flowControlWinSize, pollTimeout, linger, results):
+    """Receive size bytes on address and put (bytes received, seconds from first to last byte) into results"""
+    channel = UDPChannel(address, pollTimeout=pollTimeout)
+    server = createLayer(dataLength, flowControlWinSize)
+    server.setTransferMode(server.SELECTIVE_REPEAT)
+    server.setSendChannel(channel)
+    server.setReceiveChannel(channel)
+    results.put(channel.getLocalAddress())
+
+    startTime = None
+    while not server.isComplete(size):
+        server.processData()
+        channel.processData()
+        if startTime is None and channel.countReceivedDatagrams:
+            startTime = time.perf_counter()
+    elapsed = time.perf_counter() - startTime
+
+    # Keep acking for a while in case the last acks were lost
+    endTime = time.perf_counter() + linger
+    while time.perf_counter() < endTime:
+        server.processData()
+        channel.processData()
+
+    results.put((server.getDataReceivedLength(), elapsed, server.getBytesReceived() == makePayload(size, 0)))
+    channel.close()
+
+
+def runBenchmark(size, dataLength, flowControlWinSize, impairmentRatio=0.0, pollTimeout=0.0005, linger=0.5):
+    """
+    Send size bytes from this process to a server process over loopback UDP
+    :return: dictionary with the throughput measured at both ends
+    """
+    results = multiprocessing.Queue()
+    serverProcess = multiprocessing.Process(target=runServer, args=(
+        ('127.0.0.1', 0), size, dataLength, flowControlWinSize, pollTimeout, linger, results))
+    serverProcess.start()
+    serverAddress = results.get()
+
+    channel = UDPChannel(('127.0.0.1', 0), serverAddress, createImpairment(impairmentRatio), pollTimeout)
+    client = createLayer(dataLength, flowControlWinSize)
+    client.setTransferMode(client.SELECTIVE_REPEAT)
+    client.setSendChannel(channel)
+    client.setReceiveChannel(channel)
+    client.setDataToSend(makePayload(size, 0))
+
+    startTime = time.perf_counter()
+    while not client.isSendComplete():
+        client.processData()
+        channel.processData()
+    clientElapsed = time.perf_counter() - startTime
+
+    received, serverElapsed, verified = results.get()
+    serverProcess.join()
+    channel.close()
+
+    return {
+        'size': size,
+        'dataLength': dataLength,
+        'flowControlWinSize': flowControlWinSize,
+        'impairmentRatio': impairmentRatio,
+        'verified': verified and received == size,
+        'iterations': client.currentIteration,
+        'datagramsSent': channel.countSentDatagrams,
+        'segmentTimeouts': client.countSegmentTimeouts,
+        'clientSeconds': clientElapsed,
+        'serverSeconds': serverElapsed,
+        'MBps': size / clientElapsed / 1e6,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure RDTLayer throughput between two processes over UDP")
+    parser.add_argument('--size', type=int, default=10 * 1000 * 1000, help="bytes to send")
+    parser.add_argument('--data-length', type=int, default=1024, help="payload bytes per segment")
+    parser.add_argument('--window', type=int, default=65536, help="receive window in bytes")
+    parser.add_argument('--impairment', type=float, default=0.0,
+                        help="drop, delay, corrupt and reorder ratio of the client's impairment shim")
+    args = parser.parse_args(argv)
+
+    result = runBenchmark(args.size, args.data_length, args.window, args.impairment)
+    print("{0} bytes in {1:.3f}s: {2:.2f} MB/s, {3} datagrams, {4} timeouts{5}".format(
+        result['size'], result['clientSeconds'], result['MBps'], result['datagramsSent'], result['segmentTimeouts'],
+        '' if result['verified'] else '  FAILED'))
+    return result
+
+
+if __name__ == '__main__':
+    main()
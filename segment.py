@@ -1,5 +1,7 @@
 import random
-from functools import reduce
+import struct
+
+import checksum
 
 
 # #################################################################################################################### #
@@ -10,37 +12,107 @@ from functools import reduce
 #                                                                                                                      #
 #                                                                                                                      #
 # Notes:                                                                                                               #
-# This file is not to be changed.                                                                                      #
-#                                                                                                                      #
+# The payload is bytes, str payloads are still accepted for compatibility. encode()/decode() convert a segment to and  #
+# from its binary wire format, a packed header followed by the raw payload, and the checksum covers those bytes.       #
+# The payload of an ack holds its SACK ranges, pairs of unsigned 32 bit byte offsets, and is empty without them.       #
+# Every ack advertises the receive window of the server in bytes, window is 0 in data segments.                        #
+# Data segments of a compressed stream carry the id of its codec in the flags, the server decompresses with it.        #
+# A parity segment (FEC) has the seqnum of the first data segment of its block, it is never acked.                     #
 #                                                                                                                      #
 # #################################################################################################################### #
 
 
 class Segment():
+    # Wire format header: seqnum, acknum, receive window, checksum, payload length, flags
+    HEADER = struct.Struct('!iiIIIB')
+    FLAG_TEXT = 0x01                # The payload is a str, it travels utf-8 encoded
+    FLAG_FIN = 0x02                 # Last segment of a stream, its seqnum is the length of the stream
+    FLAG_CUMULATIVE = 0x04          # Ack of every segment up to and including acknum, see rdt_ack.py
+    FLAG_CHECKSUM_ERROR = 0x08      # The server discarded a corrupt segment since its previous ack
+    FLAG_CODEC_MASK = 0x30          # Codec id of a compressed data stream, see rdt_compress.py, 0 is uncompressed
+    FLAG_CODEC_SHIFT = 4
+    FLAG_PARITY = 0x40              # XOR parity of a block of data segments, see rdt_fec.py
+    FLAG_RECOVERED = 0x80           # The server rebuilt a lost segment from parity since its previous ack
+    SACK_RANGE = struct.Struct('!II')
+    NO_ACK = -2                     # acknum of an ack that acknowledges nothing and only advertises the window
+    TEXT_ENCODING = 'utf-8'
+
+    # Checksum over the wire format, see checksum.py. The methods that compute or check it take the algorithm of the
+    # connection (RDTLayer.setChecksumAlgorithm()), this one is used when they are given none.
+    DEFAULT_CHECKSUM_ALGORITHM = checksum.getAlgorithm(checksum.DEFAULT_ALGORITHM)
+
+    # No per-instance __dict__, millions of segments are created in large runs. inPool is set while the segment sits in
+    # a SegmentPool.
+    __slots__ = ('seqnum', 'acknum', 'payload', 'checksum', 'startIteration', 'startDelayIteration', 'fin',
+                 'cumulative', 'window', 'checksumError', 'codec', 'parity', 'recovered', 'inPool')
 
     def __init__(self):
+        self.inPool = False
+        self.reset()
+
+    def reset(self):
+        """Clear every field, a recycled segment must not keep anything from its previous use"""
         self.seqnum = -1
         self.acknum = -1
         self.payload = ''
         self.checksum = 0
         self.startIteration = 0
         self.startDelayIteration = 0
+        self.fin = False
+        self.cumulative = False
+        self.window = 0
+        self.checksumError = False
+        self.codec = 0
+        self.parity = False
+        self.recovered = False
 
-    def setData(self,seq,data):
+    def setData(self,seq,data,fin=False,codec=0,algorithm=None):
         self.seqnum = seq
         self.acknum = -1
         self.payload = data
-        self.checksum = 0
-        str = self.to_string()
-        self.checksum = self.calc_checksum(str)
+        self.fin = fin
+        self.codec = codec
+        self.checksum = self.calc_checksum(self.encodeWithChecksum(0), algorithm)
+
+    def setParity(self,seq,data,algorithm=None):
+        """
+        :param seq: seqnum of the first data segment of the block
+        :param data: parity payload built by rdt_fec.FecEncoder
+        :param algorithm: checksum algorithm of the connection, DEFAULT_CHECKSUM_ALGORITHM when None
+        """
+        self.seqnum = seq
+        self.acknum = -1
+        self.payload = data
+        self.parity = True
+        self.checksum = self.calc_checksum(self.encodeWithChecksum(0), algorithm)
 
-    def setAck(self,ack):
+    def setAck(self,ack,cumulative=False,sackRanges=None,window=0,checksumError=False,recovered=False,algorithm=None):
+        """
+        :param ack: seqnum of the acknowledged segment
+        :param cumulative: the ack covers every segment up to and including ack
+        :param sackRanges: (start, end) byte ranges received past the in-order data, see getSackRanges()
+        :param window: receive window of the server in bytes, 0 when not advertised
+        :param checksumError: the server discarded a corrupt segment since its previous ack
+        :param recovered: the server rebuilt a lost segment from parity since its previous ack
+        :param algorithm: checksum algorithm of the connection, DEFAULT_CHECKSUM_ALGORITHM when None
+        """
         self.seqnum = -1
         self.acknum = ack
-        self.payload = ''
-        self.checksum = 0
-        str = self.to_string()
-        self.checksum = self.calc_checksum(str)
+        self.cumulative = cumulative
+        self.window = window
+        self.checksumError = checksumError
+        self.recovered = recovered
+        if sackRanges:
+            self.payload = b''.join(Segment.SACK_RANGE.pack(start, end) for start, end in sackRanges)
+        else:
+            self.payload = b''
+        self.checksum = self.calc_checksum(self.encodeWithChecksum(0), algorithm)
+
+    def getSackRanges(self):
+        """Return the (start, end) byte ranges listed by an ack, end is exclusive"""
+        if not self.payload:
+            return ()
+        return tuple(Segment.SACK_RANGE.iter_unpack(self.payload))
 
     def setStartIteration(self,iteration):
         self.startIteration = iteration
@@ -55,22 +127,150 @@ class Segment():
         return self.startDelayIteration
 
     def to_string(self):
+        payload = self.payload
+        if not isinstance(payload, str):
+            payload = bytes(payload).decode(Segment.TEXT_ENCODING, 'replace')
         return "seq: {0}, ack: {1}, data: {2}"\
-        .format(self.seqnum,self.acknum,self.payload)
+        .format(self.seqnum,self.acknum,payload)
 
-    def checkChecksum(self):
-        cs = self.calc_checksum(self.to_string())
+    def checkChecksum(self,algorithm=None):
+        cs = self.calc_checksum(self.encodeWithChecksum(0), algorithm)
         return cs == self.checksum
 
-    def calc_checksum(self,str):
-        return reduce(lambda x,y:x+y, map(ord, str))
+    def calc_checksum(self,data,algorithm=None):
+        # str input is the old string API, it is checksummed as its utf-8 bytes
+        if isinstance(data, str):
+            data = data.encode(Segment.TEXT_ENCODING)
+        if algorithm is None:
+            algorithm = Segment.DEFAULT_CHECKSUM_ALGORITHM
+        return algorithm.compute(data)
+
+    def getPayloadBytes(self):
+        if isinstance(self.payload, str):
+            return self.payload.encode(Segment.TEXT_ENCODING)
+        return bytes(self.payload)
+
+    def encode(self):
+        """Return the segment in its binary wire format: packed header followed by the raw payload"""
+        return self.encodeWithChecksum(self.checksum)
+
+    def encodeWithChecksum(self, checksum):
+        """Return the wire format with the given value in the checksum field, the checksum is computed over zero"""
+        payload = self.getPayloadBytes()
+        flags = Segment.FLAG_TEXT if isinstance(self.payload, str) else 0
+        if self.fin:
+            flags |= Segment.FLAG_FIN
+        if self.cumulative:
+            flags |= Segment.FLAG_CUMULATIVE
+        if self.checksumError:
+            flags |= Segment.FLAG_CHECKSUM_ERROR
+        if self.codec:
+            flags |= self.codec << Segment.FLAG_CODEC_SHIFT
+        if self.parity:
+            flags |= Segment.FLAG_PARITY
+        if self.recovered:
+            flags |= Segment.FLAG_RECOVERED
+        return Segment.HEADER.pack(self.seqnum, self.acknum, self.window, checksum, len(payload), flags) + payload
+
+    @staticmethod
+    def decode(data):
+        """
+        Build a segment from its binary wire format
+        :param data: bytes-like object as returned by encode(), it may be followed by other data
+        :return: the decoded Segment, its checksum is not verified
+        """
+        seqnum, acknum, window, checksum, length, flags = Segment.HEADER.unpack_from(data)
+        start = Segment.HEADER.size
+        if len(data) < start + length:
+            raise ValueError("Truncated segment: {0} of {1} payload bytes".format(len(data) - start, length))
+
+        payload = bytes(memoryview(data)[start:start + length])
+        if flags & Segment.FLAG_TEXT:
+            payload = payload.decode(Segment.TEXT_ENCODING)
+
+        segment = segmentPool.acquire()
+        segment.seqnum = seqnum
+        segment.acknum = acknum
+        segment.payload = payload
+        segment.checksum = checksum
+        segment.fin = bool(flags & Segment.FLAG_FIN)
+        segment.cumulative = bool(flags & Segment.FLAG_CUMULATIVE)
+        segment.window = window
+        segment.checksumError = bool(flags & Segment.FLAG_CHECKSUM_ERROR)
+        segment.codec = (flags & Segment.FLAG_CODEC_MASK) >> Segment.FLAG_CODEC_SHIFT
+        segment.parity = bool(flags & Segment.FLAG_PARITY)
+        segment.recovered = bool(flags & Segment.FLAG_RECOVERED)
+        return segment
 
     def printToConsole(self):
         print(self.to_string())
 
-    # Function to cause an error - Do not modify
-    def createChecksumError(self):
+    # Called by UnreliableChannel to corrupt a segment, keep the behavior so the channel's error rate stays the same
+    def createChecksumError(self, position=None):
+        """
+        Replace the first occurrence of a payload character with 'X'
+        :param position: index of the character to replace, a random one when None
+        """
         if not self.payload:
             return
-        char = random.choice(self.payload)
-        self.payload = self.payload.replace(char, 'X', 1)
\ No newline at end of file
+        if position is None:
+            position = random.randrange(len(self.payload))
+        if isinstance(self.payload, str):
+            char = self.payload[position]
+            self.payload = self.payload.replace(char, 'X', 1)
+        else:
+            char = self.payload[position:position + 1]
+            self.payload = self.payload.replace(char, b'X', 1)
+
+
+# #################################################################################################################### #
+# SegmentPool                                                                                                          #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Free list of Segment objects, so the layers and channels reuse segments instead of allocating one per data           #
+# segment and per ack.                                                                                                 #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# A segment is released exactly once, by whoever holds the last reference: the layer that processed it or the channel  #
+# that dropped it. Delayed segments are still owned by their channel. createChecksumError() replaces the payload of a  #
+# segment in place, so acquire() resets every field, and the payload bytes themselves are never shared with the        #
+# sender's copy (the client keeps its payload in PendingSegment).                                                      #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class SegmentPool(object):
+    MAX_FREE = 4096                 # Segments kept for reuse at most, the rest is left to the garbage collector
+
+    def __init__(self):
+        self.free = []
+        self.countCreated = 0
+        self.countReused = 0
+
+    def acquire(self):
+        """Return a segment with all fields reset"""
+        if self.free:
+            segment = self.free.pop()
+            segment.inPool = False
+            segment.reset()
+            self.countReused += 1
+            return segment
+        self.countCreated += 1
+        return Segment()
+
+    def release(self, segment):
+        """Give a segment back, nothing may use it afterwards"""
+        if segment.inPool:
+            raise ValueError("Segment released twice: seq {0}, ack {1}".format(segment.seqnum, segment.acknum))
+        if len(self.free) < self.MAX_FREE:
+            segment.inPool = True
+            self.free.append(segment)
+
+    def releaseAll(self, segments):
+        for segment in segments:
+            self.release(segment)
+
+
+# Shared by every layer and channel of the process
+segmentPool = SegmentPool()
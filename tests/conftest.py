@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The modules are flat in the repository root, next to rdt_main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,42 @@
+import pytest
+
+import checksum
+from segment import Segment
+
+
+@pytest.mark.parametrize('name, data, expected', [
+    ('sum', b'abc', 0x126),
+    ('internet', bytes([0x00, 0x01, 0xF2, 0x03, 0xF4, 0xF5, 0xF6, 0xF7]), 0x220D),
+    ('crc32', b'123456789', 0xCBF43926),
+    ('adler32', b'Wikipedia', 0x11E60398),
+])
+def test_known_values(name, data, expected):
+    assert checksum.getAlgorithm(name).compute(data) == expected
+
+
+@pytest.mark.parametrize('name', sorted(checksum.ALGORITHMS))
+def test_single_byte_change_is_detected(name):
+    algorithm = checksum.getAlgorithm(name)
+    data = b'We choose to go to the moon'
+    assert algorithm.compute(bytearray(data)) == algorithm.compute(data)
+    assert algorithm.compute(data.replace(b'm', b'X', 1)) != algorithm.compute(data)
+
+
+def test_only_the_sum_misses_swapped_bytes():
+    data, swapped = b'abcd', b'bacd'
+    assert checksum.getAlgorithm('sum').compute(data) == checksum.getAlgorithm('sum').compute(swapped)
+    for name in ('internet', 'crc32', 'adler32'):
+        assert checksum.getAlgorithm(name).compute(data) != checksum.getAlgorithm(name).compute(swapped)
+
+
+def test_unknown_algorithm():
+    with pytest.raises(ValueError):
+        checksum.getAlgorithm('md5')
+
+
+def test_segment_checksum_uses_the_connection_algorithm():
+    adler = checksum.getAlgorithm('adler32')
+    segment = Segment()
+    segment.setData(0, b'abcd', algorithm=adler)
+    assert segment.checkChecksum(adler)
+    assert not segment.checkChecksum()
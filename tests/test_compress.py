@@ -0,0 +1,65 @@
+import pytest
+
+from rdt_compress import CODECS, CompressedSource, DecompressingSink, getCodec, getCodecById
+from rdt_layer import RDTLayer
+from rdt_stream import BytesSource
+from unreliable import UnreliableChannel
+
+TEXT = 'We choose to go to the moon in this decade and do the other things, not because they are easy. ' * 40
+
+
+@pytest.mark.parametrize('name', sorted(CODECS))
+def test_round_trip_in_segment_sized_chunks(name):
+    codec = getCodec(name)
+    source = CompressedSource(BytesSource(TEXT.encode()), codec)
+    sink = DecompressingSink(codec)
+    while True:
+        chunk = source.read(4)
+        if not chunk:
+            break
+        sink.write(chunk)
+    assert sink.getText() == TEXT
+    assert source.countRead == len(TEXT.encode()) and source.countCompressed < source.countRead
+
+
+@pytest.mark.parametrize('name', sorted(CODECS))
+def test_codec_id_lookup(name):
+    assert getCodecById(getCodec(name).codecId) is getCodec(name)
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        getCodec('bz2')
+    with pytest.raises(ValueError):
+        getCodecById(0)
+
+
+def test_sink_passes_the_output_on():
+    codec = getCodec('zlib')
+    received = []
+    sink = DecompressingSink(codec, received.append)
+    sink.write(CompressedSource(BytesSource(b'abc' * 100), codec).read(1 << 16))
+    assert b''.join(received) == b'abc' * 100
+    assert sink.getBytes() == b'' and sink.countDecompressed == 300
+
+
+def test_compressed_transfer():
+    client, server = RDTLayer(), RDTLayer()
+    toServer = UnreliableChannel(False, False, False, False)
+    toClient = UnreliableChannel(False, False, False, False)
+    client.setSendChannel(toServer)
+    client.setReceiveChannel(toClient)
+    server.setSendChannel(toClient)
+    server.setReceiveChannel(toServer)
+    client.setCompression('zlib')
+    client.setDataToSend(TEXT)
+
+    for _ in range(1000):
+        if server.isComplete(len(TEXT)):
+            break
+        client.processData()
+        toServer.processData()
+        server.processData()
+        toClient.processData()
+    assert server.getDataReceived() == TEXT
+    assert toServer.countTotalDataPackets < len(TEXT) // client.dataLength
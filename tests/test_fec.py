@@ -0,0 +1,91 @@
+import random
+
+import pytest
+
+from rdt_fec import FecDecoder, FecEncoder
+from rdt_layer import RDTLayer
+from segment import Segment
+from unreliable import UnreliableChannel
+
+PAYLOADS = [b'abcd', b'efgh', b'ij', b'klmn']
+
+
+def encodeBlock(payloads, k=4):
+    """Return the seqnums of the payloads and the parity segments of one encoder run over them"""
+    encoder = FecEncoder(k=k)
+    seqnums = []
+    seqnum = 0
+    for payload in payloads:
+        seqnums.append(seqnum)
+        encoder.add(seqnum, payload, window=64, iteration=1)
+        seqnum += len(payload)
+    return seqnums, encoder.poll(1, endOfData=True)
+
+
+@pytest.mark.parametrize('lost', range(len(PAYLOADS)))
+def test_single_loss_is_rebuilt_from_parity(lost):
+    seqnums, parity = encodeBlock(PAYLOADS)
+    assert len(parity) == 1
+
+    decoder = FecDecoder(0)
+    for index, payload in enumerate(PAYLOADS):
+        if index != lost:
+            assert decoder.addData(seqnums[index], payload) == ()
+    assert decoder.addParity(*parity[0]) == [(seqnums[lost], PAYLOADS[lost])]
+    assert decoder.countRecovered == 1
+
+
+def test_parity_before_the_data_waits_for_the_block():
+    seqnums, parity = encodeBlock(PAYLOADS)
+    decoder = FecDecoder(0)
+    decoder.addData(seqnums[0], PAYLOADS[0])
+    assert decoder.addParity(*parity[0]) == []
+    decoder.addData(seqnums[1], PAYLOADS[1])
+    assert decoder.addData(seqnums[3], PAYLOADS[3]) == [(seqnums[2], PAYLOADS[2])]
+
+
+def test_two_losses_are_not_rebuilt():
+    seqnums, parity = encodeBlock(PAYLOADS)
+    decoder = FecDecoder(0)
+    decoder.addData(seqnums[0], PAYLOADS[0])
+    decoder.addData(seqnums[1], PAYLOADS[1])
+    assert decoder.addParity(*parity[0]) == []
+    assert decoder.countRecovered == 0
+
+
+def test_blocks_of_k_segments():
+    _, parity = encodeBlock(PAYLOADS * 2, k=3)
+    assert len(parity) == 3
+
+
+def test_server_rebuilds_a_lost_segment():
+    server = RDTLayer()
+    server.setTransferMode(RDTLayer.SELECTIVE_REPEAT)
+    toServer = UnreliableChannel(False, False, False, False)
+    toClient = UnreliableChannel(False, False, False, False)
+    server.setReceiveChannel(toServer)
+    server.setSendChannel(toClient)
+
+    # The server starts decoding with the first parity segment, here it overtook the data of its block
+    seqnums, parity = encodeBlock(PAYLOADS[:3], k=3)
+    segment = Segment()
+    segment.setParity(*parity[0])
+    toServer.receiveQueue.append(segment)
+    for seqnum, payload in ((seqnums[0], PAYLOADS[0]), (seqnums[2], PAYLOADS[2])):
+        segment = Segment()
+        segment.setData(seqnum, payload)
+        toServer.receiveQueue.append(segment)
+    server.processData()
+
+    assert server.receiveBuffer.getBytes() == b''.join(PAYLOADS[:3])
+    assert toClient.sendQueue[-1].recovered
+
+
+def test_adaptive_block_size_shrinks_with_loss():
+    encoder = FecEncoder(k=8, adaptive=True)
+    assert encoder.chooseK(0.0) == encoder.maxK
+    assert encoder.chooseK(0.2) < encoder.chooseK(0.05)
+    random.seed(1)
+    for _ in range(200):
+        encoder.onAcked(random.random() < 0.3)
+    assert encoder.chooseK(encoder.lossEstimate) == encoder.minK
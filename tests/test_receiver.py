@@ -0,0 +1,130 @@
+import random
+
+from rdt_layer import RDTLayer
+from rdt_receiver import ReceiveBuffer
+from segment import Segment
+from unreliable import UnreliableChannel
+
+
+def test_buffer_reassembles_out_of_order_writes():
+    receiveBuffer = ReceiveBuffer(capacity=4)
+    receiveBuffer.write(4, b'efgh')
+    receiveBuffer.write(8, 'ijkl')
+    assert receiveBuffer.getBytes() == b''
+    receiveBuffer.write(0, b'abcd')
+    receiveBuffer.advance(12)
+    assert receiveBuffer.getText() == 'abcdefghijkl'
+    assert receiveBuffer.isComplete(12) and not receiveBuffer.isComplete(13)
+
+
+def test_buffer_flush_keeps_the_out_of_order_bytes():
+    received = []
+    receiveBuffer = ReceiveBuffer()
+    receiveBuffer.sink = received.append
+    receiveBuffer.write(0, b'abcd')
+    receiveBuffer.write(8, b'ijkl')
+    receiveBuffer.advance(4)
+    receiveBuffer.flush()
+    receiveBuffer.write(4, b'efgh')
+    receiveBuffer.advance(8)
+    receiveBuffer.flush()
+    assert received == [b'abcd', b'efghijkl']
+
+
+def createServer(window=RDTLayer.FLOW_CONTROL_WIN_SIZE):
+    """Return a selective repeat server and its channels from and to the client, segments are handed over directly"""
+    server = RDTLayer()
+    server.setTransferMode(RDTLayer.SELECTIVE_REPEAT)
+    server.setFlowControlWinSize(window)
+    toServer = UnreliableChannel(False, False, False, False)
+    toClient = UnreliableChannel(False, False, False, False)
+    server.setReceiveChannel(toServer)
+    server.setSendChannel(toClient)
+    return server, toServer, toClient
+
+
+def deliver(server, toServer, toClient, *segments):
+    """Run one server iteration on (seqnum, payload) data segments and return the acks it sent"""
+    for seqnum, payload in segments:
+        segment = Segment()
+        segment.setData(seqnum, payload)
+        toServer.receiveQueue.append(segment)
+    server.processData()
+    acks = list(toClient.sendQueue)
+    toClient.sendQueue.clear()
+    return acks
+
+
+def test_server_holds_segments_behind_a_gap():
+    server, toServer, toClient = createServer()
+    ack, = deliver(server, toServer, toClient, (4, 'efgh'))
+    assert (ack.acknum, ack.cumulative, ack.getSackRanges()) == (4, False, ((4, 8),))
+    ack, = deliver(server, toServer, toClient, (8, 'ijkl'))
+    assert ack.getSackRanges() == ((4, 12),)
+    assert ack.window == RDTLayer.FLOW_CONTROL_WIN_SIZE - 8
+    assert server.getDataReceived() == '' and server.heldBytes == 8
+
+    ack, = deliver(server, toServer, toClient, (0, 'abcd'))
+    assert (ack.acknum, ack.cumulative, ack.getSackRanges()) == (8, True, ())
+    assert ack.window == RDTLayer.FLOW_CONTROL_WIN_SIZE
+    assert server.getDataReceived() == 'abcdefghijkl' and server.heldBytes == 0
+
+
+def test_duplicate_is_acked_again_and_stored_once():
+    server, toServer, toClient = createServer()
+    deliver(server, toServer, toClient, (0, 'abcd'), (8, 'ijkl'))
+    ack, = deliver(server, toServer, toClient, (8, 'ijkl'))
+    assert (ack.acknum, ack.cumulative, ack.getSackRanges()) == (0, True, ((8, 12),))
+    assert server.heldBytes == 4
+    deliver(server, toServer, toClient, (4, 'efgh'))
+    assert server.getDataReceived() == 'abcdefghijkl'
+
+
+def test_segment_past_the_window_gets_a_window_update():
+    server, toServer, toClient = createServer(window=3)
+    ack, = deliver(server, toServer, toClient, (4, 'efgh'))
+    assert ack.acknum == Segment.NO_ACK and ack.window == 3
+    assert server.heldBytes == 0
+
+    # The segment at the in-order point is delivered right away, even if it is larger than the window
+    ack, = deliver(server, toServer, toClient, (0, 'abcd'))
+    assert (ack.acknum, ack.cumulative) == (0, True)
+    assert server.getDataReceived() == 'abcd'
+
+
+def runTransfer(data, seed, window=RDTLayer.FLOW_CONTROL_WIN_SIZE, maxIterations=20000):
+    """Run a selective repeat transfer over lossy channels, return the server and the number of iterations"""
+    random.seed(seed)
+    client, server = RDTLayer(), RDTLayer()
+    toServer = UnreliableChannel(True, True, True, True)
+    toClient = UnreliableChannel(True, True, True, True)
+    client.setSendChannel(toServer)
+    client.setReceiveChannel(toClient)
+    server.setSendChannel(toClient)
+    server.setReceiveChannel(toServer)
+    for layer in (client, server):
+        layer.setTransferMode(RDTLayer.SELECTIVE_REPEAT)
+    server.setFlowControlWinSize(window)
+    client.setDataToSend(data)
+
+    iteration = 0
+    while not server.isComplete(len(data)) and iteration < maxIterations:
+        iteration += 1
+        client.processData()
+        toServer.processData()
+        server.processData()
+        toClient.processData()
+    return server, iteration
+
+
+def test_transfer_over_a_lossy_channel():
+    data = 'We choose to go to the moon in this decade and do the other things. ' * 10
+    server, iteration = runTransfer(data, seed=1)
+    assert server.getDataReceived() == data
+    assert server.heldBytes == 0
+
+
+def test_transfer_with_a_window_smaller_than_the_data_length():
+    data = 'Not because they are easy, but because they are hard. ' * 4
+    server, iteration = runTransfer(data, seed=2, window=3)
+    assert server.getDataReceived() == data
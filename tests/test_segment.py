@@ -0,0 +1,74 @@
+import pytest
+
+from segment import Segment
+
+
+def roundTrip(segment):
+    return Segment.decode(segment.encode())
+
+
+def test_data_segment_round_trip():
+    segment = Segment()
+    segment.setData(12, b'abcd', fin=True, codec=1)
+    decoded = roundTrip(segment)
+    assert (decoded.seqnum, decoded.acknum, decoded.payload) == (12, -1, b'abcd')
+    assert decoded.fin and decoded.codec == 1
+    assert not (decoded.cumulative or decoded.checksumError or decoded.parity or decoded.recovered)
+    assert decoded.checkChecksum()
+
+
+def test_text_payload_stays_text():
+    segment = Segment()
+    segment.setData(0, 'héllo')
+    decoded = roundTrip(segment)
+    assert decoded.payload == 'héllo'
+    assert decoded.checkChecksum()
+
+
+def test_ack_round_trip_keeps_flags_and_sack_ranges():
+    segment = Segment()
+    segment.setAck(7, cumulative=True, sackRanges=[(12, 16), (20, 24)], window=15, checksumError=True,
+                   recovered=True)
+    decoded = roundTrip(segment)
+    assert (decoded.seqnum, decoded.acknum, decoded.window) == (-1, 7, 15)
+    assert decoded.cumulative and decoded.checksumError and decoded.recovered
+    assert not (decoded.fin or decoded.parity)
+    assert decoded.getSackRanges() == ((12, 16), (20, 24))
+    assert decoded.checkChecksum()
+
+
+def test_window_update_keeps_no_ack():
+    segment = Segment()
+    segment.setAck(Segment.NO_ACK, window=3)
+    decoded = roundTrip(segment)
+    assert decoded.acknum == Segment.NO_ACK and decoded.window == 3
+    assert decoded.getSackRanges() == ()
+
+
+def test_parity_flag():
+    segment = Segment()
+    segment.setParity(4, b'\x01\x02\x03')
+    decoded = roundTrip(segment)
+    assert decoded.parity and decoded.seqnum == 4 and decoded.payload == b'\x01\x02\x03'
+
+
+def test_every_codec_id_fits_the_flags():
+    for codec in range(Segment.FLAG_CODEC_MASK >> Segment.FLAG_CODEC_SHIFT):
+        segment = Segment()
+        segment.setData(0, b'x', codec=codec)
+        assert roundTrip(segment).codec == codec
+
+
+def test_truncated_segment_is_rejected():
+    segment = Segment()
+    segment.setData(0, b'abcd')
+    with pytest.raises(ValueError):
+        Segment.decode(segment.encode()[:-1])
+
+
+def test_corrupt_payload_fails_the_checksum():
+    segment = Segment()
+    segment.setData(0, b'abcd')
+    segment.createChecksumError(0)
+    assert segment.payload == b'Xbcd'
+    assert not segment.checkChecksum()
@@ -0,0 +1,89 @@
+import pytest
+
+from rdt_segmenter import PendingSegment
+from rdt_timer import RetransmissionTimer, RTOEstimator
+
+
+def test_first_sample_sets_the_estimates():
+    estimator = RTOEstimator(3)
+    assert estimator.getTimeout() == 3
+    estimator.addSample(2)
+    assert (estimator.srtt, estimator.rttvar) == (2, 1)
+    assert estimator.getTimeout() == 2 + RTOEstimator.K * 1
+
+
+def test_estimate_follows_the_samples():
+    estimator = RTOEstimator(3)
+    estimator.addSample(2)
+    estimator.addSample(6)
+    assert estimator.rttvar == pytest.approx(0.75 * 1 + 0.25 * 4)
+    assert estimator.srtt == pytest.approx(0.875 * 2 + 0.125 * 6)
+    assert estimator.rto == pytest.approx(estimator.srtt + RTOEstimator.K * estimator.rttvar)
+
+
+def test_steady_link_converges_to_the_round_trip():
+    estimator = RTOEstimator(3, granularity=0)
+    for _ in range(50):
+        estimator.addSample(1)
+    assert estimator.getTimeout() == 1
+
+    # The default granularity keeps one iteration of margin
+    estimator = RTOEstimator(3)
+    for _ in range(50):
+        estimator.addSample(1)
+    assert estimator.getTimeout() == 2
+
+
+def test_backoff_doubles_once_per_loss_episode():
+    estimator = RTOEstimator(2, maxRTO=16)
+    assert estimator.backoff(sendIteration=0, iteration=2)
+    assert estimator.getTimeout() == 4
+    # Segments armed before the backoff expire as part of the same episode
+    assert not estimator.backoff(sendIteration=1, iteration=3)
+    assert estimator.getTimeout() == 4
+    for iteration in range(10, 60, 10):
+        estimator.backoff(iteration, iteration)
+    assert estimator.getTimeout() == 16
+    assert estimator.countBackoffs == 6
+
+
+def test_max_backoff_bounds_the_timeout_after_the_first_sample():
+    estimator = RTOEstimator(3, granularity=0, maxBackoff=1)
+    # Without a sample only the backoff can find a timeout above the round trip
+    estimator.backoff(0, 3)
+    assert estimator.getTimeout() == 6
+
+    estimator.addSample(2)
+    estimator.addSample(2)
+    timeout = estimator.getTimeout()
+    assert estimator.backoff(10, 12)
+    assert estimator.getTimeout() == timeout
+
+
+def test_ack_ends_the_backoff():
+    estimator = RTOEstimator(3)
+    estimator.onAck()
+    assert estimator.getTimeout() == 3
+    estimator.addSample(1)
+    timeout = estimator.getTimeout()
+    estimator.backoff(5, 6)
+    assert estimator.getTimeout() == 2 * timeout
+    estimator.onAck()
+    assert estimator.getTimeout() == timeout
+
+
+def test_timer_returns_expired_segments_in_send_order():
+    estimator = RTOEstimator(2)
+    timer = RetransmissionTimer(estimator)
+    first, second, third = PendingSegment(0, b'a'), PendingSegment(1, b'b'), PendingSegment(2, b'c')
+    timer.start(first, 1)
+    timer.start(second, 1)
+    timer.start(third, 2)
+    assert timer.getNextExpiry() == 3
+    assert timer.popExpired(2) == []
+
+    second.acked = True
+    assert timer.popExpired(3) == [first]
+    timer.start(first, 3)
+    assert timer.popExpired(4) == [third]
+    assert timer.getNextExpiry() == 5
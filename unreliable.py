@@ -1,22 +1,72 @@
+import heapq
+import itertools
 import random
 
+import rdt_trace as trace
+from segment import segmentPool
+from rdt_metrics import PhaseTimer, addChannelMetrics
+
 
 # #################################################################################################################### #
 # UnreliableChannel                                                                                                    #
 #                                                                                                                      #
 # Description:                                                                                                         #
-# This class is meant to be more of a blackbox but you are allowed to see the implementation. You are not allowed to   #
-# change anything in this file. There is also no need to base your algorithms on this particular implementation.       #
+# Simulates the network between the client and the server: segments can be dropped, delayed, corrupted or delivered    #
+# out of order, each impairment switched on by its constructor flag. There is no need to base your algorithms on this  #
+# particular implementation.                                                                                           #
 #                                                                                                                      #
 #                                                                                                                      #
 # Notes:                                                                                                               #
-# This file is not to be changed.                                                                                      #
-#                                                                                                                      #
+# The impairment rules and ratios are those of the original channel, the layer is tested against them. Delays are      #
+# drawn from a delay distribution (setDelayDistribution()), segments are recycled through segmentPool, and events and  #
+# statistics go to the tracer and metrics registry set by main. BatchedUnreliableChannel draws the impairments of a    #
+# whole send queue at once with NumPy. AsyncChannel (rdt_async.py) makes the same decisions on an event loop, it only  #
+# overrides how a segment is forwarded or delayed, see forwardPacket() and delayPacket().                              #
 #                                                                                                                      #
 # #################################################################################################################### #
 
 
+# Delay distributions: sample() returns how many iterations a delayed segment is held back, at least 1. They draw from
+# the random module so seeded runs stay reproducible.
+class ConstantDelay(object):
+    def __init__(self, iterations):
+        self.iterations = iterations
+
+    def sample(self):
+        return self.iterations
+
+
+class UniformDelay(object):
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+
+    def sample(self):
+        return random.randint(self.low, self.high)
+
+
+class ExponentialDelay(object):
+    def __init__(self, mean, minimum=1):
+        self.mean = mean
+        self.minimum = minimum
+
+    def sample(self):
+        return max(self.minimum, int(round(random.expovariate(1.0 / self.mean))))
+
+
+class EmpiricalDelay(object):
+    """Delays drawn from a list of (delay, weight) pairs, e.g. measured on a real link"""
+
+    def __init__(self, delays):
+        self.delays = [delay for delay, _ in delays]
+        self.cumulativeWeights = list(itertools.accumulate(weight for _, weight in delays))
+
+    def sample(self):
+        return random.choices(self.delays, cum_weights=self.cumulativeWeights)[0]
+
+
 class UnreliableChannel():
+    # Defaults for every channel, a channel can be given its own values by setting them on the instance
     RATIO_DROPPED_PACKETS = 0.1
     RATIO_DELAYED_PACKETS = 0.1
     RATIO_DATA_ERROR_PACKETS = 0.1
@@ -26,11 +76,15 @@ class UnreliableChannel():
     def __init__(self, canDeliverOutOfOrder_, canDropPackets_, canDelayPackets_, canHaveChecksumErrors_):
         self.sendQueue = []
         self.receiveQueue = []
+        # Heap of (release iteration, arrival order, segment), so releasing a segment does not scan the others
         self.delayedPackets = []
+        self.delayOrder = itertools.count()
+        self.delayDistribution = None           # Held back for ITERATIONS_TO_DELAY_PACKETS when None
         self.canDeliverOutOfOrder = canDeliverOutOfOrder_
         self.canDropPackets = canDropPackets_
         self.canDelayPackets = canDelayPackets_
         self.canHaveChecksumErrors = canHaveChecksumErrors_
+        self.rng = random                       # Source of the impairment decisions
         # stats
         self.countTotalDataPackets = 0
         self.countSentPackets = 0
@@ -40,6 +94,22 @@ class UnreliableChannel():
         self.countOutOfOrderPackets = 0
         self.countAckPackets = 0
         self.currentIteration = 0
+        self.tracer = trace.NULL_TRACER
+        self.phaseTimer = None
+
+    def setDelayDistribution(self, distribution):
+        """
+        Hold each delayed segment back for its own number of iterations
+        :param distribution: object whose sample() returns a delay in iterations, e.g. UniformDelay(2, 8)
+        """
+        self.delayDistribution = distribution
+
+    def setTracer(self, tracer):
+        self.tracer = tracer
+
+    def setMetrics(self, registry, labels=None):
+        addChannelMetrics(registry, self, labels)
+        self.phaseTimer = PhaseTimer(registry, labels)
 
     def send(self,seg):
         self.sendQueue.append(seg)
@@ -57,64 +127,181 @@ class UnreliableChannel():
         if len(self.sendQueue) == 0:
             return
 
+        timer = self.phaseTimer
+        if timer is not None:
+            timer.start()
+
+        self.reorderSendQueue()
+        if timer is not None:
+            timer.lap('reorder')
+
+        self.releaseDelayedPackets()
+        if timer is not None:
+            timer.lap('release')
+
+        self.impairSendQueue()
+        self.sendQueue.clear()
+        if timer is not None:
+            timer.lap('impair')
+        #print("UnreliableChannel manage - len receiveQueue: {0}".format(len(self.receiveQueue)))
+
+    def reorderSendQueue(self):
         if self.canDeliverOutOfOrder:
-            val = random.random()
-            if val <= UnreliableChannel.RATIO_OUT_OF_ORDER_PACKETS:
-                self.countOutOfOrderPackets += 1
-                self.sendQueue.reverse()
-
-        # add in delayed packets
-        noLongerDelayed = []
-        for seg in self.delayedPackets:
-            numIterDelayed = self.currentIteration - seg.getStartDelayIteration()
-            if (numIterDelayed) >= UnreliableChannel.ITERATIONS_TO_DELAY_PACKETS:
-                noLongerDelayed.append(seg)
-
-        for seg in noLongerDelayed:
+            val = self.rng.random()
+            if val <= self.RATIO_OUT_OF_ORDER_PACKETS:
+                self.reverseSendQueue()
+
+    def reverseSendQueue(self):
+        self.countOutOfOrderPackets += 1
+        self.sendQueue.reverse()
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.REORDER, self.currentIteration, -1, -1, len(self.sendQueue))
+
+    def releaseDelayedPackets(self):
+        # add in delayed packets, segments with the same release iteration leave in the order they arrived
+        delayedPackets = self.delayedPackets
+        while delayedPackets and delayedPackets[0][0] <= self.currentIteration:
+            seg = heapq.heappop(delayedPackets)[2]
             self.countSentPackets += 1
-            self.delayedPackets.remove(seg)
             self.receiveQueue.append(seg)
+            if self.tracer.debugEnabled:
+                self.tracer.emit(trace.DEBUG, trace.RELEASE, self.currentIteration, seg.seqnum, seg.acknum,
+                                 len(seg.payload))
 
+    def impairSendQueue(self):
         for seg in self.sendQueue:
             #self.receiveQueue.append(seg)
 
             addToReceiveQueue = False
             if self.canDelayPackets:
-                val = random.random()
-                if val <= UnreliableChannel.RATIO_DELAYED_PACKETS:
-                    self.countDelayedPackets += 1
-                    seg.setStartDelayIteration(self.currentIteration)
-                    self.delayedPackets.append(seg)
+                val = self.rng.random()
+                if val <= self.RATIO_DELAYED_PACKETS:
+                    self.delayPacket(seg)
                     continue
 
             if self.canDropPackets:
-                val = random.random()
-                if val <= UnreliableChannel.RATIO_DROPPED_PACKETS:
-                    self.countDroppedPackets += 1
+                val = self.rng.random()
+                if val <= self.RATIO_DROPPED_PACKETS:
+                    self.dropPacket(seg)
                 else:
                     addToReceiveQueue = True
             else:
                 addToReceiveQueue = True
 
             if addToReceiveQueue:
-                self.receiveQueue.append(seg)
-                self.countSentPackets += 1
+                self.forwardPacket(seg)
 
             if seg.acknum == -1:
                 self.countTotalDataPackets += 1
 
                 # only data packets can have checksum errors...
                 if self.canHaveChecksumErrors:
-                    val = random.random()
-                    if val <= UnreliableChannel.RATIO_DATA_ERROR_PACKETS:
-                        seg.createChecksumError()
-                        self.countChecksumErrorPackets += 1
+                    val = self.rng.random()
+                    if val <= self.RATIO_DATA_ERROR_PACKETS:
+                        self.corruptPacket(seg)
 
             else:
                 # count ack packets...
                 self.countAckPackets += 1
 
+            # A dropped segment is referenced by nobody else any more
+            if not addToReceiveQueue:
+                segmentPool.release(seg)
+
             #print("UnreliableChannel len receiveQueue: {0}".format(len(self.receiveQueue)))
 
-        self.sendQueue.clear()
-        #print("UnreliableChannel manage - len receiveQueue: {0}".format(len(self.receiveQueue)))
+    def forwardPacket(self, seg):
+        self.receiveQueue.append(seg)
+        self.countSentPackets += 1
+
+    def sampleDelay(self):
+        """Return how many iterations a delayed segment is held back"""
+        if self.delayDistribution is None:
+            return self.ITERATIONS_TO_DELAY_PACKETS
+        return max(1, self.delayDistribution.sample())
+
+    def delayPacket(self, seg):
+        self.countDelayedPackets += 1
+        seg.setStartDelayIteration(self.currentIteration)
+        heapq.heappush(self.delayedPackets, (self.currentIteration + self.sampleDelay(), next(self.delayOrder), seg))
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.DELAY, self.currentIteration, seg.seqnum, seg.acknum, len(seg.payload))
+
+    def dropPacket(self, seg):
+        self.countDroppedPackets += 1
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.DROP, self.currentIteration, seg.seqnum, seg.acknum, len(seg.payload))
+
+    def corruptPacket(self, seg, position=None):
+        seg.createChecksumError(position)
+        self.countChecksumErrorPackets += 1
+        if self.tracer.debugEnabled:
+            self.tracer.emit(trace.DEBUG, trace.CORRUPT, self.currentIteration, seg.seqnum, -1, len(seg.payload))
+
+
+# #################################################################################################################### #
+# BatchedUnreliableChannel                                                                                             #
+#                                                                                                                      #
+# Description:                                                                                                         #
+# Same impairments and statistics as UnreliableChannel, but all of an iteration's random decisions are drawn in one    #
+# call from a seeded NumPy Generator instead of up to three random.random() calls per segment. The same seed gives     #
+# the same run, independently of the random module.                                                                    #
+#                                                                                                                      #
+#                                                                                                                      #
+# Notes:                                                                                                               #
+# Needs NumPy, it is only imported when a batched channel is created. A delay distribution set with                    #
+# setDelayDistribution() still draws from the random module.                                                           #
+#                                                                                                                      #
+# #################################################################################################################### #
+
+
+class BatchedUnreliableChannel(UnreliableChannel):
+
+    def __init__(self, canDeliverOutOfOrder_, canDropPackets_, canDelayPackets_, canHaveChecksumErrors_, seed=None):
+        try:
+            import numpy
+        except ImportError:
+            raise ImportError("BatchedUnreliableChannel needs NumPy, install it with: pip install numpy")
+
+        super().__init__(canDeliverOutOfOrder_, canDropPackets_, canDelayPackets_, canHaveChecksumErrors_)
+        self.rng = numpy.random.default_rng(seed)
+
+    def reorderSendQueue(self):
+        if self.canDeliverOutOfOrder and self.rng.random() <= self.RATIO_OUT_OF_ORDER_PACKETS:
+            self.reverseSendQueue()
+
+    def impairSendQueue(self):
+        count = len(self.sendQueue)
+        noImpairment = [False] * count
+
+        # One row per segment: delay, drop and checksum error decisions, and where a checksum error hits the payload.
+        # Every row is drawn even if a segment is delayed or is an ack, so each decision keeps its probability.
+        draws = self.rng.random((count, 4))
+        delayed = (draws[:, 0] <= self.RATIO_DELAYED_PACKETS).tolist() if self.canDelayPackets else noImpairment
+        dropped = (draws[:, 1] <= self.RATIO_DROPPED_PACKETS).tolist() if self.canDropPackets else noImpairment
+        corrupted = (draws[:, 2] <= self.RATIO_DATA_ERROR_PACKETS).tolist() if self.canHaveChecksumErrors \
+            else noImpairment
+        positions = draws[:, 3].tolist()
+
+        for seg, isDelayed, isDropped, isCorrupted, position in zip(self.sendQueue, delayed, dropped, corrupted,
+                                                                     positions):
+            if isDelayed:
+                self.delayPacket(seg)
+                continue
+
+            if isDropped:
+                self.dropPacket(seg)
+            else:
+                self.forwardPacket(seg)
+
+            if seg.acknum == -1:
+                self.countTotalDataPackets += 1
+
+                # only data packets can have checksum errors...
+                if isCorrupted:
+                    self.corruptPacket(seg, int(position * len(seg.payload)))
+            else:
+                self.countAckPackets += 1
+
+            if isDropped:
+                segmentPool.release(seg)